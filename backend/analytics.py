@@ -0,0 +1,189 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from backend.db import run_write
+
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("FLOSENDO_ANALYTICS_RECONCILE_SECONDS", str(6 * 3600)))
+DAILY_WINDOW_DAYS = 30
+TOP_STUDENTS = 10
+
+
+def reconcile_analytics(conn) -> dict:
+    """
+    Writer job: rebuild every aggregate from the base tables. The triggers
+    keep them current between runs; this repairs drift (e.g. rows changed
+    with triggers disabled) and backfills history on first start.
+    Returns how many counters had drifted.
+    """
+    before = dict(conn.execute("SELECT name, value FROM analytics_counters").fetchall())
+
+    conn.execute("DELETE FROM analytics_counters")
+    conn.execute("""
+        INSERT INTO analytics_counters (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'submissions', COUNT(*) FROM submissions
+        UNION ALL SELECT 'reviewed', COUNT(*) FROM teacher_reviews
+        UNION ALL SELECT 'flagged', COALESCE(SUM(flagged), 0) FROM teacher_reviews
+    """)
+
+    conn.execute("DELETE FROM analytics_rubric_counts")
+    conn.execute("""
+        INSERT INTO analytics_rubric_counts (rubric_id, submissions)
+        SELECT rubric_id, COUNT(*) FROM submissions GROUP BY rubric_id
+    """)
+
+    conn.execute("DELETE FROM analytics_daily")
+    conn.execute("""
+        INSERT INTO analytics_daily (day, submissions)
+        SELECT substr(created_at, 1, 10), COUNT(*) FROM submissions GROUP BY 1
+    """)
+
+    conn.execute("DELETE FROM analytics_student_activity")
+    conn.execute("""
+        INSERT INTO analytics_student_activity (user_email, submissions, last_submission_at)
+        SELECT user_email, COUNT(*), MAX(created_at) FROM submissions GROUP BY user_email
+    """)
+
+    after = dict(conn.execute("SELECT name, value FROM analytics_counters").fetchall())
+    drifted = sum(1 for k, v in after.items() if before.get(k) != v)
+    conn.execute("""
+        INSERT INTO scheduled_runs (name, last_run_at) VALUES ('analytics_reconcile', ?)
+        ON CONFLICT(name) DO UPDATE SET last_run_at = excluded.last_run_at
+    """, (time.time(),))
+    return {"counters": after, "drifted": drifted}
+
+
+def reconcile_if_due(conn, interval: float) -> dict | None:
+    """
+    Writer job: reconcile unless any process did within interval seconds.
+    The check and the rebuild share one write transaction, so when several
+    workers come due together only the first does the scan.
+    """
+    row = conn.execute("SELECT last_run_at FROM scheduled_runs WHERE name = 'analytics_reconcile'").fetchone()
+    if row is not None and time.time() - row[0] < interval:
+        return None
+    return reconcile_analytics(conn)
+
+
+def _counters(conn) -> dict:
+    return dict(conn.execute("SELECT name, value FROM analytics_counters").fetchall())
+
+
+def _flagged_rate(counters: dict) -> float:
+    reviewed = counters.get("reviewed", 0)
+    return round(counters.get("flagged", 0) / reviewed, 3) if reviewed else 0.0
+
+
+def read_summary(conn) -> dict:
+    """Dashboard headline numbers, read from the aggregates only."""
+    counters = _counters(conn)
+    top = conn.execute("""
+        SELECT r.title, a.submissions AS c
+        FROM analytics_rubric_counts a
+        JOIN rubrics r ON r.id = a.rubric_id
+        WHERE a.submissions > 0
+        ORDER BY a.submissions DESC
+        LIMIT 1
+    """).fetchone()
+    return {
+        "users_count": counters.get("users", 0),
+        "submissions_count": counters.get("submissions", 0),
+        "top_rubric": {"title": top["title"], "count": top["c"]} if top else None,
+        "reviewed_count": counters.get("reviewed", 0),
+        "flagged_count": counters.get("flagged", 0),
+        "flagged_rate": _flagged_rate(counters),
+    }
+
+
+def read_breakdown(conn, days: int = DAILY_WINDOW_DAYS, top_students: int = TOP_STUDENTS) -> dict:
+    since = (datetime.utcnow() - timedelta(days=days - 1)).date().isoformat()
+    by_rubric = conn.execute("""
+        SELECT a.rubric_id, r.title, a.submissions
+        FROM analytics_rubric_counts a
+        LEFT JOIN rubrics r ON r.id = a.rubric_id
+        WHERE a.submissions > 0
+        ORDER BY a.submissions DESC
+    """).fetchall()
+    daily = conn.execute(
+        "SELECT day, submissions FROM analytics_daily WHERE day >= ? AND submissions > 0 ORDER BY day",
+        (since,),
+    ).fetchall()
+    students = conn.execute("""
+        SELECT user_email, submissions, last_submission_at
+        FROM analytics_student_activity
+        WHERE submissions > 0
+        ORDER BY submissions DESC
+        LIMIT ?
+    """, (top_students,)).fetchall()
+
+    return {
+        "by_rubric": [dict(r) for r in by_rubric],
+        "daily": [dict(r) for r in daily],
+        "top_students": [dict(r) for r in students],
+        "flagged_rate": _flagged_rate(_counters(conn)),
+    }
+
+
+class AnalyticsReconciler:
+    """
+    Rebuilds the aggregates at startup and then every interval seconds,
+    counted across all server processes rather than per process.
+    """
+
+    def __init__(self, interval: int = RECONCILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.last_run: str | None = None
+        self.last_drifted = 0
+        self.skipped = 0
+
+    async def run_once(self, if_due: bool = False) -> dict | None:
+        """if_due: leave it when another process reconciled within the interval."""
+        if if_due:
+            result = await run_write(lambda conn: reconcile_if_due(conn, self.interval))
+        else:
+            result = await run_write(reconcile_analytics)
+        if result is None:
+            self.skipped += 1
+            return None
+        self.runs += 1
+        self.last_run = datetime.utcnow().isoformat()
+        self.last_drifted = result["drifted"]
+        return result
+
+    async def start(self, run_now: bool = True):
+        if self._task is not None:
+            return
+        if run_now:
+            await self.run_once()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once(if_due=True)
+            except Exception:
+                # triggers keep the numbers current; try again next interval
+                continue
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "last_drifted": self.last_drifted,
+        }
+
+
+analytics_reconciler = AnalyticsReconciler()
@@ -0,0 +1,252 @@
+"""
+Frontend asset layer.
+
+Pages and everything under frontend/static are read, hashed and compressed
+once, then served from memory with strong ETags. Static files are also
+published under content-hashed names (app.<hash>.js) that pages link to
+and that may be cached for a year.
+
+    python -m backend.assets    # precompress into frontend/build
+
+Without a build the same work happens in memory at startup. With
+FLOSENDO_ASSETS_DEV=1 files are re-read when they change.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # gzip variants only
+    brotli = None
+
+FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
+BUILD_DIR = FRONTEND_DIR / "build"
+ASSETS_DEV = os.getenv("FLOSENDO_ASSETS_DEV", "0") == "1"
+DEV_RECHECK_SECONDS = 1.0
+
+COMPRESSIBLE = {".html", ".js", ".css", ".svg", ".json", ".txt"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PAGE_CACHE = "private, no-cache"
+
+# src="/static/..." and href="/static/..." in pages
+_STATIC_REF = re.compile(r'((?:src|href)=")(/static/[^"?#]+)(")')
+
+
+class Asset:
+    __slots__ = ("content_type", "body", "gzip", "br", "digest", "cache_control")
+
+    def __init__(self, content_type: str, body: bytes, digest: str, cache_control: str,
+                 gz: bytes | None = None, br: bytes | None = None):
+        self.content_type = content_type
+        self.body = body
+        self.digest = digest
+        self.cache_control = cache_control
+        self.gzip = gz
+        self.br = br
+
+    def variant(self, encoding: str | None) -> tuple[bytes, str]:
+        """(body, strong etag) for the chosen content-encoding."""
+        if encoding == "br":
+            return self.br, f'"{self.digest[:32]}-br"'
+        if encoding == "gzip":
+            return self.gzip, f'"{self.digest[:32]}-gz"'
+        return self.body, f'"{self.digest[:32]}"'
+
+
+def _compress(body: bytes, suffix: str) -> tuple[bytes | None, bytes | None]:
+    if suffix not in COMPRESSIBLE:
+        return None, None
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    br = brotli.compress(body, quality=11) if brotli is not None else None
+    # a variant that is not smaller is not worth sending
+    return (gz if len(gz) < len(body) else None), (br if br is not None and len(br) < len(body) else None)
+
+
+def _content_type(path: Path) -> str:
+    ctype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if ctype.startswith("text/") or ctype in ("application/javascript", "application/json"):
+        ctype += "; charset=utf-8"
+    return ctype
+
+
+def hashed_name(url: str, digest: str) -> str:
+    """/static/js/app.js -> /static/js/app.<hash>.js"""
+    head, dot, ext = url.rpartition(".")
+    return f"{head}.{digest[:10]}.{ext}" if dot else f"{url}.{digest[:10]}"
+
+
+def build_assets(frontend_dir: Path = FRONTEND_DIR) -> tuple[dict[str, Asset], dict[str, str]]:
+    """
+    Returns (assets, manifest). Assets are keyed by URL path for static
+    files (both plain and hashed names) and by file name for pages;
+    manifest maps each static URL to its hashed URL.
+    """
+    assets: dict[str, Asset] = {}
+    manifest: dict[str, str] = {}
+
+    static_dir = frontend_dir / "static"
+    for path in sorted(p for p in static_dir.rglob("*") if p.is_file()):
+        url = "/static/" + path.relative_to(static_dir).as_posix()
+        body = path.read_bytes()
+        digest = hashlib.sha256(body).hexdigest()
+        gz, br = _compress(body, path.suffix)
+        ctype = _content_type(path)
+        manifest[url] = hashed_name(url, digest)
+        assets[url] = Asset(ctype, body, digest, REVALIDATE, gz, br)
+        assets[manifest[url]] = Asset(ctype, body, digest, IMMUTABLE, gz, br)
+
+    for path in sorted(frontend_dir.glob("*.html")):
+        html = _STATIC_REF.sub(lambda m: m.group(1) + manifest.get(m.group(2), m.group(2)) + m.group(3),
+                               path.read_text(encoding="utf-8"))
+        body = html.encode("utf-8")
+        gz, br = _compress(body, ".html")
+        assets[path.name] = Asset("text/html; charset=utf-8", body, hashlib.sha256(body).hexdigest(),
+                                  PAGE_CACHE, gz, br)
+
+    return assets, manifest
+
+
+def _source_mtime(frontend_dir: Path) -> float:
+    paths = list(frontend_dir.glob("*.html")) + [p for p in (frontend_dir / "static").rglob("*") if p.is_file()]
+    return max((p.stat().st_mtime for p in paths), default=0.0)
+
+
+def write_build(assets: dict[str, Asset], manifest: dict[str, str], build_dir: Path = BUILD_DIR):
+    """Writes bodies and precompressed variants, content-addressed, plus an index."""
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    files = build_dir / "files"
+    files.mkdir(parents=True)
+    index = {}
+    for key, asset in assets.items():
+        for suffix, data in (("", asset.body), (".gz", asset.gzip), (".br", asset.br)):
+            if data is not None and not (files / (asset.digest + suffix)).exists():
+                (files / (asset.digest + suffix)).write_bytes(data)
+        index[key] = {
+            "content_type": asset.content_type,
+            "digest": asset.digest,
+            "cache_control": asset.cache_control,
+            "gzip": asset.gzip is not None,
+            "br": asset.br is not None,
+        }
+    (build_dir / "manifest.json").write_text(json.dumps({"assets": index, "static": manifest}, indent=1))
+
+
+def build_is_current(frontend_dir: Path = FRONTEND_DIR, build_dir: Path = BUILD_DIR) -> bool:
+    manifest = build_dir / "manifest.json"
+    return manifest.exists() and manifest.stat().st_mtime >= _source_mtime(frontend_dir)
+
+
+def load_build(build_dir: Path = BUILD_DIR) -> tuple[dict[str, Asset], dict[str, str]]:
+    data = json.loads((build_dir / "manifest.json").read_text())
+    files = build_dir / "files"
+    blobs: dict[str, bytes] = {}
+
+    def read(name: str) -> bytes:
+        if name not in blobs:
+            blobs[name] = (files / name).read_bytes()
+        return blobs[name]
+
+    assets = {}
+    for key, meta in data["assets"].items():
+        d = meta["digest"]
+        assets[key] = Asset(meta["content_type"], read(d), d, meta["cache_control"],
+                            read(d + ".gz") if meta["gzip"] else None,
+                            read(d + ".br") if meta["br"] else None)
+    return assets, data["static"]
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in {t.strip().removeprefix("W/") for t in header.split(",")}
+
+
+def _negotiate(accept_encoding: str, asset: Asset) -> str | None:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if asset.br is not None and "br" in accepted:
+        return "br"
+    if asset.gzip is not None and ("gzip" in accepted or "*" in accepted):
+        return "gzip"
+    return None
+
+
+class AssetStore:
+    def __init__(self, frontend_dir: Path = FRONTEND_DIR, build_dir: Path = BUILD_DIR, dev: bool = ASSETS_DEV):
+        self.frontend_dir = frontend_dir
+        self.build_dir = build_dir
+        self.dev = dev
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._loaded_mtime = 0.0
+        self.source = ""
+        self._assets, self._manifest = self._load()
+
+    def _load(self):
+        self._loaded_mtime = _source_mtime(self.frontend_dir)
+        # a build older than the sources would serve stale files
+        if not self.dev and build_is_current(self.frontend_dir, self.build_dir):
+            self.source = "build"
+            return load_build(self.build_dir)
+        self.source = "memory"
+        return build_assets(self.frontend_dir)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < DEV_RECHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < DEV_RECHECK_SECONDS:
+                return
+            self._checked_at = now
+            if _source_mtime(self.frontend_dir) > self._loaded_mtime:
+                self._assets, self._manifest = self._load()
+
+    def get(self, key: str) -> Asset | None:
+        if self.dev:
+            self._maybe_reload()
+        return self._assets.get(key)
+
+    def url(self, static_url: str) -> str:
+        """Hashed URL for a /static path (unchanged if unknown)."""
+        return self._manifest.get(static_url, static_url)
+
+    def response(self, request: Request, key: str) -> Response:
+        asset = self.get(key)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        encoding = _negotiate(request.headers.get("accept-encoding", ""), asset)
+        body, etag = asset.variant(encoding)
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.content_type, headers=headers)
+
+    def stats(self) -> dict:
+        return {"source": self.source, "dev": self.dev, "assets": len(self._assets), "brotli": brotli is not None}
+
+
+if __name__ == "__main__":
+    built, static_manifest = build_assets()
+    write_build(built, static_manifest)
+    raw = sum(len(a.body) for k, a in built.items() if k not in static_manifest.values())
+    gz = sum(len(a.gzip or a.body) for k, a in built.items() if k not in static_manifest.values())
+    print(f"{len(built)} assets -> {BUILD_DIR} ({raw} bytes, {gz} gzipped)")
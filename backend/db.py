@@ -1,18 +1,376 @@
+import asyncio
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent.parent / "data" / "app.db"
+from backend.metrics import connection_factory, span, with_context
+
+DB_PATH = Path(os.getenv("FLOSENDO_DB_PATH", Path(__file__).parent.parent / "data" / "app.db"))
+
+# per process; each server worker has its own pool and writer
+POOL_MAX_SIZE = int(os.getenv("FLOSENDO_DB_POOL_SIZE", "8"))
+POOL_CHECKOUT_TIMEOUT = 10.0
+
+# "wal" (default) or "rollback" for SQLite's stock journal
+STORAGE_MODE = os.getenv("FLOSENDO_DB_MODE", "wal").strip().lower()
+
+WAL_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",  # 256MB
+    "PRAGMA cache_size = -16000",    # ~16MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+BUSY_TIMEOUT_MS = 5000
+WRITE_BATCH_MAX = 64
+
+def configure_conn(conn: sqlite3.Connection):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if STORAGE_MODE == "wal":
+        for pragma in WAL_PRAGMAS:
+            conn.execute(pragma)
 
 def get_conn():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    with span("db_connect"):
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, factory=connection_factory())
+        conn.row_factory = sqlite3.Row
+        configure_conn(conn)
     return conn
 
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections.
+    A thread gets back the connection it used last time when it is idle,
+    otherwise any idle one, otherwise a new one while under max_size.
+    """
+
+    def __init__(self, db_path: Path, max_size: int = POOL_MAX_SIZE, timeout: float = POOL_CHECKOUT_TIMEOUT):
+        self.db_path = Path(db_path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: list[sqlite3.Connection] = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # connections move between threadpool threads, access is serialised by the pool
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=connection_factory())
+        conn.row_factory = sqlite3.Row
+        configure_conn(conn)
+        return conn
+
+    @staticmethod
+    def _healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _take_idle(self):
+        own = getattr(self._local, "conn", None)
+        if own is not None and own in self._idle:
+            self._idle.remove(own)
+            return own
+        if self._idle:
+            return self._idle.pop()
+        return None
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            conn = self._take_idle()
+            if conn is None and self._size >= self.max_size:
+                if not self._cond.wait_for(lambda: self._idle or self._closed, timeout=self.timeout):
+                    raise TimeoutError("Timed out waiting for a database connection")
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                conn = self._take_idle()
+            if conn is None:
+                self._size += 1
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if conn is not None and not self._healthy(conn):
+            self._discard(conn)
+            with self._cond:
+                self._size += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        with span("db_checkout"):
+            conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+            }
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+def pooled_conn():
+    """Check out a pooled connection: `with pooled_conn() as conn: ...`"""
+    return get_pool().connection()
+
+
+# one thread per pooled connection so reads never queue on checkout
+_read_executor = ThreadPoolExecutor(max_workers=POOL_MAX_SIZE, thread_name_prefix="db-read")
+
+def _read(fn):
+    with pooled_conn() as conn:
+        return fn(conn)
+
+async def run_read(fn):
+    """Run fn(conn) with a pooled connection on the read executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, with_context(_read, fn))
+
+
+class WriteQueue:
+    """
+    Single writer thread that owns the only write connection.
+    Jobs are callables taking a connection. Whatever is queued when the
+    thread wakes up runs in one transaction, each job inside its own
+    savepoint so a failing job only rolls back itself.
+    Jobs must not call commit(); the writer commits the batch.
+    """
+
+    def __init__(self, db_path: Path, batch_max: int = WRITE_BATCH_MAX):
+        self.db_path = Path(db_path)
+        self.batch_max = batch_max
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.batches = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn) -> Future:
+        fut: Future = Future()
+        self._ensure_started()
+        # run in the submitter's context so spans land on its request
+        self._queue.put((with_context(fn), fut))
+        return fut
+
+    def _run(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               factory=connection_factory())
+        conn.row_factory = sqlite3.Row
+        configure_conn(conn)
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_max:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            self._run_batch(conn, batch)
+            if stop:
+                break
+
+        conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list):
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+
+        for fn, fut in batch:
+            if not fut.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT job")
+            try:
+                result = fn(conn)
+            except BaseException as e:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                self.failed += 1
+                fut.set_exception(e)
+                continue
+            conn.execute("RELEASE job")
+            done.append((fut, result))
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            for fut, _ in done:
+                fut.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs += len(done)
+        for fut, result in done:
+            fut.set_result(result)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+
+_writer: WriteQueue | None = None
+
+def get_writer() -> WriteQueue:
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = WriteQueue(DB_PATH)
+    return _writer
+
+def close_all():
+    """Close this process's pool and writer; the next use opens fresh ones."""
+    global _pool, _writer
+    with _pool_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def submit_write(fn) -> Future:
+    return get_writer().submit(fn)
+
+async def run_write(fn):
+    """Run fn(conn) on the writer thread and await its result."""
+    return await asyncio.wrap_future(submit_write(fn))
+
+async def wait_for_work(wakeup: asyncio.Event, has_due, poll_seconds: float):
+    """
+    Idle path of the queue workers: returns when woken or once has_due(conn)
+    finds something on a poll. Polls are plain reads, so an idle server
+    never takes the write lock just to claim nothing.
+    """
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=poll_seconds)
+            wakeup.clear()
+            return
+        except asyncio.TimeoutError:
+            if await run_read(has_due):
+                return
+
 def init_db():
+    """Create the baseline schema, then apply pending backend.migrations."""
     conn = get_conn()
     cur = conn.cursor()
 
+    # journal mode is stored in the db file, so set it once here
+    cur.execute("PRAGMA journal_mode = WAL" if STORAGE_MODE == "wal" else "PRAGMA journal_mode = DELETE")
+
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -99,3 +457,6 @@ def init_db():
 
     conn.commit()
     conn.close()
+
+    from backend.migrations import migrate  # it imports this module
+    migrate()
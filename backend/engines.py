@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import requests
+
+ENGINE_NAME = os.getenv("FLOSENDO_FEEDBACK_ENGINE", "template").strip().lower()
+ENGINE_URL = os.getenv("FLOSENDO_FEEDBACK_ENGINE_URL", "http://127.0.0.1:8765/feedback")
+ENGINE_CONCURRENCY = int(os.getenv("FLOSENDO_ENGINE_CONCURRENCY", "4"))
+ENGINE_TIMEOUT_SECONDS = float(os.getenv("FLOSENDO_ENGINE_TIMEOUT", "20"))
+ENGINE_QUEUE_WAIT_SECONDS = float(os.getenv("FLOSENDO_ENGINE_QUEUE_WAIT", "1"))
+ENGINE_RATE_PER_SECOND = float(os.getenv("FLOSENDO_ENGINE_RATE", "0"))  # submissions/s, 0 = unlimited
+ENGINE_BURST = int(os.getenv("FLOSENDO_ENGINE_BURST", "32"))
+BREAKER_FAILURES = int(os.getenv("FLOSENDO_ENGINE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("FLOSENDO_ENGINE_BREAKER_RESET", "30"))
+
+
+class FeedbackEngine:
+    """
+    A feedback backend. generate_batch returns one feedback dict
+    (overall_summary, rubric_breakdown, next_steps) per text, in order.
+    Called from worker threads, possibly concurrently.
+    """
+
+    name = "base"
+
+    def generate_batch(self, texts: list[str], rubric: dict) -> list[dict]:
+        raise NotImplementedError
+
+
+class HttpEngine(FeedbackEngine):
+    """
+    Local model server (or stub) speaking JSON:
+    POST {"rubric": {...}, "submissions": [text, ...]} -> {"results": [feedback, ...]}
+    """
+
+    name = "http"
+
+    def __init__(self, url: str = ENGINE_URL, timeout: float = ENGINE_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        # one keep-alive session per worker thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def generate_batch(self, texts: list[str], rubric: dict) -> list[dict]:
+        r = self._session().post(self.url, json={
+            "rubric": {"id": rubric.get("id"), "criteria": rubric.get("criteria", [])},
+            "submissions": texts,
+        }, timeout=self.timeout)
+        r.raise_for_status()
+        results = r.json().get("results")
+        if not isinstance(results, list) or len(results) != len(texts):
+            raise ValueError(f"Engine returned {len(results) if isinstance(results, list) else 'no'} "
+                             f"results for {len(texts)} submissions")
+        return [
+            {
+                "overall_summary": f.get("overall_summary", ""),
+                "rubric_breakdown": f.get("rubric_breakdown", []),
+                "next_steps": f.get("next_steps", []),
+            }
+            for f in results
+        ]
+
+
+ENGINES = {"http": HttpEngine}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n: int) -> bool:
+        if self.rate <= 0:
+            return True
+        n = min(n, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < n:
+                return False
+            self._tokens -= n
+            return True
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures; after reset_after seconds
+    one trial call is let through and its outcome closes or reopens it.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_after:
+                self.state = "half_open"
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def refused(self):
+        """The call allow() let through never ran; a trial reopens and waits again."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class GuardedEngine:
+    """
+    Runs an engine behind a concurrency limit, a timeout, a token bucket
+    and a circuit breaker. Whenever a call is refused or fails, the
+    fallback engine answers instead, so callers never wait on a stalled
+    backend for longer than queue_wait + timeout.
+
+    generate_batch returns (results, fell_back).
+    """
+
+    def __init__(self, engine: FeedbackEngine, fallback: FeedbackEngine, concurrency: int = ENGINE_CONCURRENCY,
+                 timeout: float = ENGINE_TIMEOUT_SECONDS, queue_wait: float = ENGINE_QUEUE_WAIT_SECONDS,
+                 rate: float = ENGINE_RATE_PER_SECOND, burst: int = ENGINE_BURST):
+        self.engine = engine
+        self.fallback = fallback
+        self.timeout = timeout
+        self.queue_wait = queue_wait
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"engine-{engine.name}")
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "ok": 0, "timeout": 0, "error": 0, "busy": 0, "rate_limited": 0, "open": 0}
+
+    @property
+    def local(self) -> bool:
+        """True when the engine is the in-process fallback itself."""
+        return self.engine is self.fallback
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _fall_back(self, reason: str, texts: list[str], rubric: dict):
+        self._count(reason)
+        return self.fallback.generate_batch(texts, rubric), True
+
+    def generate_batch(self, texts: list[str], rubric: dict) -> tuple[list[dict], bool]:
+        if self.local:
+            # nothing to guard, and a thread hop would only add latency
+            return self.engine.generate_batch(texts, rubric), False
+
+        self._count("calls")
+        if not self.breaker.allow():
+            return self._fall_back("open", texts, rubric)
+        # a refused trial must not leave the breaker half open with no
+        # outcome coming, or it would never close again
+        if not self.bucket.take(len(texts)):
+            self.breaker.refused()
+            return self._fall_back("rate_limited", texts, rubric)
+        if not self._slots.acquire(timeout=self.queue_wait):
+            self.breaker.refused()
+            return self._fall_back("busy", texts, rubric)
+
+        try:
+            fut = self._executor.submit(self.engine.generate_batch, texts, rubric)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot stays taken until the call really ends, even after we stop waiting
+        fut.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            results = fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.breaker.failure()
+            return self._fall_back("timeout", texts, rubric)
+        except Exception:
+            self.breaker.failure()
+            return self._fall_back("error", texts, rubric)
+
+        self.breaker.success()
+        self._count("ok")
+        return results, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "engine": self.engine.name,
+            "fallback": self.fallback.name,
+            "concurrency": self.concurrency,
+            "timeout_s": self.timeout,
+            "breaker": self.breaker.state,
+            "breaker_open": int(self.breaker.state != "closed"),
+            **counts,
+        }
+
+
+def build_engine(fallback: FeedbackEngine, name: str = ENGINE_NAME) -> GuardedEngine:
+    """Engine selected by FLOSENDO_FEEDBACK_ENGINE, guarded, falling back to `fallback`."""
+    if name == fallback.name:
+        return GuardedEngine(fallback, fallback)
+    factory = ENGINES.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown feedback engine: {name}")
+    return GuardedEngine(factory(), fallback)
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from xml.etree import ElementTree
+
+from backend.db import run_write, wait_for_work
+
+EXTRACT_WORKERS = int(os.getenv("FLOSENDO_EXTRACT_WORKERS", str(min(2, os.cpu_count() or 1))))
+EXTRACT_MAX_ATTEMPTS = 3
+EXTRACT_BATCH = 8
+IDLE_POLL_SECONDS = 5.0
+ERROR_BACKOFF_SECONDS = 0.5   # pause after an unexpected error, doubled up to the max
+ERROR_BACKOFF_MAX_SECONDS = 30.0
+CHUNK_CHARS = 2000        # for formats without natural pages
+MAX_CONTEXT_CHARS = 8000  # what chat gets per attachment
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+log = logging.getLogger(__name__)
+
+
+# --- Extractors (run in worker processes) ---
+
+def _split(text: str, label: str) -> list[tuple[str, str]]:
+    text = text.strip()
+    if not text:
+        return []
+    parts = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+    return [(f"{label} {n}", p) for n, p in enumerate(parts, start=1)]
+
+
+def _extract_txt(path: Path) -> list[tuple[str, str]]:
+    return _split(path.read_text(encoding="utf-8", errors="replace"), "part")
+
+
+def _extract_pdf(path: Path) -> list[tuple[str, str]]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(path))
+    chunks = []
+    for n, page in enumerate(reader.pages, start=1):
+        text = (page.extract_text() or "").strip()
+        if text:
+            chunks.append((f"page {n}", text))
+    return chunks
+
+
+def _extract_docx(path: Path) -> list[tuple[str, str]]:
+    with zipfile.ZipFile(path) as z:
+        root = ElementTree.fromstring(z.read("word/document.xml"))
+    paragraphs = ["".join(t.text or "" for t in p.iter(f"{_W_NS}t")) for p in root.iter(f"{_W_NS}p")]
+    return _split("\n".join(p for p in paragraphs if p), "section")
+
+
+def _extract_pptx(path: Path) -> list[tuple[str, str]]:
+    with zipfile.ZipFile(path) as z:
+        names = [n for n in z.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)]
+        names.sort(key=lambda n: int(re.search(r"(\d+)", n.rsplit("/", 1)[1]).group(1)))
+        chunks = []
+        for name in names:
+            root = ElementTree.fromstring(z.read(name))
+            text = " ".join(t.text or "" for t in root.iter(f"{_A_NS}t")).strip()
+            if text:
+                n = int(re.search(r"(\d+)", name.rsplit("/", 1)[1]).group(1))
+                chunks.append((f"slide {n}", text))
+    return chunks
+
+
+EXTRACTORS = {
+    "text/plain": _extract_txt,
+    "application/pdf": _extract_pdf,
+    DOCX_TYPE: _extract_docx,
+    PPTX_TYPE: _extract_pptx,
+}
+
+
+def extract_file(path: str, content_type: str) -> list[tuple[str, str]]:
+    """Returns [(label, text)] chunks. Top-level so worker processes can run it."""
+    return EXTRACTORS[content_type](Path(path))
+
+
+# --- Queue ---
+
+def enqueue_extraction(conn, sha256: str, stored_name: str, content_type: str):
+    """Writer job helper: queue a blob once; later uploads of the same content are no-ops."""
+    status = "queued" if content_type in EXTRACTORS else "unsupported"
+    conn.execute("""
+        INSERT OR IGNORE INTO attachment_texts (sha256, stored_name, content_type, status, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (sha256, stored_name, content_type, status, datetime.utcnow().isoformat()))
+
+
+def recover_and_backfill(conn):
+    now = datetime.utcnow().isoformat()
+    # work interrupted by a crash starts over
+    conn.execute("UPDATE attachment_texts SET status = 'queued', updated_at = ? WHERE status = 'running'", (now,))
+    rows = conn.execute("""
+        SELECT DISTINCT u.blob_sha256, u.stored_name, u.content_type
+        FROM uploads u
+        LEFT JOIN attachment_texts t ON t.sha256 = u.blob_sha256
+        WHERE u.blob_sha256 IS NOT NULL AND t.sha256 IS NULL
+    """).fetchall()
+    for r in rows:
+        enqueue_extraction(conn, r["blob_sha256"], r["stored_name"], r["content_type"])
+
+
+def _claim_batch(conn, limit: int):
+    return conn.execute("""
+        UPDATE attachment_texts
+        SET status = 'running', attempts = attempts + 1, updated_at = ?
+        WHERE sha256 IN (
+            SELECT sha256 FROM attachment_texts WHERE status = 'queued' ORDER BY updated_at LIMIT ?
+        )
+        RETURNING sha256, stored_name, content_type, attempts
+    """, (datetime.utcnow().isoformat(), limit)).fetchall()
+
+
+def _has_due(conn) -> bool:
+    return conn.execute("SELECT 1 FROM attachment_texts WHERE status = 'queued' LIMIT 1").fetchone() is not None
+
+
+def _store_chunks(conn, sha256: str, chunks: list[tuple[str, str]]):
+    conn.execute("DELETE FROM attachment_chunks WHERE sha256 = ?", (sha256,))
+    conn.executemany(
+        "INSERT INTO attachment_chunks (sha256, seq, label, text) VALUES (?, ?, ?, ?)",
+        [(sha256, seq, label, text) for seq, (label, text) in enumerate(chunks)],
+    )
+    conn.execute("""
+        UPDATE attachment_texts
+        SET status = 'done', chunk_count = ?, char_count = ?, error = NULL, updated_at = ?
+        WHERE sha256 = ?
+    """, (len(chunks), sum(len(t) for _, t in chunks), datetime.utcnow().isoformat(), sha256))
+
+
+def _store_failure(conn, job, error: Exception):
+    status = "failed" if job["attempts"] >= EXTRACT_MAX_ATTEMPTS else "queued"
+    conn.execute(
+        "UPDATE attachment_texts SET status = ?, error = ?, updated_at = ? WHERE sha256 = ?",
+        (status, f"{type(error).__name__}: {error}"[:500], datetime.utcnow().isoformat(), job["sha256"]),
+    )
+
+
+class ExtractionQueue:
+    """
+    Pulls queued blobs in batches and extracts them on a process pool.
+    State lives in attachment_texts, so a restart resumes where it stopped
+    and anything uploaded while the worker was down is picked up.
+    """
+
+    def __init__(self, workers: int = EXTRACT_WORKERS):
+        self.upload_dir: Path | None = None
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self.extracted = 0
+        self.failed = 0
+        self.pool_restarts = 0
+
+    async def start(self, upload_dir: Path, recover: bool = True):
+        if self._task is not None:
+            return
+        self.upload_dir = upload_dir
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = self._new_executor()
+        if recover:
+            await run_write(recover_and_backfill)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def notify(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: the server process has live threads and sqlite handles that must not be forked
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self, broken: ProcessPoolExecutor):
+        # every job in flight on a broken pool fails with it; only the first replaces it
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+        self.pool_restarts += 1
+
+    async def _run(self):
+        errors = 0
+        while True:
+            try:
+                await self._run_once()
+                errors = 0
+            except Exception:
+                errors += 1
+                log.exception("extraction worker error")
+                await asyncio.sleep(min(ERROR_BACKOFF_SECONDS * 2 ** (errors - 1), ERROR_BACKOFF_MAX_SECONDS))
+
+    async def _run_once(self):
+        batch = await run_write(lambda conn: _claim_batch(conn, EXTRACT_BATCH))
+        if not batch:
+            await wait_for_work(self._wakeup, _has_due, IDLE_POLL_SECONDS)
+            return
+        outcomes = await asyncio.gather(*(self._extract(job) for job in batch), return_exceptions=True)
+        errors = [(job, e) for job, e in zip(batch, outcomes) if isinstance(e, Exception)]
+        for job, e in errors:
+            try:
+                await run_write(lambda conn, job=job, e=e: _store_failure(conn, job, e))
+            except Exception:
+                # left running; recover_and_backfill requeues it on the next start
+                pass
+        if errors:
+            raise errors[0][1]
+
+    async def _extract(self, job):
+        path = self.upload_dir / job["stored_name"]
+        executor = self._executor
+        try:
+            chunks = await self._loop.run_in_executor(executor, extract_file, str(path), job["content_type"])
+        except BrokenProcessPool as e:
+            # a worker died (killed, out of memory, crashed in a parser); the job
+            # goes back with the attempt counted, so a file that kills every
+            # worker it lands on still ends up failed
+            log.warning("extraction pool broke on %s, starting a new one", job["sha256"])
+            self._replace_executor(executor)
+            await run_write(lambda conn: _store_failure(conn, job, e))
+            return
+        except Exception as e:
+            await run_write(lambda conn: _store_failure(conn, job, e))
+            self.failed += 1
+            return
+        await run_write(lambda conn: _store_chunks(conn, job["sha256"], chunks))
+        self.extracted += 1
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "extracted": self.extracted, "failed": self.failed,
+                "pool_restarts": self.pool_restarts}
+
+
+def load_attachment_texts(conn, sha256s: list[str], max_chars: int = MAX_CONTEXT_CHARS) -> dict:
+    """
+    Prepared text per blob for chat/feedback context, read straight from the
+    chunk index. Blobs that are not extracted yet map to None.
+    """
+    if not sha256s:
+        return {}
+    placeholders = ",".join(["?"] * len(sha256s))
+    ready = {r["sha256"] for r in conn.execute(
+        f"SELECT sha256 FROM attachment_texts WHERE status = 'done' AND sha256 IN ({placeholders})", sha256s
+    ).fetchall()}
+    texts = {sha: None for sha in sha256s}
+    for sha in ready:
+        parts, total = [], 0
+        for r in conn.execute("SELECT label, text FROM attachment_chunks WHERE sha256 = ? ORDER BY seq", (sha,)):
+            if total >= max_chars:
+                break
+            piece = f"[{r['label']}] {r['text']}"[:max_chars - total]
+            parts.append(piece)
+            total += len(piece)
+        texts[sha] = "\n".join(parts)
+    return texts
+
+
+attachment_extraction = ExtractionQueue()
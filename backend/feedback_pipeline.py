@@ -1,28 +1,454 @@
-def generate_feedback(submission_text: str, rubric: dict) -> dict:
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.db import pooled_conn, submit_write
+from backend.engines import ENGINE_CONCURRENCY, FeedbackEngine, build_engine
+from backend.metrics import span, with_context
+
+CACHE_MEMORY_ENTRIES = 512
+CACHE_MAX_ROWS = int(os.getenv("FLOSENDO_FEEDBACK_CACHE_ROWS", "20000"))
+CACHE_TTL_SECONDS = int(os.getenv("FLOSENDO_FEEDBACK_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_PRUNE_EVERY = 100  # persistent inserts between size checks
+
+FEEDBACK_BATCH_MAX = int(os.getenv("FLOSENDO_FEEDBACK_BATCH_MAX", "16"))
+FEEDBACK_BATCH_WAIT_SECONDS = float(os.getenv("FLOSENDO_FEEDBACK_BATCH_WAIT_MS", "20")) / 1000
+
+SUMMARY = "This is a solid draft that meets several rubric criteria. With more detail and refinement, it could be improved further."
+NEXT_STEPS = (
+    "Review the rubric criteria and focus on one area to improve.",
+    "Add more examples to support your ideas.",
+    "Revise the structure for clarity.",
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _lowered_names(rubric: dict):
+    # registry rubrics carry these precomputed
+    lowered = rubric.get("criteria_lower")
+    if lowered is None:
+        lowered = [c["name"].lower() for c in rubric.get("criteria", [])]
+    return lowered
+
+
+def iter_feedback(submission_text: str, rubric: dict):
     """
-    Central feedback pipeline.
-    Later this function will call an LLM.
-    For now, returns structured mock feedback.
+    Yields (event, data) pairs as each part of the feedback is produced:
+    one "criterion" per rubric criterion, then "summary" and "next_steps".
     """
-
     criteria = rubric.get("criteria", [])
 
-    breakdown = []
-    for c in criteria:
-        breakdown.append({
+    for c, lower in zip(criteria, _lowered_names(rubric)):
+        yield "criterion", {
             "criterion": c["name"],
             "score": 3,
-            "strengths": f"The work demonstrates some understanding of {c['name'].lower()}.",
-            "improvements": f"Consider expanding on ideas related to {c['name'].lower()}.",
+            "strengths": f"The work demonstrates some understanding of {lower}.",
+            "improvements": f"Consider expanding on ideas related to {lower}.",
             "evidence": submission_text[:120] + "..."
-        })
-
-    return {
-        "overall_summary": "This is a solid draft that meets several rubric criteria. With more detail and refinement, it could be improved further.",
-        "rubric_breakdown": breakdown,
-        "next_steps": [
-            "Review the rubric criteria and focus on one area to improve.",
-            "Add more examples to support your ideas.",
-            "Revise the structure for clarity."
-        ]
-    }
+        }
+
+    yield "summary", SUMMARY
+    yield "next_steps", list(NEXT_STEPS)
+
+
+def iter_stored_feedback(feedback: dict):
+    """Replays an already generated feedback dict in iter_feedback's event order."""
+    for item in feedback.get("rubric_breakdown", []):
+        yield "criterion", item
+    yield "summary", feedback.get("overall_summary", "")
+    yield "next_steps", feedback.get("next_steps", [])
+
+
+def _collect(events) -> dict:
+    feedback = {"overall_summary": "", "rubric_breakdown": [], "next_steps": []}
+    for event, data in events:
+        if event == "criterion":
+            feedback["rubric_breakdown"].append(data)
+        elif event == "summary":
+            feedback["overall_summary"] = data
+        elif event == "next_steps":
+            feedback["next_steps"] = data
+    return feedback
+
+
+def _build_feedback(submission_text: str, rubric: dict) -> dict:
+    return _collect(iter_feedback(submission_text, rubric))
+
+
+def _build_feedback_batch(texts: list[str], rubric: dict) -> list[dict]:
+    """
+    One pass over the rubric for many submissions; per-criterion text is
+    prepared once. Each result equals _build_feedback(text, rubric).
+    """
+    prepared = [
+        (c["name"],
+         f"The work demonstrates some understanding of {lower}.",
+         f"Consider expanding on ideas related to {lower}.")
+        for c, lower in zip(rubric.get("criteria", []), _lowered_names(rubric))
+    ]
+    return [
+        {
+            "overall_summary": SUMMARY,
+            "rubric_breakdown": [
+                {"criterion": name, "score": 3, "strengths": strengths, "improvements": improvements,
+                 "evidence": text[:120] + "..."}
+                for name, strengths, improvements in prepared
+            ],
+            "next_steps": list(NEXT_STEPS),
+        }
+        for text in texts
+    ]
+
+
+class TemplateEngine(FeedbackEngine):
+    """The built-in template feedback; also the fallback for every other engine."""
+
+    name = "template"
+
+    def generate_batch(self, texts: list[str], rubric: dict) -> list[dict]:
+        return _build_feedback_batch(texts, rubric)
+
+
+feedback_engine = build_engine(TemplateEngine())
+# batch calls block on the engine; keep them off the default executor that
+# uploads, sessions and rubric reloads share, and no wider than the engine
+_engine_executor = ThreadPoolExecutor(max_workers=ENGINE_CONCURRENCY, thread_name_prefix="feedback-batch")
+
+
+def rubric_group_key(rubric: dict) -> str:
+    """Submissions with equal keys can share one batched generation call."""
+    return json.dumps([rubric.get("id"), rubric.get("criteria", [])], sort_keys=True, separators=(",", ":"))
+
+
+def cache_key(submission_text: str, rubric: dict) -> str:
+    """
+    Hash of the whitespace-normalised text plus the rubric criteria, so
+    resubmissions that only differ in spacing map to the same entry.
+    """
+    text = _WHITESPACE.sub(" ", submission_text).strip()
+    criteria = json.dumps(rubric.get("criteria", []), sort_keys=True, separators=(",", ":"))
+    h = hashlib.sha256()
+    h.update(text.encode("utf-8"))
+    h.update(b"\0")
+    h.update(criteria.encode("utf-8"))
+    return h.hexdigest()
+
+
+class FeedbackCache:
+    """
+    In-memory LRU in front of the feedback_cache table.
+    Entries expire after ttl seconds; the table is trimmed to max_rows
+    by least recent use.
+    """
+
+    def __init__(self, memory_entries: int = CACHE_MEMORY_ENTRIES, max_rows: int = CACHE_MAX_ROWS,
+                 ttl: int = CACHE_TTL_SECONDS):
+        self.memory_entries = memory_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._lru: OrderedDict[str, tuple[str, float, int | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, feedback_json: str, created_at: float, rubric_id: int | None):
+        with self._lock:
+            self._lru[key] = (feedback_json, created_at, rubric_id)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.memory_entries:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(entry[0])
+                del self._lru[key]
+
+        with pooled_conn() as conn:
+            row = conn.execute(
+                "SELECT feedback_json, created_at, rubric_id FROM feedback_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+
+        if row is None or now - row["created_at"] > self.ttl:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, row["feedback_json"], row["created_at"], row["rubric_id"])
+        submit_write(lambda conn: conn.execute(
+            "UPDATE feedback_cache SET last_used = ? WHERE cache_key = ?", (now, key)
+        ))
+        return json.loads(row["feedback_json"])
+
+    def get_many(self, keys: list[str]) -> list[dict | None]:
+        """get() for several keys with one table lookup for the memory misses."""
+        now = time.time()
+        results: list[dict | None] = [None] * len(keys)
+        missing: dict[str, list[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._lru.get(key)
+                if entry is not None and now - entry[1] <= self.ttl:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    results[i] = json.loads(entry[0])
+                else:
+                    self._lru.pop(key, None)
+                    missing.setdefault(key, []).append(i)
+        if not missing:
+            return results
+
+        placeholders = ",".join(["?"] * len(missing))
+        with pooled_conn() as conn:
+            rows = conn.execute(
+                f"SELECT cache_key, feedback_json, created_at, rubric_id FROM feedback_cache WHERE cache_key IN ({placeholders})",
+                list(missing),
+            ).fetchall()
+
+        found = []
+        for row in rows:
+            if now - row["created_at"] > self.ttl:
+                continue
+            self._remember(row["cache_key"], row["feedback_json"], row["created_at"], row["rubric_id"])
+            for i in missing.pop(row["cache_key"]):
+                results[i] = json.loads(row["feedback_json"])
+            found.append(row["cache_key"])
+
+        with self._lock:
+            self.disk_hits += len(found)
+            self.misses += sum(len(v) for v in missing.values())
+        if found:
+            submit_write(lambda conn: conn.executemany(
+                "UPDATE feedback_cache SET last_used = ? WHERE cache_key = ?", [(now, k) for k in found]
+            ))
+        return results
+
+    def put(self, key: str, feedback: dict, rubric_id: int | None = None):
+        now = time.time()
+        feedback_json = json.dumps(feedback)
+        self._remember(key, feedback_json, now, rubric_id)
+
+        with self._lock:
+            self._inserts += 1
+            prune = self._inserts % CACHE_PRUNE_EVERY == 0
+
+        def write(conn):
+            conn.execute("""
+                INSERT INTO feedback_cache (cache_key, rubric_id, feedback_json, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                  rubric_id=excluded.rubric_id,
+                  feedback_json=excluded.feedback_json,
+                  created_at=excluded.created_at,
+                  last_used=excluded.last_used
+            """, (key, rubric_id, feedback_json, now, now))
+            if prune:
+                self._prune(conn, now)
+
+        # fire and forget, the in-memory copy already serves this process
+        submit_write(write)
+
+    def _prune(self, conn, now: float):
+        cur = conn.execute("DELETE FROM feedback_cache WHERE created_at < ?", (now - self.ttl,))
+        removed = cur.rowcount
+        cur = conn.execute("""
+            DELETE FROM feedback_cache WHERE cache_key IN (
+                SELECT cache_key FROM feedback_cache
+                ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.max_rows,))
+        removed += cur.rowcount
+        with self._lock:
+            self.evictions += removed
+
+    def invalidate_rubric(self, rubric_id: int):
+        with self._lock:
+            stale = [k for k, v in self._lru.items() if v[2] == rubric_id]
+            for k in stale:
+                del self._lru[k]
+        return submit_write(lambda conn: conn.execute(
+            "DELETE FROM feedback_cache WHERE rubric_id = ?", (rubric_id,)
+        ))
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_entries": len(self._lru),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+            }
+
+
+feedback_cache = FeedbackCache()
+
+
+def generate_feedback(submission_text: str, rubric: dict) -> dict:
+    """
+    Central feedback pipeline, answered by feedback_engine
+    (FLOSENDO_FEEDBACK_ENGINE; template feedback by default).
+    Results are cached on (normalised text, rubric criteria); pass the
+    rubric's "id" so edits to that rubric can invalidate its entries.
+    Template fallbacks from a failing engine are not cached.
+    """
+    with span("generate_feedback"):
+        key = cache_key(submission_text, rubric)
+        cached = feedback_cache.get(key)
+        if cached is not None:
+            return cached
+
+        results, fell_back = feedback_engine.generate_batch([submission_text], rubric)
+        if not fell_back:
+            feedback_cache.put(key, results[0], rubric.get("id"))
+        return results[0]
+
+
+def generate_feedback_batch(items: list[tuple[str, dict]]) -> list[dict]:
+    """
+    Batched generate_feedback over (submission_text, rubric) pairs.
+    Cache misses are grouped by rubric and generated one group per call;
+    results come back in input order and match per-item calls exactly.
+    """
+    with span("generate_feedback_batch"):
+        keys = [cache_key(text, rubric) for text, rubric in items]
+        results = feedback_cache.get_many(keys)
+
+        groups: dict[str, list[int]] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                groups.setdefault(rubric_group_key(items[i][1]), []).append(i)
+
+        for idxs in groups.values():
+            rubric = items[idxs[0]][1]
+            built, fell_back = feedback_engine.generate_batch([items[i][0] for i in idxs], rubric)
+            for i, feedback in zip(idxs, built):
+                results[i] = feedback
+                if not fell_back:
+                    feedback_cache.put(keys[i], feedback, rubric.get("id"))
+        return results
+
+
+class FeedbackBatcher:
+    """
+    Micro-batching front for generate_feedback_batch. Concurrent callers on
+    the same rubric are collected until max_batch items or max_wait seconds
+    after the first one, then generated in one call off the event loop, and
+    each caller gets its own result back.
+    """
+
+    def __init__(self, max_batch: int = FEEDBACK_BATCH_MAX, max_wait: float = FEEDBACK_BATCH_WAIT_SECONDS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._groups: dict[str, list[tuple[str, dict, asyncio.Future]]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def generate(self, submission_text: str, rubric: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        key = rubric_group_key(rubric)
+        fut = loop.create_future()
+        group = self._groups.setdefault(key, [])
+        group.append((submission_text, rubric, fut))
+        if len(group) >= self.max_batch:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await fut
+
+    def _flush(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._groups.pop(key, None)
+        if not group:
+            return
+        task = asyncio.ensure_future(self._run(group))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, group):
+        live = [g for g in group if not g[2].done()]
+        if not live:
+            return
+        self.batches += 1
+        self.items += len(live)
+        self.largest = max(self.largest, len(live))
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(
+                _engine_executor, with_context(generate_feedback_batch, [(t, r) for t, r, _ in live])
+            )
+        except Exception as e:
+            for _, _, fut in live:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, _, fut), result in zip(live, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+feedback_batcher = FeedbackBatcher()
+
+
+def stream_feedback(submission_text: str, rubric: dict):
+    """
+    Streaming counterpart of generate_feedback. Cache hits are replayed;
+    otherwise parts are yielded as they are generated and the assembled
+    result is cached once the stream completes. Non-template engines
+    answer whole documents, which are replayed the same way.
+    """
+    key = cache_key(submission_text, rubric)
+    cached = feedback_cache.get(key)
+    if cached is not None:
+        yield from iter_stored_feedback(cached)
+        return
+
+    if not feedback_engine.local:
+        results, fell_back = feedback_engine.generate_batch([submission_text], rubric)
+        if not fell_back:
+            feedback_cache.put(key, results[0], rubric.get("id"))
+        yield from iter_stored_feedback(results[0])
+        return
+
+    parts = []
+    for event, data in iter_feedback(submission_text, rubric):
+        parts.append((event, data))
+        yield event, data
+    feedback_cache.put(key, _collect(parts), rubric.get("id"))
@@ -0,0 +1,283 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from backend.db import run_read, run_write, wait_for_work
+from backend.feedback_pipeline import feedback_batcher
+from backend.rubrics import rubric_registry
+
+# workers are coroutines; generation itself is grouped by feedback_batcher
+FEEDBACK_WORKERS = int(os.getenv("FLOSENDO_FEEDBACK_WORKERS", "16"))
+FEEDBACK_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 2.0   # doubled after every failed attempt
+IDLE_POLL_SECONDS = 1.0
+ERROR_BACKOFF_SECONDS = 0.5   # worker pause after an unexpected error, doubled up to the max
+ERROR_BACKOFF_MAX_SECONDS = 30.0
+# jobs taken per write transaction; extras wait in memory for the next free worker
+CLAIM_BATCH = int(os.getenv("FLOSENDO_FEEDBACK_CLAIM_BATCH", "8"))
+
+FINISHED_STATUSES = {"done", "dead"}
+
+log = logging.getLogger(__name__)
+
+
+def enqueue_feedback_job(conn, submission_id: int) -> int:
+    """Insert a job row. Call inside the same write as the submission."""
+    now = datetime.utcnow().isoformat()
+    cur = conn.execute("""
+        INSERT INTO feedback_jobs (submission_id, status, attempts, max_attempts, run_after, created_at, updated_at)
+        VALUES (?, 'queued', 0, ?, ?, ?, ?)
+    """, (submission_id, FEEDBACK_MAX_ATTEMPTS, time.time(), now, now))
+    return cur.lastrowid
+
+
+def create_batch(conn, kind: str, rubric_id: int, created_by: str, select_sql: str, params: tuple) -> dict:
+    """
+    Writer job helper: record a batch and queue one job per submission id
+    returned by select_sql, all in the caller's transaction.
+    """
+    now = datetime.utcnow().isoformat()
+    batch_id = conn.execute(
+        "INSERT INTO feedback_batches (kind, rubric_id, created_by, created_at) VALUES (?, ?, ?, ?)",
+        (kind, rubric_id, created_by, now),
+    ).lastrowid
+    total = conn.execute(f"""
+        INSERT INTO feedback_jobs (submission_id, batch_id, status, attempts, max_attempts, run_after, created_at, updated_at)
+        SELECT id, ?, 'queued', 0, ?, ?, ?, ? FROM ({select_sql})
+    """, (batch_id, FEEDBACK_MAX_ATTEMPTS, time.time(), now, now, *params)).rowcount
+    conn.execute("UPDATE feedback_batches SET total = ? WHERE id = ?", (total, batch_id))
+    return {"batch_id": batch_id, "total": total}
+
+
+def batch_progress(conn, batch_id: int) -> dict | None:
+    batch = conn.execute("SELECT * FROM feedback_batches WHERE id = ?", (batch_id,)).fetchone()
+    if batch is None:
+        return None
+    counts = {"queued": 0, "running": 0, "done": 0, "dead": 0}
+    for r in conn.execute(
+        "SELECT status, COUNT(*) AS c FROM feedback_jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+    ):
+        counts[r["status"]] = r["c"]
+    finished = counts["done"] + counts["dead"]
+    return {
+        "batch_id": batch["id"],
+        "kind": batch["kind"],
+        "rubric_id": batch["rubric_id"],
+        "created_by": batch["created_by"],
+        "created_at": batch["created_at"],
+        "total": batch["total"],
+        **counts,
+        "progress": round(finished / batch["total"], 3) if batch["total"] else 1.0,
+        "finished": finished == batch["total"],
+    }
+
+
+def job_to_dict(row) -> dict:
+    return {
+        "job_id": row["id"],
+        "submission_id": row["submission_id"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "last_error": row["last_error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def requeue_interrupted(conn):
+    """Writer job: jobs left running by a crashed process go back on the queue."""
+    conn.execute(
+        "UPDATE feedback_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+        (datetime.utcnow().isoformat(),),
+    )
+
+
+def _claim(conn, limit: int):
+    # +run_after keeps the planner on idx_feedback_jobs_claim, whose order
+    # matches ORDER BY, instead of sorting every due job
+    rows = conn.execute("""
+        UPDATE feedback_jobs
+        SET status = 'running', attempts = attempts + 1, updated_at = ?
+        WHERE id IN (
+            SELECT id FROM feedback_jobs
+            WHERE status = 'queued' AND +run_after <= ?
+            -- single submissions go ahead of bulk batches
+            ORDER BY batch_id IS NOT NULL, id
+            LIMIT ?
+        )
+        RETURNING id, submission_id, batch_id, attempts, max_attempts
+    """, (datetime.utcnow().isoformat(), time.time(), limit)).fetchall()
+    # RETURNING order is unspecified
+    return sorted(rows, key=lambda r: (r["batch_id"] is not None, r["id"]))
+
+
+def _release(conn, ids: list[int]):
+    """Writer job: claimed jobs that never started go back, without the attempt."""
+    conn.executemany(
+        "UPDATE feedback_jobs SET status = 'queued', attempts = attempts - 1 WHERE id = ? AND status = 'running'",
+        [(i,) for i in ids],
+    )
+
+
+def _has_due(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM feedback_jobs WHERE status = 'queued' AND run_after <= ? LIMIT 1", (time.time(),)
+    ).fetchone() is not None
+
+
+def _load_inputs(conn, submission_id: int):
+    return conn.execute(
+        "SELECT submission_text, rubric_id FROM submissions WHERE id = ?", (submission_id,)
+    ).fetchone()
+
+
+class FeedbackJobQueue:
+    """
+    Runs queued feedback jobs on a fixed number of asyncio workers.
+    The jobs table is the queue, so anything queued survives a restart.
+    """
+
+    def __init__(self, workers: int = FEEDBACK_WORKERS):
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        # claimed but not yet started, handed to the next free worker
+        self._claimed: collections.deque = collections.deque()
+        self._idle = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def start(self, recover: bool = True):
+        """recover=False when another process already requeued interrupted jobs."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if recover:
+            await run_write(requeue_interrupted)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._claimed:
+            ids = [job["id"] for job in self._claimed]
+            self._claimed.clear()
+            await run_write(lambda conn: _release(conn, ids))
+
+    def notify(self):
+        """Wake an idle worker. Safe to call from any thread or loop."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _next_job(self):
+        if self._claimed:
+            return self._claimed.popleft()
+        # only as many as there are workers to start them right away, so a
+        # busy process does not sit on jobs another process could run
+        limit = max(1, min(CLAIM_BATCH, self._idle + 1))
+        jobs = await run_write(lambda conn: _claim(conn, limit))
+        if not jobs:
+            return None
+        self._claimed.extend(jobs[1:])
+        if self._claimed:
+            self._wakeup.set()
+        return jobs[0]
+
+    async def _worker(self):
+        errors = 0
+        while True:
+            job = None
+            try:
+                job = await self._next_job()
+                if job is None:
+                    self._idle += 1
+                    try:
+                        await wait_for_work(self._wakeup, _has_due, IDLE_POLL_SECONDS)
+                    finally:
+                        self._idle -= 1
+                else:
+                    await self._process(job)
+                errors = 0
+            except Exception as e:
+                # one bad job or a database hiccup must not take the worker down
+                errors += 1
+                log.exception("feedback worker error (job %s)", job["id"] if job else None)
+                if job is not None:
+                    await self._give_back(job, e)
+                await asyncio.sleep(min(ERROR_BACKOFF_SECONDS * 2 ** (errors - 1), ERROR_BACKOFF_MAX_SECONDS))
+
+    async def _process(self, job):
+        try:
+            inputs = await run_read(lambda conn: _load_inputs(conn, job["submission_id"]))
+            if inputs is None:
+                raise ValueError("Submission not found")
+            rubric = await rubric_registry.get_async(inputs["rubric_id"])
+            if rubric is None:
+                raise ValueError("Rubric not found")
+            feedback = await feedback_batcher.generate(inputs["submission_text"], rubric.feedback_input)
+        except Exception as e:
+            await run_write(lambda conn: self._fail(conn, job, e))
+            return
+
+        now = datetime.utcnow().isoformat()
+
+        def store(conn):
+            # regeneration replaces the previous feedback
+            conn.execute("DELETE FROM feedback WHERE submission_id = ?", (job["submission_id"],))
+            conn.execute(
+                "INSERT INTO feedback (submission_id, feedback_json, created_at) VALUES (?, ?, ?)",
+                (job["submission_id"], json.dumps(feedback), now),
+            )
+            conn.execute(
+                "UPDATE feedback_jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                (now, job["id"]),
+            )
+
+        await run_write(store)
+        self.completed += 1
+
+    async def _give_back(self, job, error: Exception):
+        """Retry or bury a job whose worker failed, as if the job itself had."""
+        try:
+            await run_write(lambda conn: self._fail(conn, job, error))
+        except Exception:
+            # left running; requeue_interrupted picks it up on the next start
+            log.exception("could not requeue feedback job %s", job["id"])
+
+    def _fail(self, conn, job, error: Exception):
+        now = datetime.utcnow().isoformat()
+        message = f"{type(error).__name__}: {error}"[:500]
+        if job["attempts"] >= job["max_attempts"]:
+            conn.execute(
+                "UPDATE feedback_jobs SET status = 'dead', last_error = ?, updated_at = ? WHERE id = ?",
+                (message, now, job["id"]),
+            )
+            self.dead += 1
+            return
+        delay = RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+        conn.execute(
+            "UPDATE feedback_jobs SET status = 'queued', last_error = ?, run_after = ?, updated_at = ? WHERE id = ?",
+            (message, time.time() + delay, now, job["id"]),
+        )
+        self.retried += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
+
+
+feedback_jobs = FeedbackJobQueue()
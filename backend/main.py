@@ -1,70 +1,97 @@
 from urllib import response
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from pathlib import Path
-from backend.db import init_db, get_conn
-from backend.security import verify_password, hash_password
+from backend.db import init_db, pooled_conn, get_pool, get_writer, run_read, run_write
+from backend.security import verify_password_async, hash_password_async, rehash_if_needed, password_hasher, session_secret
 import json 
 from datetime import datetime
-from backend.feedback_pipeline import generate_feedback
-from fastapi import UploadFile, File
-import os, secrets
+from backend.feedback_pipeline import feedback_cache, feedback_batcher, feedback_engine, stream_feedback, iter_stored_feedback
+from starlette.concurrency import iterate_in_threadpool
+from backend.extraction import attachment_extraction, enqueue_extraction, load_attachment_texts
+from backend.jobs import feedback_jobs, enqueue_feedback_job, job_to_dict, FINISHED_STATUSES, create_batch, batch_progress
+from contextlib import asynccontextmanager
+import asyncio
+from backend.uploads import UPLOAD_DIR, receive_upload, store_blob, release_blob, collect_garbage, storage_stats
+from backend.rubrics import rubric_registry
+from backend.analytics import analytics_reconciler, read_summary, read_breakdown
+from backend.metrics import MetricsMiddleware, register_collector, render_metrics, gauge_lines, profiler, requests_in_flight
+from backend.assets import AssetStore, if_none_match
+from backend.sessions import session_store
+from backend.outbox import email_dispatcher, enqueue_email
+from backend import ratelimit
+from backend.ratelimit import rate_limiter, client_ip
+from backend.search import search_submissions, SEARCH_PAGE_DEFAULT
+import os, secrets, re
 import hashlib
 from datetime import timedelta
-import requests
-# password reset rate limit to prevent abuse of passowrd resetting
-RESET_RATE_LIMIT_SECONDS = 20
-
-def _reset_rate_limit(request: Request):
-    last = request.session.get("reset_last_ts")
-    now = datetime.utcnow().timestamp()
-    if last and (now - last) < RESET_RATE_LIMIT_SECONDS:
-        raise HTTPException(status_code=429, detail="Too many requests. Try again shortly.")
-    request.session["reset_last_ts"] = now
-
-app = FastAPI()
-init_db()
+# set by backend.serve, which migrates, recovers interrupted work and
+# collects garbage once before starting workers
+PREPARED = os.getenv("FLOSENDO_PREPARED") == "1"
+STARTED_AT = datetime.utcnow()
+MAX_IN_FLIGHT = int(os.getenv("FLOSENDO_MAX_IN_FLIGHT", "200"))
+MAX_WRITE_QUEUE = int(os.getenv("FLOSENDO_MAX_WRITE_QUEUE", "500"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(password_hasher.calibrate)
+    if not PREPARED:
+        await run_write(lambda conn: collect_garbage(conn, UPLOAD_DIR))
+    await analytics_reconciler.start(run_now=not PREPARED)
+    await feedback_jobs.start(recover=not PREPARED)
+    await attachment_extraction.start(UPLOAD_DIR, recover=not PREPARED)
+    await email_dispatcher.start(recover=not PREPARED)
+    yield
+    await email_dispatcher.stop()
+    await attachment_extraction.stop()
+    await feedback_jobs.stop()
+    await analytics_reconciler.stop()
+
+app = FastAPI(lifespan=lifespan)
+if not PREPARED:
+    init_db()
 # --- Paths ---
 FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
-STATIC_DIR = FRONTEND_DIR / "static"
 
-UPLOAD_DIR = Path(__file__).parent.parent / "data" / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
-# NOTE: for IPD prototype this is fine. 
-app.add_middleware(SessionMiddleware, secret_key="dev-secret-change-me")
+app.add_middleware(SessionMiddleware, secret_key=session_secret())
+app.add_middleware(MetricsMiddleware)
 
 # --- Static files ---
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+assets = AssetStore(FRONTEND_DIR)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+def static_file(request: Request, path: str):
+    return assets.response(request, "/static/" + path)
+
 
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 
 # --- Pages ---
+def page(request: Request, name: str) -> Response:
+    if assets.get(name) is None:
+        return HTMLResponse(f"<h1>Error</h1><p>frontend/{name} not found.</p>")
+    return assets.response(request, name)
+
+
 @app.get("/", response_class=HTMLResponse)
-def home():
-    index_file = FRONTEND_DIR / "index.html"
-    if not index_file.exists():
-        return "<h1>Error</h1><p>frontend/index.html not found.</p>"
-    return index_file.read_text(encoding="utf-8")
+def home(request: Request):
+    return page(request, "index.html")
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_page():
-    login_file = FRONTEND_DIR / "login.html"
-    if not login_file.exists():
-        return "<h1>Error</h1><p>frontend/login.html not found.</p>"
-    return login_file.read_text(encoding="utf-8")
+def login_page(request: Request):
+    return page(request, "login.html")
 
 @app.get("/reset", response_class=HTMLResponse)
-def reset_page():
-    reset_file = FRONTEND_DIR / "reset.html"
-    if not reset_file.exists():
-        return "<h1>Error</h1><p>frontend/reset.html not found.</p>"
-    return reset_file.read_text(encoding="utf-8")
+def reset_page(request: Request):
+    return page(request, "reset.html")
 
 
 
@@ -75,20 +102,31 @@ async def login(request: Request):
     email = (body.get("email") or "").strip().lower()
     password = body.get("password") or ""
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT email, password_hash, role FROM users WHERE email = ?", (email,))
-    row = cur.fetchone()
-    conn.close()
+    # before any bcrypt work, so a flood costs one UPSERT per request
+    await rate_limiter.enforce((ratelimit.LOGIN_IP, client_ip(request)), (ratelimit.LOGIN_EMAIL, email))
+
+    row = await run_read(lambda conn: conn.execute(
+        "SELECT email, password_hash, role, pw_version FROM users WHERE email = ?", (email,)
+    ).fetchone())
 
     if not row:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    if not verify_password(password, row["password_hash"]):
+    if not await verify_password_async(password, row["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+    new_hash = await rehash_if_needed(password, row["password_hash"])
+    if new_hash:
+        # same password, so pw_version stays; skip if it changed meanwhile
+        await run_write(lambda conn: conn.execute(
+            "UPDATE users SET password_hash = ? WHERE email = ? AND password_hash = ?",
+            (new_hash, row["email"], row["password_hash"]),
+        ))
+
     request.session["user_email"] = row["email"]
     request.session["role"] = row["role"]
+    request.session["pw_version"] = row["pw_version"]
+    session_store.put(row["email"], row["role"], row["pw_version"])
 
     return {"ok": True, "role": row["role"]}
 
@@ -98,10 +136,42 @@ def logout(request: Request):
     request.session.clear()
     return {"ok": True}
 
-def require_role(request: Request, allowed_roles: set[str]):
-    role = request.session.get("role")
-    if role is None:
+def _session_email(request: Request) -> str:
+    email = request.session.get("user_email")
+    if not email:
         raise HTTPException(status_code=401, detail="Not logged in")
+    return email
+
+def _session_user(request: Request, email: str, user: tuple[str, int] | None) -> dict:
+    if user is None or user[1] != request.session.get("pw_version"):
+        request.session.clear()
+        raise HTTPException(status_code=401, detail="Session expired, please log in again")
+    if request.session.get("role") != user[0]:
+        request.session["role"] = user[0]
+    return {"email": email, "role": user[0]}
+
+def current_user(request: Request) -> dict:
+    """
+    The signed cookie names the user; role and password version come from
+    the session store, so demotions and password changes apply to sessions
+    that already exist. Blocking on a store miss; async handlers use
+    current_user_async.
+    """
+    email = _session_email(request)
+    return _session_user(request, email, session_store.resolve(email))
+
+async def current_user_async(request: Request) -> dict:
+    email = _session_email(request)
+    return _session_user(request, email, await session_store.resolve_async(email))
+
+def require_role(request: Request, allowed_roles: set[str]):
+    role = current_user(request)["role"]
+    if role not in allowed_roles:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return role
+
+async def require_role_async(request: Request, allowed_roles: set[str]):
+    role = (await current_user_async(request))["role"]
     if role not in allowed_roles:
         raise HTTPException(status_code=403, detail="Forbidden")
     return role
@@ -109,15 +179,12 @@ def require_role(request: Request, allowed_roles: set[str]):
 @app.get("/auth/change-password", response_class=HTMLResponse)
 def change_password_page(request: Request):
     require_role(request, {"student", "teacher", "admin"})
-    file = FRONTEND_DIR / "change_password.html"
-    if not file.exists():
-        return "<h1>Error</h1><p>frontend/change_password.html not found.</p>"
-    return file.read_text(encoding="utf-8")
+    return page(request, "change_password.html")
 
 
 @app.post("/auth/change-password")
 async def change_password(request: Request):
-    require_role(request, {"student", "teacher", "admin"})
+    await require_role_async(request, {"student", "teacher", "admin"})
     body = await request.json()
 
     current_password = body.get("current_password") or ""
@@ -127,19 +194,23 @@ async def change_password(request: Request):
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
 
     email = request.session.get("user_email")
+    await rate_limiter.enforce((ratelimit.PASSWORD_CHANGE_EMAIL, email))
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT password_hash FROM users WHERE email = ?", (email,))
-    row = cur.fetchone()
+    row = await run_read(lambda conn: conn.execute(
+        "SELECT password_hash FROM users WHERE email = ?", (email,)
+    ).fetchone())
 
-    if not row or not verify_password(current_password, row["password_hash"]):
-        conn.close()
+    if not row or not await verify_password_async(current_password, row["password_hash"]):
         raise HTTPException(status_code=401, detail="Current password is incorrect")
 
-    cur.execute("UPDATE users SET password_hash = ? WHERE email = ?", (hash_password(new_password), email))
-    conn.commit()
-    conn.close()
+    pw_hash = await hash_password_async(new_password)
+    row = await run_write(lambda conn: conn.execute(
+        "UPDATE users SET password_hash = ?, pw_version = pw_version + 1 WHERE email = ? RETURNING pw_version",
+        (pw_hash, email),
+    ).fetchone())
+    session_store.invalidate(email)
+    # other sessions of this user are logged out; this one stays in
+    request.session["pw_version"] = row["pw_version"]
 
     return {"ok": True}
 
@@ -162,49 +233,29 @@ RESET_TOKEN_MINUTES = 30
 def sha256_hex(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
-def send_reset_email(to_email: str, reset_url: str):
-    api_key = os.getenv("RESEND_API_KEY")
-    if not api_key:
-        raise ValueError("Missing RESEND_API_KEY")
-
-    response = requests.post(
-        "https://api.resend.com/emails",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "from": "onboarding@resend.dev",
-            "to": [to_email],
-            "subject": "Password Reset Request",
-            "html": f"""
-                <p>You requested a password reset.</p>
-                <p><a href="{reset_url}">Reset Password</a></p>
-                <p>This link expires in 15-30 minutes.</p>
-            """,
-        },
-    )
-    if response.status_code >= 400:
-        raise Exception(f"Email failed: {response.text}")
+def reset_email_html(reset_url: str) -> str:
+    return f"""
+        <p>You requested a password reset.</p>
+        <p><a href="{reset_url}">Reset Password</a></p>
+        <p>This link expires in 15-30 minutes.</p>
+    """
 
 
 @app.post("/auth/forgot")
 async def forgot_password(request: Request):
-    _reset_rate_limit(request)
     body = await request.json()
     email = (body.get("email") or "").strip().lower()
+    await rate_limiter.enforce((ratelimit.FORGOT_IP, client_ip(request)), (ratelimit.FORGOT_EMAIL, email))
 
     
     if not email or "@" not in email:
         return {"ok": True, "reset_url": None}
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT email FROM users WHERE email = ?", (email,))
-    row = cur.fetchone()
+    row = await run_read(lambda conn: conn.execute(
+        "SELECT email FROM users WHERE email = ?", (email,)
+    ).fetchone())
 
     if not row:
-        conn.close()
         return {"ok": True, "reset_url": None}
 
     # Create token
@@ -214,20 +265,20 @@ async def forgot_password(request: Request):
     now = datetime.utcnow()
     expires_at = (now + timedelta(minutes=RESET_TOKEN_MINUTES)).isoformat()
 
-    cur.execute("""
-        INSERT INTO password_reset_tokens (user_email, token_hash, expires_at, used_at, created_at)
-        VALUES (?, ?, ?, NULL, ?)
-    """, (email, token_hash, expires_at, now.isoformat()))
-    conn.commit()
-    conn.close()
-
     # returns reset link via email
     base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000").rstrip("/")
     reset_url = f"{base_url}/reset?token={token}"
-    try:
-     send_reset_email(email, reset_url)
-    except Exception as e:
-     print("EMAIL ERROR:", e)
+
+    def write(conn):
+        conn.execute("""
+            INSERT INTO password_reset_tokens (user_email, token_hash, expires_at, used_at, created_at)
+            VALUES (?, ?, ?, NULL, ?)
+        """, (email, token_hash, expires_at, now.isoformat()))
+        # sent by the dispatcher; the request never waits on the provider
+        enqueue_email(conn, email, "Password Reset Request", reset_email_html(reset_url))
+
+    await run_write(write)
+    email_dispatcher.notify()
     return {"ok": True}
 
 
@@ -243,142 +294,167 @@ async def reset_password(request: Request):
         raise HTTPException(status_code=400, detail="Missing token")
     if len(new_password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
+    await rate_limiter.enforce((ratelimit.RESET_IP, client_ip(request)))
 
     token_hash = sha256_hex(token)
     now = datetime.utcnow()
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
+    t = await run_read(lambda conn: conn.execute("""
         SELECT id, user_email, expires_at, used_at
         FROM password_reset_tokens
         WHERE token_hash = ?
         ORDER BY id DESC
         LIMIT 1
-    """, (token_hash,))
-    t = cur.fetchone()
+    """, (token_hash,)).fetchone())
 
     if not t:
-        conn.close()
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
     if t["used_at"]:
-        conn.close()
         raise HTTPException(status_code=400, detail="Token already used")
 
     expires_at = datetime.fromisoformat(t["expires_at"])
     if now > expires_at:
-        conn.close()
         raise HTTPException(status_code=400, detail="Token expired")
 
     # Update password + mark token used
-    pw_hash = hash_password(new_password)
+    pw_hash = await hash_password_async(new_password)
+
+    def write(conn):
+        cur = conn.execute(
+            "UPDATE password_reset_tokens SET used_at = ? WHERE id = ? AND used_at IS NULL",
+            (now.isoformat(), t["id"]),
+        )
+        # another request used the token while we were hashing
+        if cur.rowcount != 1:
+            raise HTTPException(status_code=400, detail="Token already used")
+        conn.execute(
+            "UPDATE users SET password_hash = ?, pw_version = pw_version + 1 WHERE email = ?",
+            (pw_hash, t["user_email"]),
+        )
 
-    cur.execute("UPDATE users SET password_hash = ? WHERE email = ?", (pw_hash, t["user_email"]))
-    cur.execute("UPDATE password_reset_tokens SET used_at = ? WHERE id = ?", (now.isoformat(), t["id"]))
-    conn.commit()
-    conn.close()
+    await run_write(write)
+    session_store.invalidate(t["user_email"])
 
     return {"ok": True}
 
 @app.post("/api/uploads")
-async def upload_file(request: Request, file: UploadFile = File(...)):
+async def upload_file(request: Request):
     ALLOWED_EXT = {".pdf", ".docx", ".pptx", ".txt", ".png", ".jpg", ".jpeg"}
 
-    ext = Path(file.filename).suffix.lower()
-    if ext not in ALLOWED_EXT:
-        raise HTTPException(status_code=400, detail=f"File extension not allowed: {ext}")
-
-    # ...rest of your upload logic...
-
-    role = require_role(request, {"student", "teacher", "admin"})
+    role = await require_role_async(request, {"student", "teacher", "admin"})
     email = request.session.get("user_email")
 
-    if file.content_type not in ALLOWED_TYPES:
-        raise HTTPException(status_code=400, detail=f"File type not allowed: {file.content_type}")
-
-    contents = await file.read()
-    size_bytes = len(contents)
-    if size_bytes > MAX_UPLOAD_MB * 1024 * 1024:
-        raise HTTPException(status_code=400, detail=f"File too large (max {MAX_UPLOAD_MB}MB)")
+    # runs on the part headers, before any file bytes are stored
+    def validate(filename: str, content_type: str):
+        ext = Path(filename).suffix.lower()
+        if ext not in ALLOWED_EXT:
+            raise HTTPException(status_code=400, detail=f"File extension not allowed: {ext}")
+        if content_type not in ALLOWED_TYPES:
+            raise HTTPException(status_code=400, detail=f"File type not allowed: {content_type}")
 
-    ext = Path(file.filename).suffix.lower()
-    stored_name = f"{secrets.token_hex(16)}{ext}"
-    save_path = UPLOAD_DIR / stored_name
-
-    with open(save_path, "wb") as f:
-        f.write(contents)
+    upload = await receive_upload(request, UPLOAD_DIR, MAX_UPLOAD_MB * 1024 * 1024, validate)
+    filename = upload["filename"]
+    content_type = upload["content_type"]
+    size_bytes = upload["size_bytes"]
 
+    ext = Path(filename).suffix.lower()
     now = datetime.utcnow().isoformat()
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO uploads (user_email, role, original_name, stored_name, content_type, size_bytes, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (email, role, file.filename, stored_name, file.content_type, size_bytes, now))
-    upload_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    # identical content is stored once and shared between upload rows
+    def write(conn):
+        stored_name, _ = store_blob(conn, upload, ext, UPLOAD_DIR)
+        upload_id = conn.execute("""
+            INSERT INTO uploads (user_email, role, original_name, stored_name, content_type, size_bytes, created_at, blob_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (email, role, filename, stored_name, content_type, size_bytes, now, upload["sha256"])).lastrowid
+        # text is extracted once per blob in the background
+        enqueue_extraction(conn, upload["sha256"], stored_name, content_type)
+        return upload_id
+
+    try:
+        upload_id = await run_write(write)
+    finally:
+        # still there if the content was already stored (or the write failed)
+        upload["temp_path"].unlink(missing_ok=True)
+    attachment_extraction.notify()
 
     return {
         "ok": True,
         "upload_id": upload_id,
-        "filename": file.filename,
-        "content_type": file.content_type,
+        "filename": filename,
+        "content_type": content_type,
         "size_bytes": size_bytes
     }
 
 
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(request: Request, upload_id: int):
+    role = await require_role_async(request, {"student", "teacher", "admin"})
+    email = request.session.get("user_email")
+
+    def write(conn):
+        row = conn.execute(
+            "SELECT user_email, submission_id, stored_name, blob_sha256 FROM uploads WHERE id = ?", (upload_id,)
+        ).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if role != "admin" and row["user_email"] != email:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        if row["submission_id"] is not None:
+            raise HTTPException(status_code=400, detail="Upload is attached to a submission")
+        conn.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+        if row["blob_sha256"]:
+            release_blob(conn, row["blob_sha256"])
+            return None
+        return row["stored_name"]
+
+    legacy_name = await run_write(write)
+    if legacy_name:
+        (UPLOAD_DIR / legacy_name).unlink(missing_ok=True)
+
+    return {"ok": True}
+
+
 
 
 @app.get("/auth/me")
 def me(request: Request):
-    email = request.session.get("user_email")
-    role = request.session.get("role")
-    if not email or not role:
-        raise HTTPException(status_code=401, detail="Not logged in")
-    return {"email": email, "role": role}
+    return current_user(request)
 @app.get("/student", response_class=HTMLResponse)
 def student_dashboard(request: Request):
     require_role(request, {"student"})
-    file = FRONTEND_DIR / "student.html"
-    return file.read_text(encoding="utf-8")
+    return page(request, "student.html")
 
 
 @app.get("/teacher", response_class=HTMLResponse)
 def teacher_dashboard(request: Request):
     require_role(request, {"teacher"})
-    file = FRONTEND_DIR / "teacher.html"
-    return file.read_text(encoding="utf-8")
+    return page(request, "teacher.html")
 
 
 @app.get("/admin", response_class=HTMLResponse)
 def admin_dashboard(request: Request):
     require_role(request, {"admin"})
-    file = FRONTEND_DIR / "admin.html"
-    return file.read_text(encoding="utf-8")
+    return page(request, "admin.html")
 
 @app.get("/admin/users", response_class=HTMLResponse)
 def admin_users_page(request: Request):
     require_role(request, {"admin"})
-    file = FRONTEND_DIR / "admin_users.html"
-    return file.read_text(encoding="utf-8")
+    return page(request, "admin_users.html")
 @app.get("/api/admin/users")
 def list_users(request: Request):
     require_role(request, {"admin"})
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT email, role FROM users ORDER BY email ASC")
-    rows = cur.fetchall()
-    conn.close()
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT email, role FROM users ORDER BY email ASC")
+        rows = cur.fetchall()
     return {"users": [{"email": r["email"], "role": r["role"]} for r in rows]}
 
 
 @app.post("/api/admin/users")
 async def create_user(request: Request):
-    require_role(request, {"admin"})
+    await require_role_async(request, {"admin"})
     body = await request.json()
 
     email = (body.get("email") or "").strip().lower()
@@ -392,41 +468,71 @@ async def create_user(request: Request):
     if len(password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
 
-    pw_hash = hash_password(password)
+    pw_hash = await hash_password_async(password)
 
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute(
+        await run_write(lambda conn: conn.execute(
             "INSERT INTO users (email, password_hash, role) VALUES (?, ?, ?)",
             (email, pw_hash, role),
-        )
-        conn.commit()
-        conn.close()
+        ))
     except Exception:
         raise HTTPException(status_code=400, detail="User already exists or database error")
 
     return {"ok": True}
 
+
+@app.post("/api/admin/users/role")
+async def change_user_role(request: Request):
+    await require_role_async(request, {"admin"})
+    body = await request.json()
+
+    email = (body.get("email") or "").strip().lower()
+    role = (body.get("role") or "").strip().lower()
+
+    if role not in {"student", "teacher", "admin"}:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if email == request.session.get("user_email"):
+        raise HTTPException(status_code=400, detail="You cannot change your own role")
+
+    updated = await run_write(lambda conn: conn.execute(
+        "UPDATE users SET role = ? WHERE email = ?", (role, email)
+    ).rowcount)
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    session_store.invalidate(email)
+
+    return {"ok": True}
+
 # Rubrics & Submissions 
 
+def etag_response(request: Request, etag: str, payload) -> Response:
+    """JSON with an ETag, or a bare 304 when the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
 @app.get("/api/rubrics")
 def get_rubrics(request: Request):
     # Any logged in user can fetch rubrics
     require_role(request, {"student", "teacher", "admin"})
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, title FROM rubrics ORDER BY id DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return {"rubrics": [{"id": r["id"], "title": r["title"]} for r in rows]}
+    etag, listing = rubric_registry.listing()
+    return etag_response(request, etag, listing)
 
 
+@app.get("/api/rubrics/{rubric_id}")
+def get_rubric(request: Request, rubric_id: int):
+    require_role(request, {"student", "teacher", "admin"})
+    rubric = rubric_registry.get(rubric_id)
+    if rubric is None:
+        raise HTTPException(status_code=404, detail="Rubric not found")
+    return etag_response(request, rubric.etag, rubric.detail)
 
 
 @app.post("/api/submissions")
 async def create_submission(request: Request):
-    require_role(request, {"student"})
+    await require_role_async(request, {"student"})
     body = await request.json()
 
     rubric_id = body.get("rubric_id")
@@ -441,76 +547,292 @@ async def create_submission(request: Request):
     if len(submission_text) < 20:
         raise HTTPException(status_code=400, detail="Submission text must be at least 20 characters")
 
-    # Load rubric criteria
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT criteria_json FROM rubrics WHERE id = ?", (rubric_id,))
-    r = cur.fetchone()
-    if not r:
-        conn.close()
+    # Rubric must exist; its criteria are loaded by the feedback job
+    if await rubric_registry.get_async(rubric_id) is None:
         raise HTTPException(status_code=404, detail="Rubric not found")
-    criteria = json.loads(r["criteria_json"])
 
-    # Insert submission
     email = request.session.get("user_email")
     now = datetime.utcnow().isoformat()
-    cur.execute(
-        "INSERT INTO submissions (user_email, rubric_id, submission_text, created_at) VALUES (?, ?, ?, ?)",
-        (email, rubric_id, submission_text, now),
-    )
-    submission_id = cur.lastrowid
 
-    # Link attachments to this submission if any and links to same user
-    if attachment_ids:
-        placeholders = ",".join(["?"] * len(attachment_ids))
+    def write(conn):
+        # Insert submission
+        cur = conn.cursor()
         cur.execute(
-            f"""
-            UPDATE uploads
-            SET submission_id = ?
-            WHERE id IN ({placeholders})
-              AND user_email = ?
-            """,
-            (submission_id, *attachment_ids, email),
+            "INSERT INTO submissions (user_email, rubric_id, submission_text, created_at) VALUES (?, ?, ?, ?)",
+            (email, rubric_id, submission_text, now),
         )
+        submission_id = cur.lastrowid
 
-        if cur.rowcount != len(attachment_ids):
-            raise HTTPException(status_code=403, detail="One or more attachments not found / not yours")
+        # Link attachments to this submission if any and links to same user
+        if attachment_ids:
+            placeholders = ",".join(["?"] * len(attachment_ids))
+            cur.execute(
+                f"""
+                UPDATE uploads
+                SET submission_id = ?
+                WHERE id IN ({placeholders})
+                  AND user_email = ?
+                """,
+                (submission_id, *attachment_ids, email),
+            )
 
-    # Generate and store feedback
-    rubric_data = {"criteria": criteria}
-    feedback = generate_feedback(submission_text, rubric_data)
-    cur.execute(
-        "INSERT INTO feedback (submission_id, feedback_json, created_at) VALUES (?, ?, ?)",
-        (submission_id, json.dumps(feedback), now),
-    )
+            if cur.rowcount != len(attachment_ids):
+                raise HTTPException(status_code=403, detail="One or more attachments not found / not yours")
 
-    conn.commit()
-    conn.close()
+        # Feedback is generated by the job queue, not in this request
+        job_id = enqueue_feedback_job(conn, submission_id)
+        return submission_id, job_id
 
-    return {"ok": True, "submission_id": submission_id, "attachment_ids": attachment_ids}
+    submission_id, job_id = await run_write(write)
+    feedback_jobs.notify()
 
+    return {"ok": True, "submission_id": submission_id, "job_id": job_id, "attachment_ids": attachment_ids}
 
-@app.get("/api/submissions/me")
-def my_submissions(request: Request):
-    require_role(request, {"student"})
+
+BATCH_MAX_SUBMISSIONS = 1000
+
+@app.post("/api/teacher/submissions/batch")
+async def create_submission_batch(request: Request):
+    """Import a class set in one transaction; feedback is queued as one batch."""
+    await require_role_async(request, {"teacher", "admin"})
+    body = await request.json()
+
+    rubric_id = body.get("rubric_id")
+    items = body.get("submissions")
+    if not rubric_id:
+        raise HTTPException(status_code=400, detail="rubric_id is required")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="submissions must be a non-empty list")
+    if len(items) > BATCH_MAX_SUBMISSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_SUBMISSIONS} submissions per batch")
+
+    rows = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail=f"submissions[{i}] must be an object")
+        email = (item.get("student_email") or "").strip().lower()
+        text = (item.get("submission_text") or "").strip()
+        if not email:
+            raise HTTPException(status_code=400, detail=f"submissions[{i}]: student_email is required")
+        if len(text) < 20:
+            raise HTTPException(status_code=400, detail=f"submissions[{i}]: text must be at least 20 characters")
+        rows.append((email, text))
+
+    emails = sorted({e for e, _ in rows})
+
+    if await rubric_registry.get_async(rubric_id) is None:
+        raise HTTPException(status_code=404, detail="Rubric not found")
+    known = await run_read(lambda conn: {r["email"] for r in conn.execute(
+        f"SELECT email FROM users WHERE role = 'student' AND email IN ({','.join(['?'] * len(emails))})", emails
+    )})
+    unknown = [e for e in emails if e not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown student(s): {', '.join(unknown[:10])}")
+
+    creator = request.session.get("user_email")
+    now = datetime.utcnow().isoformat()
+
+    def write(conn):
+        ids = [conn.execute(
+            "INSERT INTO submissions (user_email, rubric_id, submission_text, created_at) VALUES (?, ?, ?, ?)",
+            (email, rubric_id, text, now),
+        ).lastrowid for email, text in rows]
+        return create_batch(conn, "import", rubric_id, creator,
+                            "SELECT value AS id FROM json_each(?) ORDER BY key", (json.dumps(ids),))
+
+    batch = await run_write(write)
+    feedback_jobs.notify()
+    return {"ok": True, **batch}
+
+
+@app.post("/api/admin/rubrics/{rubric_id}/regenerate")
+async def regenerate_rubric_feedback(request: Request, rubric_id: int):
+    """Queue fresh feedback for every submission on a rubric, e.g. after editing it."""
+    await require_role_async(request, {"admin"})
+    creator = request.session.get("user_email")
+
+    def write(conn):
+        if not conn.execute("SELECT id FROM rubrics WHERE id = ?", (rubric_id,)).fetchone():
+            raise HTTPException(status_code=404, detail="Rubric not found")
+        return create_batch(conn, "regenerate", rubric_id, creator,
+                            "SELECT id FROM submissions WHERE rubric_id = ?", (rubric_id,))
+
+    batch = await run_write(write)
+    feedback_jobs.notify()
+    return {"ok": True, **batch}
+
+
+@app.get("/api/batches/{batch_id}")
+def get_batch(request: Request, batch_id: int):
+    role = require_role(request, {"teacher", "admin"})
+    with pooled_conn() as conn:
+        progress = batch_progress(conn, batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if role != "admin" and progress["created_by"] != request.session.get("user_email"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return progress
+
+
+JOB_EVENTS_POLL_SECONDS = 0.5
+JOB_EVENTS_MAX_SECONDS = 120
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _load_job(conn, job_id: int):
+    return conn.execute("""
+        SELECT j.*, s.user_email
+        FROM feedback_jobs j
+        JOIN submissions s ON s.id = j.submission_id
+        WHERE j.id = ?
+    """, (job_id,)).fetchone()
+
+async def _get_job_for(request: Request, job_id: int):
+    role = await require_role_async(request, {"student", "teacher", "admin"})
+    job = await run_read(lambda conn: _load_job(conn, job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Students can only see jobs for their own submissions
+    if role == "student" and job["user_email"] != request.session.get("user_email"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(request: Request, job_id: int):
+    job = await _get_job_for(request, job_id)
+    return job_to_dict(job)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: int):
+    job = await _get_job_for(request, job_id)
+
+    async def stream():
+        current = job
+        last_status = None
+        deadline = asyncio.get_running_loop().time() + JOB_EVENTS_MAX_SECONDS
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield sse_event("status", job_to_dict(current))
+            if last_status in FINISHED_STATUSES:
+                return
+            if await request.is_disconnected() or asyncio.get_running_loop().time() > deadline:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+            current = await run_read(lambda conn: _load_job(conn, job_id))
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/api/submissions/{submission_id}/feedback/stream")
+async def stream_submission_feedback(request: Request, submission_id: int):
+    role = await require_role_async(request, {"student", "teacher", "admin"})
     email = request.session.get("user_email")
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT s.id, s.created_at, r.title as rubric_title
+    def load(conn):
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT user_email, submission_text, rubric_id
+            FROM submissions
+            WHERE id = ?
+        """, (submission_id,))
+        s = cur.fetchone()
+        if not s:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        # Students can only view their own
+        if role == "student" and s["user_email"] != email:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        cur.execute("SELECT feedback_json FROM feedback WHERE submission_id = ?", (submission_id,))
+        return s, cur.fetchone()
+
+    s, f = await run_read(load)
+
+    if f:
+        parts = iter_stored_feedback(json.loads(f["feedback_json"]))
+    else:
+        # not stored yet: generate live, the job will pick the result up from the cache
+        rubric = await rubric_registry.get_async(s["rubric_id"])
+        if rubric is None:
+            raise HTTPException(status_code=404, detail="Rubric not found")
+        parts = stream_feedback(s["submission_text"], rubric.feedback_input)
+
+    async def stream():
+        # pulled one part at a time, so a slow client holds back generation
+        async for event, data in iterate_in_threadpool(parts):
+            if await request.is_disconnected():
+                return
+            yield sse_event(event, data)
+        yield sse_event("done", {"submission_id": submission_id})
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+SUBMISSIONS_PAGE_DEFAULT = 50
+SUBMISSIONS_PAGE_MAX = 200
+
+def list_submissions_page(conn, *, limit: int, cursor: int | None = None, student: str | None = None,
+                          rubric_id: int | None = None, date_from: str | None = None,
+                          date_to: str | None = None, flagged: bool | None = None) -> dict:
+    """
+    Keyset page of submissions, newest first. cursor is the last id of the
+    previous page; date_to is inclusive of that whole day.
+    """
+    limit = max(1, min(limit, SUBMISSIONS_PAGE_MAX))
+    where, params = [], []
+    if cursor is not None:
+        where.append("s.id < ?")
+        params.append(cursor)
+    if student:
+        where.append("s.user_email = ?")
+        params.append(student.strip().lower())
+    if rubric_id is not None:
+        where.append("s.rubric_id = ?")
+        params.append(rubric_id)
+    if date_from:
+        where.append("s.created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("s.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    if flagged is not None:
+        where.append("COALESCE(tr.flagged, 0) = ?")
+        params.append(1 if flagged else 0)
+
+    rows = conn.execute(f"""
+        SELECT s.id, s.user_email, s.created_at, r.title as rubric_title, COALESCE(tr.flagged, 0) as flagged
         FROM submissions s
         JOIN rubrics r ON r.id = s.rubric_id
-        WHERE s.user_email = ?
+        LEFT JOIN teacher_reviews tr ON tr.submission_id = s.id
+        {"WHERE " + " AND ".join(where) if where else ""}
         ORDER BY s.id DESC
-    """, (email,))
-    rows = cur.fetchall()
-    conn.close()
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {"rows": rows, "next_cursor": rows[-1]["id"] if has_more else None}
+
+
+@app.get("/api/submissions/me")
+def my_submissions(request: Request, limit: int = SUBMISSIONS_PAGE_DEFAULT, cursor: int | None = None,
+                   rubric_id: int | None = None, date_from: str | None = None, date_to: str | None = None):
+    require_role(request, {"student"})
+    email = request.session.get("user_email")
+
+    with pooled_conn() as conn:
+        result = list_submissions_page(conn, limit=limit, cursor=cursor, student=email, rubric_id=rubric_id,
+                                       date_from=date_from, date_to=date_to)
 
     return {"submissions": [
         {"id": row["id"], "created_at": row["created_at"], "rubric_title": row["rubric_title"]}
-        for row in rows
-    ]}
+        for row in result["rows"]
+    ], "next_cursor": result["next_cursor"]}
+
 
 
 @app.get("/api/submissions/{submission_id}")
@@ -518,28 +840,25 @@ def get_submission(request: Request, submission_id: int):
     role = require_role(request, {"student", "teacher", "admin"})
     email = request.session.get("user_email")
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT s.id, s.user_email, s.submission_text, s.created_at, r.title as rubric_title
-        FROM submissions s
-        JOIN rubrics r ON r.id = s.rubric_id
-        WHERE s.id = ?
-    """, (submission_id,))
-    s = cur.fetchone()
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT s.id, s.user_email, s.submission_text, s.created_at, r.title as rubric_title
+            FROM submissions s
+            JOIN rubrics r ON r.id = s.rubric_id
+            WHERE s.id = ?
+        """, (submission_id,))
+        s = cur.fetchone()
 
-    if not s:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Submission not found")
+        if not s:
+            raise HTTPException(status_code=404, detail="Submission not found")
 
-    # Students can only view their own
-    if role == "student" and s["user_email"] != email:
-        conn.close()
-        raise HTTPException(status_code=403, detail="Forbidden")
+        # Students can only view their own
+        if role == "student" and s["user_email"] != email:
+            raise HTTPException(status_code=403, detail="Forbidden")
 
-    cur.execute("SELECT feedback_json FROM feedback WHERE submission_id = ?", (submission_id,))
-    f = cur.fetchone()
-    conn.close()
+        cur.execute("SELECT feedback_json FROM feedback WHERE submission_id = ?", (submission_id,))
+        f = cur.fetchone()
 
     feedback = json.loads(f["feedback_json"]) if f else None
 
@@ -554,35 +873,41 @@ def get_submission(request: Request, submission_id: int):
 
 
 @app.get("/api/teacher/submissions")
-def teacher_submissions(request: Request):
+def teacher_submissions(request: Request, limit: int = SUBMISSIONS_PAGE_DEFAULT, cursor: int | None = None,
+                        student: str | None = None, rubric_id: int | None = None, date_from: str | None = None,
+                        date_to: str | None = None, flagged: bool | None = None):
     require_role(request, {"teacher", "admin"})
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT s.id, s.user_email, s.created_at, r.title as rubric_title
-        FROM submissions s
-        JOIN rubrics r ON r.id = s.rubric_id
-        ORDER BY s.id DESC
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    with pooled_conn() as conn:
+        result = list_submissions_page(conn, limit=limit, cursor=cursor, student=student, rubric_id=rubric_id,
+                                       date_from=date_from, date_to=date_to, flagged=flagged)
 
     return {"submissions": [
-        {"id": row["id"], "user_email": row["user_email"], "created_at": row["created_at"], "rubric_title": row["rubric_title"]}
-        for row in rows
-    ]}
+        {"id": row["id"], "user_email": row["user_email"], "created_at": row["created_at"],
+         "rubric_title": row["rubric_title"], "flagged": row["flagged"]}
+        for row in result["rows"]
+    ], "next_cursor": result["next_cursor"]}
+
+
+@app.get("/api/teacher/search")
+def teacher_search(request: Request, q: str, limit: int = SEARCH_PAGE_DEFAULT, offset: int = 0,
+                   student: str | None = None, rubric_id: int | None = None):
+    require_role(request, {"teacher", "admin"})
+
+    with pooled_conn() as conn:
+        return search_submissions(conn, q, limit=limit, offset=offset, student=student, rubric_id=rubric_id)
+
+
 @app.get("/api/teacher/review/{submission_id}")
 def get_teacher_review(request: Request, submission_id: int):
     require_role(request, {"teacher", "admin"})
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT submission_id, flagged, note, updated_at FROM teacher_reviews WHERE submission_id = ?",
-        (submission_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT submission_id, flagged, note, updated_at FROM teacher_reviews WHERE submission_id = ?",
+            (submission_id,),
+        )
+        row = cur.fetchone()
 
     if not row:
         return {"submission_id": submission_id, "flagged": 0, "note": "", "updated_at": None}
@@ -597,7 +922,7 @@ def get_teacher_review(request: Request, submission_id: int):
 
 @app.post("/api/teacher/review/{submission_id}")
 async def save_teacher_review(request: Request, submission_id: int):
-    require_role(request, {"teacher", "admin"})
+    await require_role_async(request, {"teacher", "admin"})
     body = await request.json()
 
     flagged = 1 if body.get("flagged") else 0
@@ -607,18 +932,14 @@ async def save_teacher_review(request: Request, submission_id: int):
 
     now = datetime.utcnow().isoformat()
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
+    await run_write(lambda conn: conn.execute("""
         INSERT INTO teacher_reviews (submission_id, flagged, note, updated_at)
         VALUES (?, ?, ?, ?)
         ON CONFLICT(submission_id) DO UPDATE SET
           flagged=excluded.flagged,
           note=excluded.note,
           updated_at=excluded.updated_at
-    """, (submission_id, flagged, note, now))
-    conn.commit()
-    conn.close()
+    """, (submission_id, flagged, note, now)))
 
     return {"ok": True}
 
@@ -629,51 +950,174 @@ async def save_teacher_review(request: Request, submission_id: int):
 @app.get("/api/admin/analytics")
 def admin_analytics(request: Request):
     require_role(request, {"admin"})
-    conn = get_conn()
-    cur = conn.cursor()
+    with pooled_conn() as conn:
+        return read_summary(conn)
 
-    cur.execute("SELECT COUNT(*) as c FROM users")
-    users_count = cur.fetchone()["c"]
 
-    cur.execute("SELECT COUNT(*) as c FROM submissions")
-    submissions_count = cur.fetchone()["c"]
+@app.get("/api/admin/analytics/breakdown")
+def admin_analytics_breakdown(request: Request, days: int = 30):
+    require_role(request, {"admin"})
+    days = max(1, min(days, 366))
+    with pooled_conn() as conn:
+        return read_breakdown(conn, days=days)
 
-    cur.execute("""
-        SELECT r.title, COUNT(*) as c
-        FROM submissions s
-        JOIN rubrics r ON r.id = s.rubric_id
-        GROUP BY r.title
-        ORDER BY c DESC
-        LIMIT 1
-    """)
-    top = cur.fetchone()
-    top_rubric = {"title": top["title"], "count": top["c"]} if top else None
 
-    conn.close()
+@app.post("/api/admin/analytics/reconcile")
+async def admin_analytics_reconcile(request: Request):
+    await require_role_async(request, {"admin"})
+    result = await analytics_reconciler.run_once()
+    return {"ok": True, **result, "reconciler": analytics_reconciler.stats()}
 
-    return {
-        "users_count": users_count,
-        "submissions_count": submissions_count,
-        "top_rubric": top_rubric
+
+# --- Metrics ---
+METRICS_TOKEN = os.getenv("FLOSENDO_METRICS_TOKEN")
+
+def _runtime_gauges() -> list[str]:
+    pool = get_pool().stats()
+    return (
+        gauge_lines("flosendo_db_pool", "Connection pool state.", pool)
+        + gauge_lines("flosendo_db_writer", "Write queue state.", get_writer().stats())
+        + gauge_lines("flosendo_feedback_jobs", "Feedback job worker counters.", feedback_jobs.stats())
+        + gauge_lines("flosendo_feedback_cache", "Feedback cache counters.", feedback_cache.stats())
+        + gauge_lines("flosendo_feedback_batcher", "Feedback micro-batching.", feedback_batcher.stats())
+        + gauge_lines("flosendo_rubric_registry", "In-memory rubric registry.",
+                      {k: v or 0 for k, v in rubric_registry.stats().items()})
+        + gauge_lines("flosendo_session_store", "Session resolution cache.", session_store.stats())
+        + gauge_lines("flosendo_email_dispatcher", "Email outbox dispatcher.", email_dispatcher.stats())
+        + gauge_lines("flosendo_rate_limiter", "Auth rate limiting.", rate_limiter.stats())
+        + gauge_lines("flosendo_requests_in_flight", "Requests in progress in this worker.",
+                      {"current": requests_in_flight.value, "peak": requests_in_flight.peak, "max": MAX_IN_FLIGHT})
+        + gauge_lines("flosendo_password_hashing", "Password hashing parameters.",
+                      {k: v for k, v in password_hasher.stats().items() if isinstance(v, (int, float))})
+        + gauge_lines("flosendo_feedback_engine", "Feedback engine guard counters.",
+                      {k: v for k, v in feedback_engine.stats().items() if isinstance(v, (int, float))})
+        + gauge_lines("flosendo_profiler", "Slow request profiler.", {"enabled": int(profiler.enabled), "dumps": profiler.dumps})
+    )
+
+register_collector(_runtime_gauges)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    # scrapers have no session; guard with a bearer token when one is configured
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authorised")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+def liveness():
+    """The worker is up and its event loop answers."""
+    return {"ok": True, "pid": os.getpid(), "uptime_s": round((datetime.utcnow() - STARTED_AT).total_seconds())}
+
+
+@app.get("/readyz")
+async def readiness():
+    """
+    Whether this worker should get traffic: the db answers and the worker is
+    not saturated. Answers 503 otherwise, so a balancer can route around it.
+    """
+    start = asyncio.get_running_loop().time()
+    await asyncio.sleep(0)
+    loop_lag_ms = (asyncio.get_running_loop().time() - start) * 1000
+
+    try:
+        await asyncio.wait_for(run_read(lambda conn: conn.execute("SELECT 1").fetchone()), timeout=2)
+        db_ok = True
+    except Exception:
+        db_ok = False
+
+    in_flight = requests_in_flight.value - 1  # not counting this probe
+    writer = get_writer().stats()
+    pool = get_pool().stats()
+    saturation = round(max(in_flight / MAX_IN_FLIGHT, writer["queued"] / MAX_WRITE_QUEUE), 3)
+    ready = db_ok and saturation < 1
+    body = {
+        "ready": ready,
+        "pid": os.getpid(),
+        "db": db_ok,
+        "saturation": saturation,
+        "in_flight": in_flight,
+        "max_in_flight": MAX_IN_FLIGHT,
+        "write_queue": writer["queued"],
+        "db_pool_busy": pool["size"] - pool["idle"],
+        "loop_lag_ms": round(loop_lag_ms, 2),
+        "feedback_jobs": feedback_jobs.stats(),
     }
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 
-@app.get("/api/admin/rubrics")
-def admin_list_rubrics(request: Request):
+@app.get("/api/admin/db-pool")
+def admin_db_pool(request: Request):
     require_role(request, {"admin"})
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, title FROM rubrics ORDER BY id DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return {"rubrics": [{"id": r["id"], "title": r["title"]} for r in rows]}
+    return {**get_pool().stats(), "writer": get_writer().stats()}
 
 
-@app.post("/api/admin/rubrics")
-async def admin_create_rubric(request: Request):
+@app.get("/api/admin/uploads/storage")
+def admin_upload_storage(request: Request):
     require_role(request, {"admin"})
-    body = await request.json()
+    with pooled_conn() as conn:
+        return storage_stats(conn)
+
+
+@app.get("/api/admin/extraction")
+def admin_extraction_status(request: Request):
+    require_role(request, {"admin"})
+    with pooled_conn() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) AS c FROM attachment_texts GROUP BY status").fetchall()
+    return {"statuses": {r["status"]: r["c"] for r in rows}, "queue": attachment_extraction.stats()}
+
+
+@app.get("/api/admin/email-outbox")
+async def admin_email_outbox(request: Request):
+    await require_role_async(request, {"admin"})
+    return {"statuses": await email_dispatcher.counts(), "dispatcher": email_dispatcher.stats()}
+
+
+@app.post("/api/admin/uploads/gc")
+async def admin_upload_gc(request: Request):
+    await require_role_async(request, {"admin"})
+    result = await run_write(lambda conn: collect_garbage(conn, UPLOAD_DIR))
+    return {"ok": True, **result}
 
+
+@app.get("/api/admin/jobs")
+def admin_list_jobs(request: Request, status: str = "dead"):
+    require_role(request, {"admin"})
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM feedback_jobs WHERE status = ? ORDER BY id DESC LIMIT 200", (status,))
+        rows = cur.fetchall()
+    return {"jobs": [job_to_dict(r) for r in rows], "queue": feedback_jobs.stats()}
+
+
+@app.post("/api/admin/jobs/{job_id}/retry")
+async def admin_retry_job(request: Request, job_id: int):
+    await require_role_async(request, {"admin"})
+    now = datetime.utcnow().isoformat()
+
+    def write(conn):
+        cur = conn.execute("""
+            UPDATE feedback_jobs
+            SET status = 'queued', attempts = 0, run_after = 0, updated_at = ?
+            WHERE id = ? AND status = 'dead'
+        """, (now, job_id))
+        if cur.rowcount != 1:
+            raise HTTPException(status_code=404, detail="No dead job with that id")
+
+    await run_write(write)
+    feedback_jobs.notify()
+    return {"ok": True}
+
+
+@app.get("/api/admin/rubrics")
+def admin_list_rubrics(request: Request):
+    require_role(request, {"admin"})
+    etag, listing = rubric_registry.listing()
+    return etag_response(request, etag, listing)
+
+
+def _validate_rubric_body(body: dict) -> tuple[str, list]:
     title = (body.get("title") or "").strip()
     criteria = body.get("criteria")  # expects array of objects
 
@@ -691,21 +1135,70 @@ async def admin_create_rubric(request: Request):
             raise HTTPException(status_code=400, detail="Each criterion needs name + description")
         cleaned.append({"name": name, "description": desc})
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
+    return title, cleaned
+
+
+@app.post("/api/admin/rubrics")
+async def admin_create_rubric(request: Request):
+    await require_role_async(request, {"admin"})
+    body = await request.json()
+    title, cleaned = _validate_rubric_body(body)
+
+    await run_write(lambda conn: conn.execute(
         "INSERT INTO rubrics (title, criteria_json) VALUES (?, ?)",
         (title, json.dumps(cleaned)),
-    )
-    conn.commit()
-    conn.close()
+    ))
+    rubric_registry.invalidate()
+
+    return {"ok": True}
+
+
+@app.put("/api/admin/rubrics/{rubric_id}")
+async def admin_update_rubric(request: Request, rubric_id: int):
+    await require_role_async(request, {"admin"})
+    body = await request.json()
+    title, cleaned = _validate_rubric_body(body)
+
+    def write(conn):
+        cur = conn.execute(
+            "UPDATE rubrics SET title = ?, criteria_json = ? WHERE id = ?",
+            (title, json.dumps(cleaned), rubric_id),
+        )
+        if cur.rowcount != 1:
+            raise HTTPException(status_code=404, detail="Rubric not found")
+
+    await run_write(write)
+    rubric_registry.invalidate()
+    # cached feedback was produced against the old criteria
+    await asyncio.wrap_future(feedback_cache.invalidate_rubric(rubric_id))
 
     return {"ok": True}
+
+
+@app.get("/api/admin/feedback-cache")
+def admin_feedback_cache(request: Request):
+    require_role(request, {"admin"})
+    return feedback_cache.stats()
+
+@app.get("/api/admin/feedback-batcher")
+def admin_feedback_batcher(request: Request):
+    require_role(request, {"admin"})
+    return feedback_batcher.stats()
+
+@app.get("/api/admin/feedback-engine")
+def admin_feedback_engine(request: Request):
+    require_role(request, {"admin"})
+    return feedback_engine.stats()
+
+
+@app.get("/api/admin/sessions")
+def admin_session_store(request: Request):
+    require_role(request, {"admin"})
+    return {**session_store.stats(), "password_hashing": password_hasher.stats(), "rate_limits": rate_limiter.stats()}
 @app.get("/admin/rubrics", response_class=HTMLResponse)
 def admin_rubrics_page(request: Request):
     require_role(request, {"admin"})
-    file = FRONTEND_DIR / "admin_rubrics.html"
-    return file.read_text(encoding="utf-8")
+    return page(request, "admin_rubrics.html")
 
 
 # Chat CoPilot (Mock pipeline for now, LLM will be added in soon)
@@ -729,6 +1222,16 @@ def basic_guardrails(message: str) -> str:
     return msg
 
 
+def iter_chat_response(mode: str, message: str, context: dict | None = None):
+    """
+    Yields the reply a few words at a time.
+    Later: forward tokens from the LLM stream instead.
+    """
+    reply = mock_chat_response(mode, message, context)
+    for token in re.findall(r"\S+\s*|\s+", reply):
+        yield token
+
+
 def mock_chat_response(mode: str, message: str, context: dict | None = None) -> str:
 
     attachments = (context or {}).get("attachments") or []
@@ -771,7 +1274,7 @@ def mock_chat_response(mode: str, message: str, context: dict | None = None) ->
 
 @app.post("/api/chat")
 async def chat(request: Request):
-    role = require_role(request, {"student", "teacher", "admin"})
+    role = await require_role_async(request, {"student", "teacher", "admin"})
     body = await request.json()
 
     attachment_ids = body.get("attachment_ids") or []
@@ -780,16 +1283,18 @@ async def chat(request: Request):
 
     rows = []
     if attachment_ids:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute(f"""
-            SELECT id, original_name, content_type, stored_name
-            FROM uploads
-            WHERE id IN ({",".join(["?"]*len(attachment_ids))})
-              AND user_email = ?
-        """, (*attachment_ids, request.session.get("user_email")))
-        rows = cur.fetchall()
-        conn.close()
+        def load(conn):
+            rows = conn.execute(f"""
+                SELECT id, original_name, content_type, stored_name, blob_sha256
+                FROM uploads
+                WHERE id IN ({",".join(["?"]*len(attachment_ids))})
+                  AND user_email = ?
+            """, (*attachment_ids, request.session.get("user_email"))).fetchall()
+            # prepared by the extraction queue, never parsed here
+            texts = load_attachment_texts(conn, [r["blob_sha256"] for r in rows if r["blob_sha256"]])
+            return rows, texts
+
+        rows, texts = await run_read(load)
 
         if len(rows) != len(attachment_ids):
             raise HTTPException(status_code=403, detail="One or more attachments not found / not yours")
@@ -798,7 +1303,8 @@ async def chat(request: Request):
     context = {}
     if rows:
         context["attachments"] = [
-            {"id": r["id"], "name": r["original_name"], "type": r["content_type"], "stored": r["stored_name"]}
+            {"id": r["id"], "name": r["original_name"], "type": r["content_type"], "stored": r["stored_name"],
+             "text": texts.get(r["blob_sha256"])}
             for r in rows
         ]
 
@@ -819,25 +1325,25 @@ async def chat(request: Request):
             raise HTTPException(status_code=403, detail="Feedback mode chat is only available for students")
 
         email = request.session.get("user_email")
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT s.id, s.user_email, s.submission_text, s.created_at, r.title as rubric_title
-            FROM submissions s
-            JOIN rubrics r ON r.id = s.rubric_id
-            WHERE s.id = ?
-        """, (submission_id,))
-        s = cur.fetchone()
-        if not s:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Submission not found")
-        if s["user_email"] != email:
-            conn.close()
-            raise HTTPException(status_code=403, detail="Forbidden")
 
-        cur.execute("SELECT feedback_json FROM feedback WHERE submission_id = ?", (submission_id,))
-        f = cur.fetchone()
-        conn.close()
+        def load(conn):
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT s.id, s.user_email, s.submission_text, s.created_at, r.title as rubric_title
+                FROM submissions s
+                JOIN rubrics r ON r.id = s.rubric_id
+                WHERE s.id = ?
+            """, (submission_id,))
+            s = cur.fetchone()
+            if not s:
+                raise HTTPException(status_code=404, detail="Submission not found")
+            if s["user_email"] != email:
+                raise HTTPException(status_code=403, detail="Forbidden")
+
+            cur.execute("SELECT feedback_json FROM feedback WHERE submission_id = ?", (submission_id,))
+            return s, cur.fetchone()
+
+        s, f = await run_read(load)
 
         feedback = json.loads(f["feedback_json"]) if f else None
 
@@ -848,6 +1354,16 @@ async def chat(request: Request):
             "feedback": feedback,
         })
 
+    if body.get("stream"):
+        async def stream():
+            async for token in iterate_in_threadpool(iter_chat_response(mode, message, context)):
+                if await request.is_disconnected():
+                    return
+                yield sse_event("token", token)
+            yield sse_event("done", {"ok": True})
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
     reply = mock_chat_response(mode, message, context)
     return {"ok": True, "reply": reply}
 
@@ -0,0 +1,355 @@
+import contextvars
+import functools
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# per-statement SQL timing wraps every cursor; switch off with FLOSENDO_METRICS_SQL=0
+SQL_METRICS = os.getenv("FLOSENDO_METRICS_SQL", "1") != "0"
+
+# opt-in sampling profiler: requests slower than this are dumped as folded stacks
+PROFILE_SLOW_MS = float(os.getenv("FLOSENDO_PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("FLOSENDO_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = Path(os.getenv("FLOSENDO_PROFILE_DIR", str(Path(__file__).parent.parent / "data" / "profiles")))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense, keyed by label values."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: v[:] for k, v in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "flosendo_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status"),
+)
+SPAN_SECONDS = Histogram(
+    "flosendo_span_seconds", "Time spent in instrumented hot paths.", ("span",),
+)
+SQL_SECONDS = Histogram(
+    "flosendo_sql_statement_seconds", "SQLite statement execution time by verb and table.", ("statement",),
+)
+REQUEST_SPAN_SECONDS = Histogram(
+    "flosendo_request_span_seconds", "Per-request time spent in each span kind, by route.", ("route", "span"),
+)
+
+_collectors = []
+
+
+def register_collector(fn):
+    """fn() returns extra exposition lines (gauges etc.) appended to /metrics."""
+    _collectors.append(fn)
+
+
+def render_metrics() -> str:
+    lines = []
+    for h in (REQUEST_SECONDS, SPAN_SECONDS, SQL_SECONDS, REQUEST_SPAN_SECONDS):
+        lines.extend(h.render())
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, help: str, values: dict) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        lines.append(f'{name}{{key="{_escape(str(key))}"}} {value}')
+    return lines
+
+
+# --- Spans ---
+
+class _RequestTimings:
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: str, seconds: float):
+        with self._lock:
+            self.totals[span] = self.totals.get(span, 0.0) + seconds
+
+
+_request_timings: contextvars.ContextVar[_RequestTimings | None] = contextvars.ContextVar(
+    "flosendo_request_timings", default=None
+)
+
+
+def _record(name: str, seconds: float):
+    SPAN_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def with_context(fn, *args):
+    """
+    Bind fn to the caller's context before handing it to an executor, so
+    spans inside it are attributed to the current request
+    (loop.run_in_executor does not copy contextvars on its own).
+    """
+    return functools.partial(contextvars.copy_context().run, fn, *args)
+
+
+# --- SQL ---
+
+_SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+(\w+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _statement_label(sql: str) -> str:
+    # verb + first table keeps label cardinality bounded
+    words = sql.split(None, 1)
+    verb = words[0].upper() if words else "?"
+    m = _SQL_TABLE.search(sql)
+    return f"{verb} {m.group(1)}" if m else verb
+
+
+def _observe_sql(sql: str, seconds: float):
+    SQL_SECONDS.observe(seconds, _statement_label(sql))
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add("sql", seconds)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe_sql(sql, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed into SQL_SECONDS."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    return InstrumentedConnection if SQL_METRICS else sqlite3.Connection
+
+
+# --- Sampling profiler ---
+
+class SlowRequestProfiler:
+    """
+    While requests are in flight, samples every thread's stack each
+    interval. A request that finishes slower than threshold_ms has the
+    samples taken during its lifetime written as folded stacks
+    (flamegraph.pl / speedscope input). Samples cover the whole process,
+    so concurrent requests show up in each other's profiles.
+    """
+
+    def __init__(self, threshold_ms: float = PROFILE_SLOW_MS, interval: float = PROFILE_INTERVAL_SECONDS,
+                 out_dir: Path = PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.out_dir = out_dir
+        self._active: dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._busy = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._next_id = 0
+        self.dumps = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                    self._thread.start()
+
+    def begin(self) -> int:
+        self._ensure_started()
+        with self._lock:
+            self._next_id += 1
+            token = self._next_id
+            self._active[token] = Counter()
+            self._busy.set()
+        return token
+
+    def end(self, token: int, route: str, seconds: float):
+        with self._lock:
+            samples = self._active.pop(token, None)
+            if not self._active:
+                self._busy.clear()
+        if samples and seconds >= self.threshold:
+            self._dump(route, seconds, samples)
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while True:
+            self._busy.wait()
+            time.sleep(self.interval)
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                stacks.append(";".join(reversed(parts)))
+            with self._lock:
+                for samples in self._active.values():
+                    samples.update(stacks)
+
+    def _dump(self, route: str, seconds: float, samples: Counter):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        path = self.out_dir / f"{stamp}-{slug}-{int(seconds * 1000)}ms.folded"
+        path.write_text("".join(f"{stack} {n}\n" for stack, n in samples.most_common()), encoding="utf-8")
+        self.dumps += 1
+
+
+profiler = SlowRequestProfiler()
+
+
+# --- ASGI middleware ---
+
+def _route_label(scope, status: int) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if status != 404 and scope.get("root_path"):
+        # mounted static apps
+        return scope["root_path"] + "/*"
+    return "unmatched"
+
+
+class _InFlight:
+    """Requests currently inside the app in this process."""
+
+    def __init__(self):
+        self.value = 0
+        self.peak = 0
+
+    def enter(self):
+        self.value += 1
+        self.peak = max(self.peak, self.value)
+
+    def leave(self):
+        self.value -= 1
+
+
+requests_in_flight = _InFlight()
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency, per-request span totals and, when the
+    profiler is enabled, stacks for slow requests. Latency runs until the
+    last body chunk is sent, so streamed responses count in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        timings = _RequestTimings()
+        reset = _request_timings.set(timings)
+        token = profiler.begin() if profiler.enabled else None
+        start = time.perf_counter()
+        requests_in_flight.enter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_in_flight.leave()
+            elapsed = time.perf_counter() - start
+            _request_timings.reset(reset)
+            route = _route_label(scope, status)
+            REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+            for name, seconds in timings.totals.items():
+                REQUEST_SPAN_SECONDS.observe(seconds, route, name)
+            if token is not None:
+                profiler.end(token, f"{scope['method']} {route}", elapsed)
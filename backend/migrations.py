@@ -0,0 +1,592 @@
+"""
+Versioned schema migrations.
+
+The tables init_db creates with IF NOT EXISTS are the baseline. Every later
+change is a numbered Migration below, applied once in order and recorded in
+schema_version; never edit one that has shipped, add a new one. A database
+whose recorded names disagree with MIGRATIONS is refused.
+
+    python -m backend.migrations             # apply pending migrations
+    python -m backend.migrations --status
+    python -m backend.migrations --dry-run   # query plan changes, on a copy
+
+SQLite cannot build an index concurrently, so "online" migrations run each
+statement in its own short transaction and pause in between, letting queued
+writes through instead of holding the write lock for the whole migration.
+Readers are never blocked in WAL mode. ANALYZE runs after anything is
+applied so the planner sees the new indexes' statistics.
+"""
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import backend.db as db
+
+INDEX_PAUSE_SECONDS = 0.05
+ANALYZE_LIMIT = 1000  # rows sampled per index, keeps ANALYZE quick on large tables
+
+
+class Migration:
+    __slots__ = ("version", "name", "statements", "online")
+
+    def __init__(self, version: int, name: str, statements: tuple, online: bool = False):
+        self.version = version
+        self.name = name
+        # SQL strings, or AddColumn steps
+        self.statements = statements
+        # online statements must be idempotent (IF NOT EXISTS): a crash between
+        # them leaves the migration unrecorded and it runs again
+        self.online = online
+
+
+class AddColumn:
+    """ALTER TABLE ... ADD COLUMN, skipped when the column is already there."""
+    __slots__ = ("table", "column", "decl")
+
+    def __init__(self, table: str, column: str, decl: str):
+        self.table = table
+        self.column = column
+        self.decl = decl
+
+    def __call__(self, conn):
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({self.table})")}
+        if self.column not in cols:
+            conn.execute(str(self))
+
+    def __str__(self):
+        return f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.decl}"
+
+
+def _version_trigger(name: str, table: str, suffix: str, event: str) -> str:
+    return f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{suffix} AFTER {event} ON {table} BEGIN
+            INSERT INTO registry_versions (name, version) VALUES ('{name}', 1)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1;
+        END"""
+
+
+# 1-11 were created ad hoc by init_db before this module existed, so they
+# use IF NOT EXISTS / AddColumn and are no-ops on databases that have them
+MIGRATIONS = (
+    # status: queued -> running -> done, or back to queued with backoff, or dead after max_attempts
+    Migration(1, "feedback_jobs", (
+        """CREATE TABLE IF NOT EXISTS feedback_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued','running','done','dead')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (submission_id) REFERENCES submissions(id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_jobs_status ON feedback_jobs(status, run_after)",
+    )),
+    Migration(2, "feedback_cache", (
+        """CREATE TABLE IF NOT EXISTS feedback_cache (
+            cache_key TEXT PRIMARY KEY,
+            rubric_id INTEGER,
+            feedback_json TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_cache_rubric ON feedback_cache(rubric_id)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_cache_last_used ON feedback_cache(last_used)",
+    )),
+    # one physical file per distinct content, shared by every upload row with
+    # that hash; uploads made before this have no blob
+    Migration(3, "upload_blobs", (
+        AddColumn("uploads", "blob_sha256", "TEXT"),
+        "CREATE INDEX IF NOT EXISTS idx_uploads_blob ON uploads(blob_sha256)",
+        """CREATE TABLE IF NOT EXISTS upload_blobs (
+            sha256 TEXT PRIMARY KEY,
+            stored_name TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )""",
+    )),
+    # text pulled out of each stored blob once, split into page/slide chunks
+    Migration(4, "attachment_texts", (
+        """CREATE TABLE IF NOT EXISTS attachment_texts (
+            sha256 TEXT PRIMARY KEY,
+            stored_name TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued','running','done','failed','unsupported')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            chunk_count INTEGER NOT NULL DEFAULT 0,
+            char_count INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_attachment_texts_status ON attachment_texts(status)",
+        """CREATE TABLE IF NOT EXISTS attachment_chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            text TEXT NOT NULL,
+            FOREIGN KEY (sha256) REFERENCES attachment_texts(sha256)
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_attachment_chunks_sha_seq ON attachment_chunks(sha256, seq)",
+    )),
+    # per-student and per-rubric keyset scans, feedback lookup by submission
+    Migration(5, "submission_listing_indexes", (
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_id ON submissions(user_email, id)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_rubric_id ON submissions(rubric_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_submission ON feedback(submission_id)",
+    ), online=True),
+    # dashboard aggregates kept current by triggers on the base tables, so
+    # reads never scan submissions; backend.analytics.reconcile_analytics
+    # fills them from history
+    Migration(6, "analytics_aggregates", (
+        """CREATE TABLE IF NOT EXISTS analytics_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS analytics_rubric_counts (
+            rubric_id INTEGER PRIMARY KEY,
+            submissions INTEGER NOT NULL DEFAULT 0
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_rubric_counts_submissions ON analytics_rubric_counts(submissions)",
+        """CREATE TABLE IF NOT EXISTS analytics_daily (
+            day TEXT PRIMARY KEY,
+            submissions INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS analytics_student_activity (
+            user_email TEXT PRIMARY KEY,
+            submissions INTEGER NOT NULL DEFAULT 0,
+            last_submission_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_student_activity_submissions ON analytics_student_activity(submissions)",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_user_insert AFTER INSERT ON users BEGIN
+            INSERT INTO analytics_counters (name, value) VALUES ('users', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_user_delete AFTER DELETE ON users BEGIN
+            UPDATE analytics_counters SET value = value - 1 WHERE name = 'users';
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_submission_insert AFTER INSERT ON submissions BEGIN
+            INSERT INTO analytics_counters (name, value) VALUES ('submissions', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+            INSERT INTO analytics_rubric_counts (rubric_id, submissions) VALUES (NEW.rubric_id, 1)
+            ON CONFLICT(rubric_id) DO UPDATE SET submissions = submissions + 1;
+            INSERT INTO analytics_daily (day, submissions) VALUES (substr(NEW.created_at, 1, 10), 1)
+            ON CONFLICT(day) DO UPDATE SET submissions = submissions + 1;
+            INSERT INTO analytics_student_activity (user_email, submissions, last_submission_at)
+            VALUES (NEW.user_email, 1, NEW.created_at)
+            ON CONFLICT(user_email) DO UPDATE SET
+              submissions = submissions + 1,
+              last_submission_at = MAX(COALESCE(last_submission_at, ''), excluded.last_submission_at);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_submission_delete AFTER DELETE ON submissions BEGIN
+            UPDATE analytics_counters SET value = value - 1 WHERE name = 'submissions';
+            UPDATE analytics_rubric_counts SET submissions = submissions - 1 WHERE rubric_id = OLD.rubric_id;
+            UPDATE analytics_daily SET submissions = submissions - 1 WHERE day = substr(OLD.created_at, 1, 10);
+            UPDATE analytics_student_activity SET submissions = submissions - 1 WHERE user_email = OLD.user_email;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_review_insert AFTER INSERT ON teacher_reviews BEGIN
+            INSERT INTO analytics_counters (name, value) VALUES ('reviewed', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+            INSERT INTO analytics_counters (name, value) VALUES ('flagged', COALESCE(NEW.flagged, 0))
+            ON CONFLICT(name) DO UPDATE SET value = value + COALESCE(NEW.flagged, 0);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_review_update AFTER UPDATE OF flagged ON teacher_reviews BEGIN
+            UPDATE analytics_counters SET value = value + COALESCE(NEW.flagged, 0) - COALESCE(OLD.flagged, 0)
+            WHERE name = 'flagged';
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_analytics_review_delete AFTER DELETE ON teacher_reviews BEGIN
+            UPDATE analytics_counters SET value = value - 1 WHERE name = 'reviewed';
+            UPDATE analytics_counters SET value = value - COALESCE(OLD.flagged, 0) WHERE name = 'flagged';
+        END""",
+    )),
+    Migration(7, "feedback_batches", (
+        """CREATE TABLE IF NOT EXISTS feedback_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK(kind IN ('import','regenerate')),
+            rubric_id INTEGER NOT NULL,
+            created_by TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )""",
+        AddColumn("feedback_jobs", "batch_id", "INTEGER"),
+        "CREATE INDEX IF NOT EXISTS idx_feedback_jobs_batch ON feedback_jobs(batch_id, status)",
+    )),
+    # bumped on every rubric write so in-memory registries know to reload
+    Migration(8, "rubrics_version_counter", (
+        """CREATE TABLE IF NOT EXISTS registry_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""",
+        _version_trigger("rubrics", "rubrics", "insert", "INSERT"),
+        _version_trigger("rubrics", "rubrics", "update", "UPDATE"),
+        _version_trigger("rubrics", "rubrics", "delete", "DELETE"),
+    )),
+    # bumped whenever a user's role or password changes or the user goes
+    # away, so every process drops its cached session resolutions
+    Migration(9, "users_pw_version", (
+        AddColumn("users", "pw_version", "INTEGER NOT NULL DEFAULT 0"),
+        _version_trigger("users", "users", "update", "UPDATE OF role, pw_version"),
+        _version_trigger("users", "users", "delete", "DELETE"),
+    )),
+    # outgoing mail, sent by backend.outbox; bodies are blanked once
+    # finished since reset mails carry live tokens
+    Migration(10, "email_outbox", (
+        """CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued','sending','sent','dead')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after REAL NOT NULL,
+            last_error TEXT,
+            provider_id TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_status ON email_outbox(status, run_after)",
+    )),
+    # token buckets shared by every worker, see backend.ratelimit
+    Migration(11, "rate_limits", (
+        """CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID""",
+    )),
+    Migration(12, "uploads_lookup_indexes", (
+        "CREATE INDEX IF NOT EXISTS idx_uploads_user ON uploads(user_email, id)",
+        "CREATE INDEX IF NOT EXISTS idx_uploads_submission ON uploads(submission_id)",
+    ), online=True),
+    Migration(13, "feedback_jobs_listing_indexes", (
+        "CREATE INDEX IF NOT EXISTS idx_feedback_jobs_status_id ON feedback_jobs(status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_jobs_submission ON feedback_jobs(submission_id)",
+    ), online=True),
+    # the index and its triggers appear together with the backfill, so no
+    # write can land in between unindexed; feedback contributes its JSON's
+    # text values (invalid JSON is indexed as-is) rather than its keys
+    Migration(14, "submission_search_index", (
+        """CREATE VIRTUAL TABLE submission_search USING fts5(
+            submission_text, feedback, note, tokenize = 'unicode61 remove_diacritics 2'
+        )""",
+        """CREATE TRIGGER trg_search_submission_insert AFTER INSERT ON submissions BEGIN
+            INSERT INTO submission_search (rowid, submission_text, feedback, note)
+            VALUES (new.id, new.submission_text, '', '');
+        END""",
+        """CREATE TRIGGER trg_search_submission_update AFTER UPDATE OF submission_text ON submissions BEGIN
+            UPDATE submission_search SET submission_text = new.submission_text WHERE rowid = new.id;
+        END""",
+        """CREATE TRIGGER trg_search_submission_delete AFTER DELETE ON submissions BEGIN
+            DELETE FROM submission_search WHERE rowid = old.id;
+        END""",
+        """CREATE TRIGGER trg_search_feedback_insert AFTER INSERT ON feedback BEGIN
+            UPDATE submission_search SET feedback = COALESCE((
+                SELECT group_concat(value, ' ') FROM json_tree(
+                    CASE WHEN json_valid(new.feedback_json) THEN new.feedback_json ELSE json_quote(new.feedback_json) END
+                ) WHERE type = 'text'
+            ), '') WHERE rowid = new.submission_id;
+        END""",
+        """CREATE TRIGGER trg_search_feedback_update AFTER UPDATE OF feedback_json ON feedback BEGIN
+            UPDATE submission_search SET feedback = COALESCE((
+                SELECT group_concat(value, ' ') FROM json_tree(
+                    CASE WHEN json_valid(new.feedback_json) THEN new.feedback_json ELSE json_quote(new.feedback_json) END
+                ) WHERE type = 'text'
+            ), '') WHERE rowid = new.submission_id;
+        END""",
+        """CREATE TRIGGER trg_search_feedback_delete AFTER DELETE ON feedback BEGIN
+            UPDATE submission_search SET feedback = '' WHERE rowid = old.submission_id;
+        END""",
+        """CREATE TRIGGER trg_search_review_insert AFTER INSERT ON teacher_reviews BEGIN
+            UPDATE submission_search SET note = COALESCE(new.note, '') WHERE rowid = new.submission_id;
+        END""",
+        """CREATE TRIGGER trg_search_review_update AFTER UPDATE OF note ON teacher_reviews BEGIN
+            UPDATE submission_search SET note = COALESCE(new.note, '') WHERE rowid = new.submission_id;
+        END""",
+        """CREATE TRIGGER trg_search_review_delete AFTER DELETE ON teacher_reviews BEGIN
+            UPDATE submission_search SET note = '' WHERE rowid = old.submission_id;
+        END""",
+        """INSERT INTO submission_search (rowid, submission_text, feedback, note)
+        SELECT s.id, s.submission_text, COALESCE((
+            SELECT group_concat(j.value, ' ')
+            FROM feedback f, json_tree(
+                CASE WHEN json_valid(f.feedback_json) THEN f.feedback_json ELSE json_quote(f.feedback_json) END
+            ) j
+            WHERE f.submission_id = s.id AND j.type = 'text'
+        ), ''), COALESCE(tr.note, '')
+        FROM submissions s
+        LEFT JOIN teacher_reviews tr ON tr.submission_id = s.id""",
+        "INSERT INTO submission_search (submission_search) VALUES ('optimize')",
+    )),
+    # when each periodic maintenance job last ran, so that with several
+    # worker processes only the first one due does the work
+    Migration(15, "scheduled_runs", (
+        """CREATE TABLE scheduled_runs (
+            name TEXT PRIMARY KEY,
+            last_run_at REAL NOT NULL
+        )""",
+    )),
+    # matches the claim order (single submissions before batches, then id),
+    # so claiming reads the first due rows instead of sorting the queue
+    Migration(16, "feedback_jobs_claim_index", (
+        "CREATE INDEX IF NOT EXISTS idx_feedback_jobs_claim ON feedback_jobs(status, (batch_id IS NOT NULL), id)",
+    ), online=True),
+)
+
+# the queries main.py and the workers run most, with representative parameters
+HOT_QUERIES = {
+    "teacher_submissions_page": ("""
+        SELECT s.id, s.user_email, s.created_at, r.title as rubric_title, COALESCE(tr.flagged, 0) as flagged
+        FROM submissions s
+        JOIN rubrics r ON r.id = s.rubric_id
+        LEFT JOIN teacher_reviews tr ON tr.submission_id = s.id
+        ORDER BY s.id DESC
+        LIMIT ?
+    """, (51,)),
+    "student_submissions_page": ("""
+        SELECT s.id, s.user_email, s.created_at, r.title as rubric_title, COALESCE(tr.flagged, 0) as flagged
+        FROM submissions s
+        JOIN rubrics r ON r.id = s.rubric_id
+        LEFT JOIN teacher_reviews tr ON tr.submission_id = s.id
+        WHERE s.user_email = ?
+        ORDER BY s.id DESC
+        LIMIT ?
+    """, ("student@example.com", 51)),
+    "submission_feedback": ("SELECT feedback_json FROM feedback WHERE submission_id = ?", (1,)),
+    "job_with_owner": ("""
+        SELECT j.*, s.user_email
+        FROM feedback_jobs j
+        JOIN submissions s ON s.id = j.submission_id
+        WHERE j.id = ?
+    """, (1,)),
+    "jobs_by_status": ("SELECT * FROM feedback_jobs WHERE status = ? ORDER BY id DESC LIMIT 200", ("dead",)),
+    "claim_feedback_job": ("""
+        SELECT id FROM feedback_jobs
+        WHERE status = 'queued' AND +run_after <= ?
+        ORDER BY batch_id IS NOT NULL, id
+        LIMIT ?
+    """, (0, 8)),
+    "jobs_for_submission": ("SELECT id, status FROM feedback_jobs WHERE submission_id = ?", (1,)),
+    "uploads_for_user": ("""
+        SELECT id, original_name, content_type, stored_name, blob_sha256
+        FROM uploads WHERE user_email = ? ORDER BY id DESC LIMIT 50
+    """, ("student@example.com",)),
+    "uploads_for_submission": ("SELECT id, original_name FROM uploads WHERE submission_id = ?", (1,)),
+    "claim_emails": ("""
+        SELECT id FROM email_outbox WHERE status = 'queued' AND run_after <= ? ORDER BY id LIMIT 50
+    """, (0,)),
+}
+
+
+# plan fragments that must not appear in a hot query's plan once every
+# migration is applied; --dry-run exits non-zero when one does. Claims run
+# inside the write lock, where a sort of the whole queue blocks every writer.
+PLAN_FORBIDDEN = {
+    "claim_feedback_job": ("USE TEMP B-TREE", "SCAN feedback_jobs"),
+}
+
+
+def _connect(db_path: Path, read_only: bool = False):
+    if read_only:
+        if not Path(db_path).exists():
+            raise FileNotFoundError(f"No database at {db_path}")
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    else:
+        # transactions are explicit below
+        conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    db.configure_conn(conn)
+    return conn
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL,
+        duration_ms INTEGER NOT NULL
+    )
+    """)
+
+
+def applied_versions(conn) -> set[int]:
+    """Recorded versions; raises when they do not match MIGRATIONS."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return set()
+    names = {m.version: m.name for m in MIGRATIONS}
+    recorded = dict(conn.execute("SELECT version, name FROM schema_version").fetchall())
+    wrong = [f"{v} {n}" for v, n in sorted(recorded.items()) if names.get(v) != n]
+    if wrong:
+        raise RuntimeError(f"schema_version does not match MIGRATIONS: {', '.join(wrong)}")
+    return set(recorded)
+
+
+def pending(conn) -> list[Migration]:
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def _execute(conn, statement):
+    if callable(statement):
+        statement(conn)
+    else:
+        conn.execute(statement)
+
+
+def _apply(conn, m: Migration, pause: float) -> dict | None:
+    start = time.perf_counter()
+    if m.online:
+        for statement in m.statements:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _execute(conn, statement)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            time.sleep(pause)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # another process may have got here first
+        if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (m.version,)).fetchone():
+            conn.execute("ROLLBACK")
+            return None
+        if not m.online:
+            for statement in m.statements:
+                _execute(conn, statement)
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        conn.execute(
+            "INSERT INTO schema_version (version, name, applied_at, duration_ms) VALUES (?, ?, ?, ?)",
+            (m.version, m.name, datetime.utcnow().isoformat(), duration_ms),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {"version": m.version, "name": m.name, "duration_ms": duration_ms}
+
+
+def analyze(conn):
+    conn.execute(f"PRAGMA analysis_limit = {ANALYZE_LIMIT}")
+    conn.execute("ANALYZE")
+
+
+def migrate(db_path: Path | None = None, pause: float = INDEX_PAUSE_SECONDS) -> list[dict]:
+    """Apply pending migrations in order; returns what was applied."""
+    conn = _connect(Path(db_path or db.DB_PATH))
+    try:
+        _ensure_version_table(conn)
+        applied = [r for r in (_apply(conn, m, pause) for m in pending(conn)) if r]
+        if applied:
+            analyze(conn)
+        return applied
+    finally:
+        conn.close()
+
+
+def query_plans(conn) -> dict[str, list[str]]:
+    plans = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        try:
+            plans[name] = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.OperationalError as e:
+            # a table a pending migration creates
+            plans[name] = [f"error: {e}"]
+    return plans
+
+
+def dry_run(db_path: Path | None = None) -> dict:
+    """
+    Applies pending migrations to a copy of the db and returns each hot
+    query's plan before and after. The live db is only read.
+    """
+    source = _connect(Path(db_path or db.DB_PATH), read_only=True)
+    tmp_dir = Path(tempfile.mkdtemp())
+    try:
+        copy = _connect(tmp_dir / "dry_run.db")
+        source.backup(copy)
+        source.close()
+        _ensure_version_table(copy)
+        todo = pending(copy)
+        before = query_plans(copy)
+        for m in todo:
+            _apply(copy, m, pause=0)
+        analyze(copy)
+        after = query_plans(copy)
+        copy.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "pending": [{"version": m.version, "name": m.name, "statements": [str(st) for st in m.statements]}
+                    for m in todo],
+        "plans": {name: {"before": before[name], "after": after[name]} for name in HOT_QUERIES},
+        "violations": [
+            f"{name}: {line}"
+            for name, fragments in PLAN_FORBIDDEN.items()
+            for line in after[name]
+            if any(f in line for f in fragments)
+        ],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=None)
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--dry-run", action="store_true")
+    mode.add_argument("--status", action="store_true")
+    args = ap.parse_args()
+    db_path = args.db or db.DB_PATH
+    if (args.status or args.dry_run) and not Path(db_path).exists():
+        ap.error(f"no database at {db_path}")
+
+    if args.status:
+        conn = _connect(Path(db_path), read_only=True)
+        done = applied_versions(conn)
+        conn.close()
+        for m in MIGRATIONS:
+            print(f"{m.version:>4}  {'applied' if m.version in done else 'pending':8} {m.name}")
+        return
+
+    if args.dry_run:
+        report = dry_run(db_path)
+        for m in report["pending"]:
+            print(f"pending {m['version']} {m['name']}")
+            for statement in m["statements"]:
+                print(f"    {statement}")
+        if not report["pending"]:
+            print("no pending migrations")
+        for name, plan in report["plans"].items():
+            if plan["before"] == plan["after"]:
+                print(f"\n{name}: unchanged\n    " + "\n    ".join(plan["after"]))
+            else:
+                print(f"\n{name}: CHANGED")
+                print("  before:\n    " + "\n    ".join(plan["before"]))
+                print("  after:\n    " + "\n    ".join(plan["after"]))
+        if report["violations"]:
+            print("\nplan regressions:\n    " + "\n    ".join(report["violations"]))
+            sys.exit(1)
+        return
+
+    # the baseline first, then whatever is pending
+    db.DB_PATH = Path(db_path)
+    db.init_db()
+    conn = _connect(Path(db_path))
+    print(f"schema at version {max(applied_versions(conn), default=0)}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
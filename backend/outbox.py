@@ -0,0 +1,231 @@
+"""
+Email outbox.
+
+Handlers only insert into email_outbox (inside their own write); one
+background dispatcher claims due messages, sends them through the
+provider's batch endpoint over a keep-alive session, and retries failures
+with backoff. Point FLOSENDO_EMAIL_API_URL at bench.email_stub to run
+against a local server.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.db import run_read, run_write, wait_for_work
+from backend.engines import TokenBucket
+
+EMAIL_API_URL = os.getenv("FLOSENDO_EMAIL_API_URL", "https://api.resend.com").rstrip("/")
+EMAIL_FROM = os.getenv("FLOSENDO_EMAIL_FROM", "onboarding@resend.dev")
+EMAIL_BATCH_MAX = int(os.getenv("FLOSENDO_EMAIL_BATCH_MAX", "50"))   # provider allows up to 100
+# API requests/s across all server workers, 0 = unlimited
+EMAIL_RATE_PER_SECOND = float(os.getenv("FLOSENDO_EMAIL_RATE", "2")) / int(os.getenv("FLOSENDO_WORKERS", "1"))
+EMAIL_TIMEOUT_SECONDS = float(os.getenv("FLOSENDO_EMAIL_TIMEOUT", "10"))
+EMAIL_MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 5.0   # doubled after every failed attempt
+IDLE_POLL_SECONDS = 5.0
+ERROR_BACKOFF_SECONDS = 0.5   # dispatcher pause after an unexpected error, doubled up to the max
+ERROR_BACKOFF_MAX_SECONDS = 60.0
+
+log = logging.getLogger(__name__)
+
+
+class EmailSendError(Exception):
+    def __init__(self, message: str, retryable: bool = True, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def enqueue_email(conn, to_email: str, subject: str, html: str) -> int:
+    """Insert an outbox row. Call inside the same write as whatever the mail is about."""
+    now = datetime.utcnow().isoformat()
+    return conn.execute("""
+        INSERT INTO email_outbox (to_email, subject, html, status, attempts, max_attempts, run_after, created_at, updated_at)
+        VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+    """, (to_email, subject, html, EMAIL_MAX_ATTEMPTS, time.time(), now, now)).lastrowid
+
+
+def requeue_interrupted(conn):
+    """
+    Writer job: mail left mid-send by a crashed process goes out again; a
+    rare duplicate beats a lost reset link.
+    """
+    conn.execute(
+        "UPDATE email_outbox SET status = 'queued', updated_at = ? WHERE status = 'sending'",
+        (datetime.utcnow().isoformat(),),
+    )
+
+
+def _claim(conn, limit: int):
+    return conn.execute("""
+        UPDATE email_outbox
+        SET status = 'sending', attempts = attempts + 1, updated_at = ?
+        WHERE id IN (
+            SELECT id FROM email_outbox
+            WHERE status = 'queued' AND run_after <= ?
+            ORDER BY id
+            LIMIT ?
+        )
+        RETURNING id, to_email, subject, html, attempts, max_attempts
+    """, (datetime.utcnow().isoformat(), time.time(), limit)).fetchall()
+
+
+def _has_due(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM email_outbox WHERE status = 'queued' AND run_after <= ? LIMIT 1", (time.time(),)
+    ).fetchone() is not None
+
+
+class ResendClient:
+    """Resend's batch API over one pooled keep-alive session."""
+
+    def __init__(self, base_url: str = EMAIL_API_URL, sender: str = EMAIL_FROM,
+                 timeout: float = EMAIL_TIMEOUT_SECONDS):
+        self.base_url = base_url
+        self.sender = sender
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def send_batch(self, messages) -> list[str | None]:
+        """Provider ids, in order. Raises EmailSendError for the whole batch."""
+        api_key = os.getenv("RESEND_API_KEY")
+        if not api_key:
+            raise EmailSendError("Missing RESEND_API_KEY")
+        try:
+            r = self.session.post(
+                f"{self.base_url}/emails/batch",
+                headers={"Authorization": f"Bearer {api_key}"},
+                json=[
+                    {"from": self.sender, "to": [m["to_email"]], "subject": m["subject"], "html": m["html"]}
+                    for m in messages
+                ],
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise EmailSendError(f"{type(e).__name__}: {e}")
+        if r.status_code == 429 or r.status_code >= 500:
+            retry_after = r.headers.get("Retry-After")
+            raise EmailSendError(f"HTTP {r.status_code}: {r.text[:200]}",
+                                 retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if r.status_code >= 400:
+            raise EmailSendError(f"HTTP {r.status_code}: {r.text[:200]}", retryable=False)
+        data = r.json().get("data") or []
+        return [d.get("id") for d in data] + [None] * (len(messages) - len(data))
+
+
+class EmailDispatcher:
+    """
+    Sends queued outbox mail on one asyncio task, at most batch_max
+    messages per API call and `rate` calls per second. The outbox table is
+    the queue, so unsent mail survives a restart.
+    """
+
+    def __init__(self, client=None, batch_max: int = EMAIL_BATCH_MAX, rate: float = EMAIL_RATE_PER_SECOND):
+        self.client = client or ResendClient()
+        self.batch_max = batch_max
+        self.bucket = TokenBucket(rate, 1)
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self.sent = 0
+        self.batches = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def start(self, recover: bool = True):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if recover:
+            await run_write(requeue_interrupted)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        """Wake the dispatcher. Safe to call from any thread or loop."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        errors = 0
+        while True:
+            try:
+                await self._run_once()
+                errors = 0
+            except Exception:
+                # a claimed batch is left running rather than retried here: it may
+                # already have gone out, and requeue_interrupted sees to it on restart
+                errors += 1
+                log.exception("email dispatcher error")
+                await asyncio.sleep(min(ERROR_BACKOFF_SECONDS * 2 ** (errors - 1), ERROR_BACKOFF_MAX_SECONDS))
+
+    async def _run_once(self):
+        if not self.bucket.take(1):
+            await asyncio.sleep(1 / self.bucket.rate)
+            return
+        messages = await run_write(lambda conn: _claim(conn, self.batch_max))
+        if not messages:
+            await wait_for_work(self._wakeup, _has_due, IDLE_POLL_SECONDS)
+            return
+        await self._send(messages)
+
+    async def _send(self, messages):
+        self.batches += 1
+        try:
+            ids = await asyncio.to_thread(self.client.send_batch, messages)
+        except Exception as e:
+            error = e if isinstance(e, EmailSendError) else EmailSendError(f"{type(e).__name__}: {e}")
+            await run_write(lambda conn: self._fail(conn, messages, error))
+            return
+
+        now = datetime.utcnow().isoformat()
+        await run_write(lambda conn: conn.executemany(
+            "UPDATE email_outbox SET status = 'sent', html = '', provider_id = ?, last_error = NULL, "
+            "updated_at = ? WHERE id = ?",
+            [(provider_id, now, m["id"]) for m, provider_id in zip(messages, ids)],
+        ))
+        self.sent += len(messages)
+
+    def _fail(self, conn, messages, error: EmailSendError):
+        now = datetime.utcnow().isoformat()
+        message = str(error)[:500]
+        for m in messages:
+            if not error.retryable or m["attempts"] >= m["max_attempts"]:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'dead', html = '', last_error = ?, updated_at = ? WHERE id = ?",
+                    (message, now, m["id"]),
+                )
+                self.dead += 1
+                continue
+            delay = max(RETRY_BACKOFF_SECONDS * (2 ** (m["attempts"] - 1)), error.retry_after or 0)
+            conn.execute(
+                "UPDATE email_outbox SET status = 'queued', last_error = ?, run_after = ?, updated_at = ? WHERE id = ?",
+                (message, time.time() + delay, now, m["id"]),
+            )
+            self.retried += 1
+
+    async def counts(self) -> dict:
+        rows = await run_read(lambda conn: conn.execute(
+            "SELECT status, COUNT(*) AS c FROM email_outbox GROUP BY status"
+        ).fetchall())
+        return {r["status"]: r["c"] for r in rows}
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "batches": self.batches, "retried": self.retried, "dead": self.dead,
+                "batch_max": self.batch_max, "rate": self.bucket.rate}
+
+
+email_dispatcher = EmailDispatcher()
@@ -0,0 +1,129 @@
+"""
+Rate limits for the auth endpoints.
+
+Token buckets live in the rate_limits table and are taken with one UPSERT on
+the writer, so every worker process shares the same counts and a cleared
+cookie buys nothing. Limits are "capacity/seconds" strings, e.g.
+FLOSENDO_RATE_LOGIN_IP=60/60 allows a burst of 60 logins per IP, refilled
+at one per second. FLOSENDO_RATE_LIMIT=0 turns checking off.
+
+The price is one writer job per checked request (login, forgot, reset,
+password change). The writer commits whatever is queued as one batch, so
+a login storm adds a few small UPSERTs per commit rather than a commit per
+request, and a refused request writes nothing. That is well below the
+bcrypt verify it protects.
+"""
+import os
+import time
+
+from fastapi import HTTPException, Request
+
+from backend.db import run_write
+
+RATE_LIMIT_ENABLED = os.getenv("FLOSENDO_RATE_LIMIT", "1") == "1"
+# only behind a proxy that sets it; otherwise clients could pick their own IP
+TRUST_PROXY = os.getenv("FLOSENDO_TRUST_PROXY", "0") == "1"
+PRUNE_INTERVAL_SECONDS = 300
+
+
+class Limit:
+    __slots__ = ("name", "capacity", "rate")
+
+    def __init__(self, name: str, spec: str):
+        capacity, _, seconds = spec.partition("/")
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(seconds or 1)
+
+
+def _limit(name: str, default: str) -> Limit:
+    return Limit(name, os.getenv(f"FLOSENDO_RATE_{name.upper()}", default))
+
+
+# a class logging in together shares one school IP, so per-IP limits stay generous
+LOGIN_IP = _limit("login_ip", "60/60")
+LOGIN_EMAIL = _limit("login_email", "5/60")
+FORGOT_IP = _limit("forgot_ip", "10/600")
+FORGOT_EMAIL = _limit("forgot_email", "1/20")
+RESET_IP = _limit("reset_ip", "10/600")
+PASSWORD_CHANGE_EMAIL = _limit("password_change_email", "5/300")
+LIMITS = (LOGIN_IP, LOGIN_EMAIL, FORGOT_IP, FORGOT_EMAIL, RESET_IP, PASSWORD_CHANGE_EMAIL)
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _take(conn, hits: list[tuple[Limit, str]], now: float) -> float:
+    """
+    Writer job: take one token from every bucket, or from none. Returns 0
+    when all had one, else seconds until the last empty one refills, so a
+    request refused by one limit does not spend the others (a flood at one
+    email must not drain its school's shared per-IP budget).
+    """
+    buckets = [(limit, f"{limit.name}:{key}") for limit, key in hits]
+    wait = 0.0
+    for limit, bucket in buckets:
+        row = conn.execute(
+            "SELECT min(?, tokens + (? - updated) * ?) FROM rate_limits WHERE key = ?",
+            (limit.capacity, now, limit.rate, bucket),
+        ).fetchone()
+        tokens = limit.capacity if row is None else row[0]
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / limit.rate)
+    if wait:
+        return max(wait, 0.001)
+    conn.executemany("""
+        INSERT INTO rate_limits (key, tokens, updated) VALUES (?, ? - 1, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            tokens = min(?, tokens + (excluded.updated - updated) * ?) - 1,
+            updated = excluded.updated
+    """, [(bucket, limit.capacity, now, limit.capacity, limit.rate) for limit, bucket in buckets])
+    return 0.0
+
+
+def _prune(conn, now: float, max_refill_seconds: float):
+    # a bucket idle this long is full again, which is what a missing row means
+    conn.execute("DELETE FROM rate_limits WHERE updated < ?", (now - max_refill_seconds,))
+
+
+class RateLimiter:
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.allowed = 0
+        self.rejected = 0
+        self._pruned_at = time.time()
+
+    async def check(self, *hits: tuple[Limit, str]) -> float:
+        """0 when the request may go ahead, else the suggested retry delay in seconds."""
+        if not self.enabled:
+            return 0.0
+        now = time.time()
+        hits = [(limit, key) for limit, key in hits if key]
+        retry_after = await run_write(lambda conn: _take(conn, hits, now))
+        if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+            self._pruned_at = now
+            longest = max(limit.capacity / limit.rate for limit in LIMITS)
+            await run_write(lambda conn: _prune(conn, now, longest))
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    async def enforce(self, *hits: tuple[Limit, str]):
+        """Raises 429 with Retry-After when any bucket is empty."""
+        retry_after = await self.check(*hits)
+        if retry_after:
+            raise HTTPException(status_code=429, detail="Too many requests. Try again shortly.",
+                                headers={"Retry-After": str(int(retry_after) + 1)})
+
+    def stats(self) -> dict:
+        return {"enabled": int(self.enabled), "allowed": self.allowed, "rejected": self.rejected}
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from backend.db import pooled_conn
+
+# how often a process re-reads the rubrics version counter, which catches
+# edits made through another process or worker
+RUBRIC_RECHECK_SECONDS = float(os.getenv("FLOSENDO_RUBRIC_RECHECK_SECONDS", "2"))
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+class Criterion(_Frozen):
+    __slots__ = ("name", "description", "name_lower")
+
+    def __init__(self, name: str, description: str):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "description", description)
+        object.__setattr__(self, "name_lower", name.lower())
+
+
+class Rubric(_Frozen):
+    """
+    A parsed rubric. feedback_input is the dict the feedback pipeline
+    takes, built once here instead of json.loads per submission; treat it
+    as read-only.
+    """
+
+    __slots__ = ("id", "title", "criteria", "etag", "feedback_input", "detail")
+
+    def __init__(self, id: int, title: str, criteria_json: str):
+        criteria = tuple(Criterion(c["name"], c.get("description", "")) for c in json.loads(criteria_json))
+        criteria_dicts = [{"name": c.name, "description": c.description} for c in criteria]
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "title", title)
+        object.__setattr__(self, "criteria", criteria)
+        object.__setattr__(self, "etag", _etag(f"{id}\0{title}\0{criteria_json}"))
+        object.__setattr__(self, "feedback_input", {
+            "id": id,
+            "criteria": criteria_dicts,
+            "criteria_lower": tuple(c.name_lower for c in criteria),
+        })
+        object.__setattr__(self, "detail", {"id": id, "title": title, "criteria": criteria_dicts})
+
+
+def _etag(content: str) -> str:
+    return '"' + hashlib.sha256(content.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+class RubricRegistry:
+    """
+    All rubrics in memory, reloaded when the rubrics version counter (bumped
+    by triggers on every rubric write) moves. invalidate() makes the next
+    lookup check it immediately; otherwise it is checked every
+    recheck_seconds.
+    """
+
+    def __init__(self, recheck_seconds: float = RUBRIC_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        # (by_id, listing etag, listing) swapped as one so readers never see a mix
+        self._state: tuple[dict[int, Rubric], str, dict] = ({}, _etag(""), {"rubrics": []})
+        self.version: int | None = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    def _stale(self, now: float) -> bool:
+        return self.version is None or now - self._checked_at >= self.recheck_seconds
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if not self._stale(now):
+            return
+        with self._lock:
+            if not self._stale(now):
+                return
+            with pooled_conn() as conn:
+                row = conn.execute("SELECT version FROM registry_versions WHERE name = 'rubrics'").fetchone()
+                version = row["version"] if row else 0
+                if version != self.version:
+                    rows = conn.execute("SELECT id, title, criteria_json FROM rubrics ORDER BY id DESC").fetchall()
+                    self._load(rows, version)
+            self._checked_at = now
+
+    def _load(self, rows, version: int):
+        rubrics = [Rubric(r["id"], r["title"], r["criteria_json"]) for r in rows]
+        self._state = (
+            {r.id: r for r in rubrics},
+            _etag(f"{version}\0" + "\0".join(r.etag for r in rubrics)),
+            {"rubrics": [{"id": r.id, "title": r.title} for r in rubrics]},
+        )
+        self.version = version
+        self.reloads += 1
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def get(self, rubric_id) -> Rubric | None:
+        """Blocking lookup; from async code use get_async."""
+        self._ensure_fresh()
+        return self._lookup(rubric_id)
+
+    async def get_async(self, rubric_id) -> Rubric | None:
+        # served straight from memory unless the version check is due
+        if self._stale(time.monotonic()):
+            await asyncio.to_thread(self._ensure_fresh)
+        return self._lookup(rubric_id)
+
+    def _lookup(self, rubric_id) -> Rubric | None:
+        try:
+            return self._state[0].get(int(rubric_id))
+        except (TypeError, ValueError):
+            return None
+
+    def listing(self) -> tuple[str, dict]:
+        """(etag, {"rubrics": [{id, title}, ...]}) newest first."""
+        self._ensure_fresh()
+        _, etag, listing = self._state
+        return etag, listing
+
+    def stats(self) -> dict:
+        return {"version": self.version, "rubrics": len(self._state[0]), "reloads": self.reloads}
+
+
+rubric_registry = RubricRegistry()
@@ -0,0 +1,84 @@
+"""
+Full-text search over submissions.
+
+submission_search is an FTS5 table with one row per submission (rowid =
+submissions.id) holding the submission text, the text values of its
+feedback JSON and the teacher's note. Triggers from migration 14 keep it in
+step with every insert, update and delete on the three source tables, so
+the index never needs a rebuild.
+"""
+import html
+import re
+
+from fastapi import HTTPException
+
+SEARCH_PAGE_DEFAULT = 20
+SEARCH_PAGE_MAX = 100
+SEARCH_MAX_TERMS = 12
+SNIPPET_TOKENS = 16
+# a match in the student's own text ranks above one in feedback or notes
+COLUMN_WEIGHTS = (2.0, 1.0, 1.0)
+
+# stand-ins for the highlight tags, so the snippet can be HTML-escaped first;
+# a stray one in submitted text at worst adds an unbalanced <mark>
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+_TERM_RE = re.compile(r"(\w+)(\*?)")
+
+
+def match_query(q: str) -> str:
+    """
+    User input as an FTS5 query: every word must appear, "word*" matches a
+    prefix. Terms are quoted, so operators and stray punctuation cannot
+    raise a syntax error.
+    """
+    terms = [f'"{word}"{star}' for word, star in _TERM_RE.findall(q)[:SEARCH_MAX_TERMS]]
+    return " ".join(terms)
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def search_submissions(conn, q: str, *, limit: int = SEARCH_PAGE_DEFAULT, offset: int = 0,
+                       student: str | None = None, rubric_id: int | None = None) -> dict:
+    """
+    One page of submissions matching q, best bm25 first. Ranked results have
+    no stable key to resume from, so pages are by offset.
+    """
+    query = match_query(q)
+    if not query:
+        raise HTTPException(status_code=400, detail="Search query must contain a word")
+    limit = max(1, min(limit, SEARCH_PAGE_MAX))
+    offset = max(0, offset)
+
+    where, params = ["submission_search MATCH ?"], [query]
+    if student:
+        where.append("s.user_email = ?")
+        params.append(student.strip().lower())
+    if rubric_id is not None:
+        where.append("s.rubric_id = ?")
+        params.append(rubric_id)
+
+    rows = conn.execute(f"""
+        SELECT s.id, s.user_email, s.created_at, r.title AS rubric_title,
+               snippet(submission_search, -1, ?, ?, '…', ?) AS snippet,
+               bm25(submission_search, ?, ?, ?) AS score
+        FROM submission_search
+        JOIN submissions s ON s.id = submission_search.rowid
+        JOIN rubrics r ON r.id = s.rubric_id
+        WHERE {" AND ".join(where)}
+        ORDER BY score
+        LIMIT ? OFFSET ?
+    """, (_MARK_OPEN, _MARK_CLOSE, SNIPPET_TOKENS, *COLUMN_WEIGHTS, *params, limit + 1, offset)).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "results": [
+            {"id": row["id"], "user_email": row["user_email"], "created_at": row["created_at"],
+             "rubric_title": row["rubric_title"], "snippet": _highlight(row["snippet"]),
+             "score": round(-row["score"], 4)}
+            for row in rows
+        ],
+        "next_offset": offset + limit if has_more else None,
+    }
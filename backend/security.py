@@ -1,9 +1,220 @@
+"""
+Password hashing.
+
+bcrypt by default, with the cost calibrated at startup so one verification
+takes about FLOSENDO_PASSWORD_TARGET_MS on this machine (or pinned with
+FLOSENDO_BCRYPT_COST). FLOSENDO_PASSWORD_SCHEME=argon2id switches new
+hashes to argon2id (needs argon2-cffi). Every hash carries its own
+parameters, so verify_password accepts either kind and needs_rehash says
+when a stored hash is behind the current settings.
+"""
+import asyncio
+import math
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import bcrypt
 
+from backend.metrics import span, with_context
+
+try:
+    import argon2
+except ImportError:  # bcrypt only
+    argon2 = None
+
+# bcrypt releases the GIL, so a small dedicated pool gives real parallelism
+# without letting a login storm take every thread the DB layer needs
+BCRYPT_WORKERS = int(os.getenv("FLOSENDO_BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+PASSWORD_SCHEME = os.getenv("FLOSENDO_PASSWORD_SCHEME", "bcrypt").strip().lower()
+PASSWORD_TARGET_MS = float(os.getenv("FLOSENDO_PASSWORD_TARGET_MS", "100"))
+BCRYPT_COST = int(os.getenv("FLOSENDO_BCRYPT_COST", "0"))  # 0 = calibrate
+BCRYPT_MIN_COST = int(os.getenv("FLOSENDO_BCRYPT_MIN_COST", "10"))
+BCRYPT_MAX_COST = int(os.getenv("FLOSENDO_BCRYPT_MAX_COST", "14"))
+ARGON2_MEMORY_KIB = int(os.getenv("FLOSENDO_ARGON2_MEMORY_KIB", "19456"))
+ARGON2_TIME_COST = int(os.getenv("FLOSENDO_ARGON2_TIME_COST", "2"))
+ARGON2_PARALLELISM = int(os.getenv("FLOSENDO_ARGON2_PARALLELISM", "1"))
+
+SESSION_SECRET_FILE = Path(os.getenv("FLOSENDO_SESSION_SECRET_FILE",
+                                      Path(__file__).parent.parent / "data" / "session_secret"))
+
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+
+class BcryptScheme:
+    name = "bcrypt"
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, cost: int = BCRYPT_COST, target_ms: float = PASSWORD_TARGET_MS,
+                 min_cost: int = BCRYPT_MIN_COST, max_cost: int = BCRYPT_MAX_COST):
+        self.target_ms = target_ms
+        self.min_cost = min_cost
+        self.max_cost = max_cost
+        self.cost = cost or None
+        self.measured_ms: float | None = None
+        self._lock = threading.Lock()
+
+    def calibrate(self) -> int:
+        """Largest cost whose hash time stays within target_ms, clamped to [min_cost, max_cost]."""
+        with self._lock:
+            if self.cost is None:
+                base = 8
+                # best of three; each extra cost step doubles the work
+                seconds = min(_time(lambda: bcrypt.hashpw(b"calibration", bcrypt.gensalt(base))) for _ in range(3))
+                steps = math.floor(math.log2(max(self.target_ms / 1000 / seconds, 1e-9)))
+                self.cost = max(self.min_cost, min(self.max_cost, base + steps))
+                self.measured_ms = round(seconds * 1000 * 2 ** (self.cost - base), 1)
+            return self.cost
+
+    def hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.calibrate())).decode("utf-8")
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        # upgrade only: workers whose calibration lands a step apart must not
+        # keep rewriting each other's hashes
+        return int(password_hash.split("$")[2]) < self.calibrate()
+
+    def params(self) -> dict:
+        return {"cost": self.cost or 0, "target_ms": self.target_ms, "measured_ms": self.measured_ms or 0}
+
+
+class Argon2Scheme:
+    name = "argon2id"
+    prefixes = ("$argon2id$",)
+
+    def __init__(self, memory_kib: int = ARGON2_MEMORY_KIB, time_cost: int = ARGON2_TIME_COST,
+                 parallelism: int = ARGON2_PARALLELISM):
+        if argon2 is None:
+            raise RuntimeError("FLOSENDO_PASSWORD_SCHEME=argon2id needs the argon2-cffi package")
+        self.hasher = argon2.PasswordHasher(memory_cost=memory_kib, time_cost=time_cost,
+                                            parallelism=parallelism, type=argon2.Type.ID)
+
+    def calibrate(self) -> int:
+        return self.hasher.memory_cost
+
+    def hash(self, password: str) -> str:
+        return self.hasher.hash(password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        try:
+            return self.hasher.verify(password_hash, password)
+        except argon2.exceptions.VerificationError:
+            return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return self.hasher.check_needs_rehash(password_hash)
+
+    def params(self) -> dict:
+        return {"memory_kib": self.hasher.memory_cost, "time_cost": self.hasher.time_cost,
+                "parallelism": self.hasher.parallelism}
+
+
+SCHEMES = {"bcrypt": BcryptScheme, "argon2id": Argon2Scheme}
+
+
+def _time(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+class PasswordHasher:
+    """
+    New hashes use the configured scheme; verification picks the scheme from
+    the stored hash, so switching schemes leaves existing users able to log
+    in until their hash is upgraded.
+    """
+
+    def __init__(self, scheme: str = PASSWORD_SCHEME):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown password scheme: {scheme}")
+        self.scheme = SCHEMES[scheme]()
+        self._others: dict[str, object] = {}
+        self.rehashes = 0
+
+    def _scheme_for(self, password_hash: str):
+        if password_hash.startswith(self.scheme.prefixes):
+            return self.scheme
+        for name, cls in SCHEMES.items():
+            if password_hash.startswith(cls.prefixes):
+                if name not in self._others:
+                    self._others[name] = cls()
+                return self._others[name]
+        raise ValueError("Unrecognised password hash format")
+
+    def calibrate(self):
+        self.scheme.calibrate()
+
+    def hash(self, password: str) -> str:
+        return self.scheme.hash(password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._scheme_for(password_hash).verify(password, password_hash)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        scheme = self._scheme_for(password_hash)
+        return scheme is not self.scheme or scheme.needs_rehash(password_hash)
+
+    def stats(self) -> dict:
+        return {"scheme": self.scheme.name, "workers": BCRYPT_WORKERS, "rehashes": self.rehashes,
+                **self.scheme.params()}
+
+
+password_hasher = PasswordHasher()
+
+
+def session_secret() -> str:
+    """
+    FLOSENDO_SESSION_SECRET, else a random secret kept in SESSION_SECRET_FILE
+    so every worker (and the next restart) signs cookies with the same key.
+    """
+    secret = os.getenv("FLOSENDO_SESSION_SECRET", "").strip()
+    if secret:
+        return secret
+    if not SESSION_SECRET_FILE.exists():
+        SESSION_SECRET_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SESSION_SECRET_FILE.with_name(f".{SESSION_SECRET_FILE.name}.{os.getpid()}")
+        tmp.write_text(secrets.token_urlsafe(48))
+        tmp.chmod(0o600)
+        try:
+            # link fails if another process got there first; theirs wins
+            os.link(tmp, SESSION_SECRET_FILE)
+        except FileExistsError:
+            pass
+        finally:
+            tmp.unlink()
+    return SESSION_SECRET_FILE.read_text().strip()
+
+
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
+    with span("password_hash"):
+        return password_hasher.hash(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    with span("password_verify"):
+        return password_hasher.verify(password, password_hash)
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hasher.needs_rehash(password_hash)
+
+async def rehash_if_needed(password: str, password_hash: str) -> str | None:
+    """After a successful verify: a new hash when the stored one is outdated, else None."""
+    if not needs_rehash(password_hash):
+        return None
+    password_hasher.rehashes += 1
+    return await hash_password_async(password)
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, with_context(hash_password, password))
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, with_context(verify_password, password, password_hash))
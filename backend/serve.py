@@ -0,0 +1,76 @@
+"""
+Production entry point.
+
+    FLOSENDO_SESSION_SECRET=... python -m backend.serve --workers 4 --port 8000
+    python -m backend.serve --prepare-only    # e.g. as a deploy step
+
+Does the once-per-deploy work in this process: migrates the schema,
+requeues work a crashed server left running, collects upload garbage,
+rebuilds analytics, pins the bcrypt cost and builds assets. Then it
+starts uvicorn workers, which skip all of that (FLOSENDO_PREPARED=1) and
+each open their own DB pool and writer.
+"""
+import argparse
+import os
+
+import uvicorn
+
+import backend.db as db
+from backend.analytics import reconcile_analytics
+from backend.assets import build_assets, build_is_current, write_build
+from backend.extraction import recover_and_backfill
+from backend.jobs import requeue_interrupted as requeue_feedback_jobs
+from backend.outbox import requeue_interrupted as requeue_emails
+from backend.ratelimit import TRUST_PROXY
+from backend.security import PASSWORD_SCHEME, SESSION_SECRET_FILE, BcryptScheme, session_secret
+from backend.uploads import UPLOAD_DIR, collect_garbage
+
+
+def prepare():
+    db.init_db()
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    for job in (requeue_feedback_jobs, recover_and_backfill, requeue_emails,
+                lambda conn: collect_garbage(conn, UPLOAD_DIR), reconcile_analytics):
+        db.submit_write(job).result()
+    db.close_all()
+
+    # one cost for every worker, so none of them sees the others' hashes as outdated
+    if PASSWORD_SCHEME == "bcrypt" and not os.getenv("FLOSENDO_BCRYPT_COST"):
+        os.environ["FLOSENDO_BCRYPT_COST"] = str(BcryptScheme().calibrate())
+    if not os.getenv("FLOSENDO_SESSION_SECRET"):
+        session_secret()
+        print(f"FLOSENDO_SESSION_SECRET not set; using the secret in {SESSION_SECRET_FILE}")
+
+    if not build_is_current():
+        write_build(*build_assets())
+    os.environ["FLOSENDO_PREPARED"] = "1"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=os.getenv("FLOSENDO_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("FLOSENDO_PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("FLOSENDO_WORKERS", str(os.cpu_count() or 1))))
+    ap.add_argument("--limit-concurrency", type=int, default=None,
+                    help="per worker; uvicorn answers 503 beyond it")
+    ap.add_argument("--prepare-only", action="store_true")
+    args = ap.parse_args()
+
+    prepare()
+    if args.prepare_only:
+        return
+    # workers read this, e.g. to split the outbound email rate between them
+    os.environ["FLOSENDO_WORKERS"] = str(args.workers)
+    uvicorn.run(
+        "backend.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        limit_concurrency=args.limit_concurrency,
+        proxy_headers=TRUST_PROXY,
+        timeout_graceful_shutdown=30,
+    )
+
+
+if __name__ == "__main__":
+    main()
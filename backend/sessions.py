@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+import time
+
+from backend.db import pooled_conn
+
+SESSION_TTL_SECONDS = float(os.getenv("FLOSENDO_SESSION_TTL_SECONDS", "60"))
+# how often a process re-reads the users version counter, which catches
+# role and password changes made through another process or worker
+SESSION_RECHECK_SECONDS = float(os.getenv("FLOSENDO_SESSION_RECHECK_SECONDS", "2"))
+SESSION_CACHE_MAX = int(os.getenv("FLOSENDO_SESSION_CACHE_MAX", "10000"))
+
+
+class SessionStore:
+    """
+    Resolves a session's email to the user's current (role, pw_version)
+    from an in-process TTL cache, so auth checks are revocable without a
+    users query per request. invalidate() drops entries after local
+    writes; the users version counter (bumped by triggers) clears the
+    cache when another process changes a user.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, recheck_seconds: float = SESSION_RECHECK_SECONDS,
+                 max_entries: int = SESSION_CACHE_MAX):
+        self.ttl = ttl
+        self.recheck_seconds = recheck_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # email -> (role, pw_version, expires_at); role is None for a user that does not exist
+        self._entries: dict[str, tuple[str | None, int, float]] = {}
+        self.version: int | None = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _stale(self, now: float) -> bool:
+        return self.version is None or now - self._checked_at >= self.recheck_seconds
+
+    def _ensure_fresh(self, now: float):
+        if not self._stale(now):
+            return
+        with self._lock:
+            if not self._stale(now):
+                return
+            with pooled_conn() as conn:
+                row = conn.execute("SELECT version FROM registry_versions WHERE name = 'users'").fetchone()
+            version = row["version"] if row else 0
+            if version != self.version:
+                self._entries = {}
+                self.version = version
+            self._checked_at = now
+
+    def resolve(self, email: str) -> tuple[str, int] | None:
+        """(role, pw_version) for email, or None when there is no such user. Blocking; from async code use resolve_async."""
+        now = time.monotonic()
+        self._ensure_fresh(now)
+        entry = self._entries.get(email)
+        if entry is not None and entry[2] > now:
+            self.hits += 1
+        else:
+            self.misses += 1
+            with pooled_conn() as conn:
+                row = conn.execute("SELECT role, pw_version FROM users WHERE email = ?", (email,)).fetchone()
+            entry = self.put(email, row["role"], row["pw_version"]) if row else self.put(email, None, -1)
+        return None if entry[0] is None else (entry[0], entry[1])
+
+    async def resolve_async(self, email: str) -> tuple[str, int] | None:
+        # served straight from memory unless the version check or a lookup is due
+        now = time.monotonic()
+        entry = self._entries.get(email)
+        if self._stale(now) or entry is None or entry[2] <= now:
+            return await asyncio.to_thread(self.resolve, email)
+        self.hits += 1
+        return None if entry[0] is None else (entry[0], entry[1])
+
+    def put(self, email: str, role: str | None, pw_version: int) -> tuple:
+        """Primes the cache with a row just read, e.g. at login."""
+        entries = self._entries
+        if len(entries) >= self.max_entries and email not in entries:
+            entries.pop(next(iter(entries), None), None)
+        entry = entries[email] = (role, pw_version, time.monotonic() + self.ttl)
+        return entry
+
+    def invalidate(self, email: str | None = None):
+        self.invalidations += 1
+        if email is None:
+            self._entries = {}
+        else:
+            self._entries.pop(email, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "version": self.version or 0,
+        }
+
+
+session_store = SessionStore()
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import HTTPException, Request
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+
+from backend.metrics import span
+
+UPLOAD_DIR = Path(os.getenv("FLOSENDO_UPLOAD_DIR", Path(__file__).parent.parent / "data" / "uploads"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# multipart boundaries and part headers on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+def _write_chunks(f, chunks: list[bytes]):
+    with span("upload_write"):
+        for chunk in chunks:
+            f.write(chunk)
+
+
+async def receive_upload(request: Request, dest_dir: Path, max_bytes: int, validate, field: str = "file") -> dict:
+    """
+    Streams the `field` file part of a multipart request into a temp file in
+    dest_dir, hashing as it goes. Nothing larger than one network chunk is
+    held in memory, and the request is rejected as soon as the part passes
+    max_bytes. validate(filename, content_type) runs before any bytes are
+    written and should raise HTTPException to reject the file.
+
+    Returns filename, content_type, size_bytes, sha256 and temp_path; the
+    caller moves temp_path into place (or unlinks it).
+    """
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if ctype != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=dest_dir, prefix=".upload-", suffix=".part", delete=False)
+    state = {
+        "headers": {}, "header_field": b"", "header_value": b"",
+        "writing": False, "found": False,
+        "filename": None, "content_type": None, "size": 0,
+    }
+    hasher = hashlib.sha256()
+    pending: list[bytes] = []
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disp = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disp.get(b"name", b"").decode("utf-8", "replace")
+        filename = disp.get(b"filename")
+        if name != field or filename is None or state["found"]:
+            return
+        state["filename"] = filename.decode("utf-8", "replace")
+        state["content_type"] = state["headers"].get(b"content-type", b"application/octet-stream").decode("latin-1")
+        validate(state["filename"], state["content_type"])
+        state["writing"] = True
+        state["found"] = True
+
+    def on_part_data(data, start, end):
+        if not state["writing"]:
+            return
+        chunk = bytes(data[start:end])
+        state["size"] += len(chunk)
+        if state["size"] > max_bytes:
+            raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+        hasher.update(chunk)
+        pending.append(chunk)
+
+    def on_part_end():
+        state["writing"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for body in request.stream():
+            # feed the parser in fixed-size slices so pending never holds more than one
+            for i in range(0, len(body), UPLOAD_CHUNK_BYTES):
+                parser.write(body[i:i + UPLOAD_CHUNK_BYTES])
+                if pending:
+                    batch = pending[:]
+                    pending.clear()
+                    await asyncio.to_thread(_write_chunks, tmp, batch)
+        parser.finalize()
+        if not state["found"]:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        await asyncio.to_thread(tmp.close)
+    except MultipartParseError:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+
+    return {
+        "filename": state["filename"],
+        "content_type": state["content_type"],
+        "size_bytes": state["size"],
+        "sha256": hasher.hexdigest(),
+        "temp_path": Path(tmp.name),
+    }
+
+
+# --- Content-addressed storage ---
+
+STALE_PART_SECONDS = 3600
+_BLOB_NAME_RE = re.compile(r"[0-9a-f]{64}(\.\w+)?")
+
+
+def store_blob(conn, upload: dict, ext: str, upload_dir: Path) -> tuple[str, bool]:
+    """
+    Writer job: file the received temp file under its content hash.
+    Returns (stored_name, is_new). When the blob already exists the temp
+    file is left for the caller to delete.
+    """
+    now = datetime.utcnow().isoformat()
+    sha = upload["sha256"]
+    row = conn.execute("SELECT stored_name FROM upload_blobs WHERE sha256 = ?", (sha,)).fetchone()
+    if row is not None and (upload_dir / row["stored_name"]).exists():
+        conn.execute("UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE sha256 = ?", (sha,))
+        return row["stored_name"], False
+
+    stored_name = row["stored_name"] if row is not None else f"{sha}{ext}"
+    # moved before commit: a rollback leaves the file without a row, which
+    # collect_garbage reclaims; another process filing the same hash at
+    # once writes identical bytes under the same name
+    with span("upload_write"):
+        os.replace(upload["temp_path"], upload_dir / stored_name)
+    conn.execute("""
+        INSERT INTO upload_blobs (sha256, stored_name, size_bytes, ref_count, created_at)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1
+    """, (sha, stored_name, upload["size_bytes"], now))
+    return stored_name, True
+
+
+def release_blob(conn, sha256: str):
+    """Writer job: drop one reference; files are removed by collect_garbage."""
+    conn.execute("UPDATE upload_blobs SET ref_count = MAX(ref_count - 1, 0) WHERE sha256 = ?", (sha256,))
+
+
+def collect_garbage(conn, upload_dir: Path) -> dict:
+    """
+    Writer job: recount blob references from the uploads table, delete blobs
+    nothing points at, and clear out temp files left by aborted uploads and
+    blob files whose upload_blobs row was rolled back.
+    """
+    conn.execute("""
+        UPDATE upload_blobs
+        SET ref_count = (SELECT COUNT(*) FROM uploads u WHERE u.blob_sha256 = upload_blobs.sha256)
+    """)
+    dead = conn.execute("SELECT sha256, stored_name, size_bytes FROM upload_blobs WHERE ref_count = 0").fetchall()
+    freed = 0
+    for b in dead:
+        try:
+            (upload_dir / b["stored_name"]).unlink()
+        except FileNotFoundError:
+            pass
+        freed += b["size_bytes"]
+    conn.execute("DELETE FROM upload_blobs WHERE ref_count = 0")
+
+    cutoff = time.time() - STALE_PART_SECONDS
+    parts = 0
+    for p in upload_dir.glob(".upload-*.part"):
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+                parts += 1
+        except FileNotFoundError:
+            pass
+
+    # old enough that no store_blob transaction can still be about to commit them
+    known = {r["stored_name"] for r in conn.execute(
+        "SELECT stored_name FROM upload_blobs UNION SELECT stored_name FROM uploads"
+    )}
+    orphans = 0
+    for p in upload_dir.iterdir():
+        if not _BLOB_NAME_RE.fullmatch(p.name) or p.name in known:
+            continue
+        try:
+            if p.stat().st_mtime < cutoff:
+                freed += p.stat().st_size
+                p.unlink()
+                orphans += 1
+        except FileNotFoundError:
+            pass
+
+    return {"blobs_removed": len(dead), "bytes_freed": freed, "stale_parts_removed": parts,
+            "orphans_removed": orphans}
+
+
+def storage_stats(conn) -> dict:
+    logical = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) AS b, COUNT(*) AS c FROM uploads").fetchone()
+    blobs = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) AS b, COUNT(*) AS c FROM upload_blobs").fetchone()
+    legacy = conn.execute(
+        "SELECT COALESCE(SUM(size_bytes), 0) AS b FROM uploads WHERE blob_sha256 IS NULL"
+    ).fetchone()
+    physical = blobs["b"] + legacy["b"]
+    return {
+        "uploads": logical["c"],
+        "blobs": blobs["c"],
+        "logical_bytes": logical["b"],
+        "physical_bytes": physical,
+        "bytes_saved": logical["b"] - physical,
+    }
@@ -0,0 +1,84 @@
+"""
+Stand-in for the email provider, speaking the batch API the outbox uses.
+
+    python -m bench.email_stub --port 8766 --delay 0.5 --error-rate 0.2
+    FLOSENDO_EMAIL_API_URL=http://127.0.0.1:8766 RESEND_API_KEY=test uvicorn backend.main:app
+
+--delay adds latency per call, --error-rate answers that fraction of calls
+with --error-status (503 by default, 429 adds Retry-After: 1). GET /stats
+reports calls, delivered mail and connections seen, so keep-alive reuse
+and batching are visible.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(args):
+    lock = threading.Lock()
+    stats = {"calls": 0, "errors": 0, "delivered": 0, "connections": 0, "max_batch": 0}
+    delivered: list[dict] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats["connections"] += 1
+
+        def do_GET(self):
+            with lock:
+                payload = {**stats, "last": delivered[-5:]}
+            self._send(200, payload)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+            messages = body if isinstance(body, list) else [body]
+            time.sleep(args.delay)
+            with lock:
+                stats["calls"] += 1
+                if random.random() < args.error_rate:
+                    stats["errors"] += 1
+                    self._send(args.error_status, {"message": "stub failure"},
+                               {"Retry-After": "1"} if args.error_status == 429 else {})
+                    return
+                stats["delivered"] += len(messages)
+                stats["max_batch"] = max(stats["max_batch"], len(messages))
+                first = stats["delivered"] - len(messages)
+                delivered.extend({"to": m.get("to"), "subject": m.get("subject")} for m in messages)
+                del delivered[:-100]
+            ids = [{"id": f"stub-{first + i}"} for i in range(len(messages))]
+            self._send(200, {"data": ids} if isinstance(body, list) else ids[0])
+
+        def _send(self, status: int, payload: dict, headers: dict | None = None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--delay", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", type=int, default=503)
+    args = ap.parse_args()
+    ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Stand-in for a local model server, speaking HttpEngine's protocol.
+
+    python -m bench.engine_stub --port 8765 --delay 0.2 --stall-rate 0.1
+    FLOSENDO_FEEDBACK_ENGINE=http uvicorn backend.main:app
+
+--delay adds latency per call, --stall-rate makes that fraction of calls
+hang for --stall seconds and --error-rate answers 500, so timeouts,
+fallback and the circuit breaker can be exercised locally.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            roll = random.random()
+            time.sleep(args.stall if roll < args.stall_rate else args.delay)
+            if args.stall_rate <= roll < args.stall_rate + args.error_rate:
+                self._send(500, {"error": "stub failure"})
+                return
+            criteria = body.get("rubric", {}).get("criteria", [])
+            results = [{
+                "overall_summary": "Stub engine feedback.",
+                "rubric_breakdown": [
+                    {"criterion": c.get("name"), "score": 4, "strengths": "stub", "improvements": "stub",
+                     "evidence": text[:120] + "..."}
+                    for c in criteria
+                ],
+                "next_steps": ["Stub next step."],
+            } for text in body.get("submissions", [])]
+            self._send(200, {"results": results})
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--delay", type=float, default=0.05)
+    ap.add_argument("--stall", type=float, default=60)
+    ap.add_argument("--stall-rate", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Extraction survives a dead worker process.
+
+    python -m bench.extraction_recovery
+
+Extracts one file, SIGKILLs every process in the pool, queues a second
+file and checks that it is still extracted, on a replacement pool,
+against a scratch db. Exits 1 if it is not.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import backend.db as db
+
+TEXT_TYPE = "text/plain"
+
+
+async def wait_done(sha256: str, timeout: float) -> str:
+    deadline = time.monotonic() + timeout
+    while True:
+        row = await db.run_read(lambda conn: conn.execute(
+            "SELECT status FROM attachment_texts WHERE sha256 = ?", (sha256,)
+        ).fetchone())
+        if row["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return row["status"]
+        await asyncio.sleep(0.1)
+
+
+async def run(upload_dir: Path, timeout: float) -> dict:
+    from backend.extraction import ExtractionQueue, enqueue_extraction
+
+    queue = ExtractionQueue(workers=1)
+    await queue.start(upload_dir)
+
+    async def extract(name: str) -> str:
+        (upload_dir / name).write_text(f"{name} " * 500)
+        await db.run_write(lambda conn: enqueue_extraction(conn, name, name, TEXT_TYPE))
+        queue.notify()
+        return await wait_done(name, timeout)
+
+    try:
+        before = await extract("before-kill")
+        for pid in list(queue._executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        after = await extract("after-kill")
+    finally:
+        await queue.stop()
+    return {"before_kill": before, "after_kill": after, **queue.stats()}
+
+
+def main():
+    timeout = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    scratch = Path(tempfile.mkdtemp())
+    db.DB_PATH = scratch / "bench.db"
+    db.init_db()
+    (scratch / "uploads").mkdir()
+    result = asyncio.run(run(scratch / "uploads", timeout))
+    print(json.dumps(result, indent=2))
+    ok = result["before_kill"] == result["after_kill"] == "done" and result["pool_restarts"] == 1
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Feedback generation throughput by micro-batch size.
+
+    python -m bench.feedback_batch --items 4000 --concurrency 256 --sizes 1,4,16,64
+
+Drives FeedbackBatcher from many concurrent callers spread over a few
+rubrics, with unique texts so every item misses the cache, against a
+scratch db.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import backend.db as db
+
+RUBRICS = [
+    {"id": n, "criteria": [{"name": f"Criterion {n}.{c}", "description": ""} for c in range(5)]}
+    for n in range(1, 4)
+]
+
+
+async def run(size: int, items: int, concurrency: int, wait_ms: float) -> dict:
+    from backend.feedback_pipeline import FeedbackBatcher
+
+    batcher = FeedbackBatcher(max_batch=size, max_wait=wait_ms / 1000)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(items):
+        queue.put_nowait(i)
+
+    async def caller():
+        while not queue.empty():
+            i = queue.get_nowait()
+            await batcher.generate(f"size {size} submission {i} " + "about budgets and customers " * 20,
+                                   RUBRICS[i % len(RUBRICS)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    # let fire-and-forget cache writes drain so they do not bleed into the next size
+    await asyncio.wrap_future(db.submit_write(lambda conn: None))
+    return {"batch_size": size, "items_per_s": round(items / elapsed, 1), **batcher.stats()}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=4000)
+    ap.add_argument("--concurrency", type=int, default=256)
+    ap.add_argument("--sizes", default="1,4,16,64")
+    ap.add_argument("--wait-ms", type=float, default=20)
+    args = ap.parse_args()
+
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init_db()
+    results = [asyncio.run(run(int(s), args.items, args.concurrency, args.wait_ms)) for s in args.sizes.split(",")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Seeded load test for the core endpoints.
+
+    pip install -r bench/requirements.txt
+    python -m bench.load --students 200 --rubrics 20 --submissions 20000 \\
+        --clients 32 --duration 30 --mix default
+    python -m bench.load --compare bench/results/A.json bench/results/B.json
+
+Builds a scratch db with backend/seed.py and backend/seed_rubrics.py,
+scales it up with generated users, rubrics and submissions, starts uvicorn
+on it in a subprocess and drives a weighted scenario mix from concurrent
+clients. Throughput, p50/p95/p99 per endpoint and server memory are
+printed and written to bench/results/<timestamp>-<commit>-<mix>.json.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from bench.login_storm import percentile
+from bench.upload_rss import free_port, vm_kb
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+PASSWORD = "password123"
+
+MIXES = {
+    "default": {"student_submit": 30, "teacher_review": 30, "chat_attachments": 20, "upload": 10, "login": 10},
+    "students": {"student_submit": 60, "chat_attachments": 30, "upload": 10},
+    "teachers": {"teacher_review": 100},
+    "login_storm": {"login": 100},
+}
+
+WORDS = (
+    "idea market customer budget profit risk plan evidence example saving interest loan value "
+    "problem solution pitch team growth cost price reflection learning decision goal"
+).split()
+
+SERVER = textwrap.dedent("""
+    import sys
+    from pathlib import Path
+    import backend.db as db
+    tmp = Path(sys.argv[1])
+    db.DB_PATH = tmp / "bench.db"
+    import backend.main as main
+    main.UPLOAD_DIR = tmp / "uploads"
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+""")
+
+
+# --- Seeding ---
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def seed_db(db_path: Path, students: int, teachers: int, rubrics: int, submissions: int,
+            days: int, review_rate: float, seed: int) -> dict:
+    """
+    Runs the repo's own seed scripts against db_path, then adds generated
+    rows on top. One bcrypt hash is shared by every generated user.
+    """
+    # seed.py / seed_rubrics.py import their siblings as top-level modules
+    sys.path.insert(0, str(ROOT / "backend"))
+    import db as flat_db
+    flat_db.DB_PATH = db_path
+    import seed as seed_users
+    import seed_rubrics
+    seed_users.seed()
+    seed_rubrics.seed()
+    from security import hash_password
+
+    rng = random.Random(seed)
+    conn = flat_db.get_conn()
+    pw_hash = hash_password(PASSWORD)
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (email, password_hash, role) VALUES (?, ?, ?)",
+        [(f"student{i}@bench", pw_hash, "student") for i in range(students)]
+        + [(f"teacher{i}@bench", pw_hash, "teacher") for i in range(teachers)],
+    )
+
+    existing = conn.execute("SELECT COUNT(*) AS c FROM rubrics").fetchone()["c"]
+    base = seed_rubrics.RUBRICS
+    conn.executemany(
+        "INSERT INTO rubrics (title, criteria_json) VALUES (?, ?)",
+        [(f"{base[i % len(base)]['title']} #{i + 1}", json.dumps(base[i % len(base)]["criteria"]))
+         for i in range(max(0, rubrics - existing))],
+    )
+    rubric_ids = [r["id"] for r in conn.execute("SELECT id FROM rubrics").fetchall()]
+
+    now = datetime.utcnow()
+    batch = []
+    for _ in range(submissions):
+        created = now - timedelta(seconds=rng.randint(0, days * 86400))
+        batch.append((f"student{rng.randrange(students)}@bench", rng.choice(rubric_ids),
+                      _text(rng, rng.randint(40, 200)), created.isoformat()))
+    # oldest first so ids follow created_at like real traffic
+    batch.sort(key=lambda b: b[3])
+    conn.executemany(
+        "INSERT INTO submissions (user_email, rubric_id, submission_text, created_at) VALUES (?, ?, ?, ?)", batch,
+    )
+    ids = [r["id"] for r in conn.execute("SELECT id FROM submissions").fetchall()]
+    feedback = json.dumps({"overall_summary": "Seeded feedback.", "rubric_breakdown": [], "next_steps": []})
+    conn.executemany(
+        "INSERT INTO feedback (submission_id, feedback_json, created_at) VALUES (?, ?, ?)",
+        [(sid, feedback, now.isoformat()) for sid in ids],
+    )
+    conn.executemany(
+        "INSERT INTO teacher_reviews (submission_id, flagged, note, updated_at) VALUES (?, ?, '', ?)",
+        [(sid, int(rng.random() < 0.2), now.isoformat()) for sid in ids if rng.random() < review_rate],
+    )
+    conn.commit()
+    counts = {t: conn.execute(f"SELECT COUNT(*) AS c FROM {t}").fetchone()["c"]
+              for t in ("users", "rubrics", "submissions", "teacher_reviews")}
+    conn.close()
+    return {"rubric_ids": rubric_ids, "counts": counts}
+
+
+# --- Scenarios ---
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.recording = False
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kwargs)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            r, ok = None, False
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.recording:
+            self.samples.setdefault(label, []).append(elapsed)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return r if ok else None
+
+
+class VirtualClient:
+    def __init__(self, base: str, n: int, students: int, teachers: int, rubric_ids: list[int], rng: random.Random):
+        self.base = base
+        self.student_email = f"student{n % students}@bench"
+        self.teacher_email = f"teacher{n % teachers}@bench"
+        self.students = students
+        self.rubric_ids = rubric_ids
+        self.rng = rng
+        self.student = httpx.AsyncClient(base_url=base, timeout=60)
+        self.teacher = httpx.AsyncClient(base_url=base, timeout=60)
+        self.attachment_id = None
+
+    async def setup(self):
+        for c, email in ((self.student, self.student_email), (self.teacher, self.teacher_email)):
+            r = await c.post("/auth/login", json={"email": email, "password": PASSWORD})
+            r.raise_for_status()
+        r = await self.student.post("/api/uploads", files={
+            "file": ("notes.txt", _text(self.rng, 300).encode(), "text/plain"),
+        })
+        r.raise_for_status()
+        self.attachment_id = r.json()["upload_id"]
+
+    async def close(self):
+        await self.student.aclose()
+        await self.teacher.aclose()
+
+    async def student_submit(self, rec: Recorder):
+        await rec.call(self.student, "POST /api/submissions", "POST", "/api/submissions", json={
+            "rubric_id": self.rng.choice(self.rubric_ids),
+            "submission_text": _text(self.rng, self.rng.randint(40, 200)),
+        })
+        await rec.call(self.student, "GET /api/submissions/me", "GET", "/api/submissions/me")
+
+    async def teacher_review(self, rec: Recorder):
+        r = await rec.call(self.teacher, "GET /api/teacher/submissions", "GET", "/api/teacher/submissions")
+        items = r.json()["submissions"] if r is not None else []
+        if not items:
+            return
+        sid = self.rng.choice(items)["id"]
+        await rec.call(self.teacher, "GET /api/teacher/review/{id}", "GET", f"/api/teacher/review/{sid}")
+        await rec.call(self.teacher, "POST /api/teacher/review/{id}", "POST", f"/api/teacher/review/{sid}",
+                       json={"flagged": self.rng.random() < 0.2, "note": "bench"})
+
+    async def chat_attachments(self, rec: Recorder):
+        await rec.call(self.student, "POST /api/chat", "POST", "/api/chat", json={
+            "mode": "general", "message": "Can you help me improve this?",
+            "attachment_ids": [self.attachment_id],
+        })
+
+    async def upload(self, rec: Recorder):
+        await rec.call(self.student, "POST /api/uploads", "POST", "/api/uploads", files={
+            "file": (f"draft{self.rng.randrange(10**6)}.txt", _text(self.rng, 2000).encode(), "text/plain"),
+        })
+
+    async def login(self, rec: Recorder):
+        async with httpx.AsyncClient(base_url=self.base, timeout=60) as c:
+            await rec.call(c, "POST /auth/login", "POST", "/auth/login", json={
+                "email": f"student{self.rng.randrange(self.students)}@bench", "password": PASSWORD,
+            })
+
+
+def parse_mix(spec: str) -> dict:
+    if spec in MIXES:
+        return MIXES[spec]
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {n for m in MIXES.values() for n in m}
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def drive(base: str, args, rubric_ids: list[int], pid: int) -> dict:
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rec = Recorder()
+    clients = [VirtualClient(base, n, args.students, args.teachers, rubric_ids, random.Random(args.seed + n))
+               for n in range(args.clients)]
+    await asyncio.gather(*(c.setup() for c in clients))
+
+    rss: list[int] = []
+    stop = asyncio.Event()
+
+    async def sample_rss():
+        while not stop.is_set():
+            rss.append(vm_kb(pid, "VmRSS"))
+            await asyncio.sleep(0.5)
+
+    async def loop(c: VirtualClient, deadline: float):
+        while time.perf_counter() < deadline:
+            scenario = c.rng.choices(names, weights)[0]
+            await getattr(c, scenario)(rec)
+
+    idle_kb = vm_kb(pid, "VmRSS")
+    sampler = asyncio.create_task(sample_rss())
+    warm_end = time.perf_counter() + args.warmup
+    end = warm_end + args.duration
+
+    async def start_recording():
+        await asyncio.sleep(args.warmup)
+        rec.recording = True
+
+    started = time.perf_counter()
+    await asyncio.gather(start_recording(), *(loop(c, end) for c in clients))
+    measured = time.perf_counter() - started - args.warmup
+    stop.set()
+    await sampler
+    peak_kb = vm_kb(pid, "VmHWM")
+    await asyncio.gather(*(c.close() for c in clients))
+
+    endpoints = {}
+    for label, samples in sorted(rec.samples.items()):
+        endpoints[label] = {
+            "count": len(samples),
+            "errors": rec.errors.get(label, 0),
+            "rps": round(len(samples) / measured, 1),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+            "max_ms": round(max(samples), 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "mix": mix,
+        "throughput_rps": round(total / measured, 1),
+        "requests": total,
+        "errors": sum(rec.errors.values()),
+        "endpoints": endpoints,
+        "memory": {
+            "idle_rss_mb": round(idle_kb / 1024, 1),
+            "mean_rss_mb": round(sum(rss) / len(rss) / 1024, 1) if rss else 0.0,
+            "peak_rss_mb": round(peak_kb / 1024, 1),
+        },
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(a_path: str, b_path: str):
+    a, b = (json.loads(Path(p).read_text()) for p in (a_path, b_path))
+    print(f"{a['meta']['commit']} -> {b['meta']['commit']}")
+    print(f"throughput_rps: {a['throughput_rps']} -> {b['throughput_rps']}")
+    for label in sorted(set(a["endpoints"]) | set(b["endpoints"])):
+        ea, eb = a["endpoints"].get(label), b["endpoints"].get(label)
+        if not ea or not eb:
+            print(f"{label}: only in {'A' if ea else 'B'}")
+            continue
+        cols = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            delta = (eb[key] - ea[key]) / ea[key] * 100 if ea[key] else 0.0
+            cols.append(f"{key} {ea[key]} -> {eb[key]} ({delta:+.0f}%)")
+        print(f"{label}: " + ", ".join(cols))
+    print(f"peak_rss_mb: {a['memory']['peak_rss_mb']} -> {b['memory']['peak_rss_mb']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--students", type=int, default=200)
+    ap.add_argument("--teachers", type=int, default=10)
+    ap.add_argument("--rubrics", type=int, default=20)
+    ap.add_argument("--submissions", type=int, default=20000)
+    ap.add_argument("--days", type=int, default=180, help="spread of seeded submission dates")
+    ap.add_argument("--review-rate", type=float, default=0.3)
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--warmup", type=float, default=3)
+    ap.add_argument("--mix", default="default", help=f"{', '.join(MIXES)} or name=weight,...")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", type=Path, default=None, help="result file (default bench/results/...)")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"))
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    parse_mix(args.mix)
+    tmp = Path(tempfile.mkdtemp())
+    seed_start = time.perf_counter()
+    seeded = seed_db(tmp / "bench.db", args.students, args.teachers, args.rubrics, args.submissions,
+                     args.days, args.review_rate, args.seed)
+    seed_s = time.perf_counter() - seed_start
+
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(tmp), str(port)], cwd=ROOT)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(base + "/auth/me")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        result = asyncio.run(drive(base, args, seeded["rubric_ids"], proc.pid))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    commit = _git_commit()
+    result["meta"] = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "seeded": seeded["counts"],
+        "seed_s": round(seed_s, 2),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+    }
+
+    out = args.out
+    if out is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        out = RESULTS_DIR / f"{stamp}-{commit}-{args.mix.replace(',', '_').replace('=', '')}.json"
+    out.write_text(json.dumps(result, indent=2))
+    print(json.dumps({k: result[k] for k in ("throughput_rps", "requests", "errors", "memory")}, indent=2))
+    for label, e in result["endpoints"].items():
+        print(f"{label:34} {e['rps']:>7} rps  p50 {e['p50_ms']:>8}  p95 {e['p95_ms']:>8}  p99 {e['p99_ms']:>8} ms"
+              f"  errors {e['errors']}")
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+CPU spent on a flood of bad logins, with and without the auth rate limiter.
+
+    pip install -r bench/requirements.txt
+    python -m bench.login_flood --floods 100,400 --concurrency 32
+
+Runs the app in-process over ASGI against a scratch db and fires each
+flood of wrong-password logins from one IP across many emails. With the
+limiter on, CPU time should stay near (burst capacity x one verify)
+however large the flood; without it, it grows with every request.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import backend.db as db
+
+PASSWORD = "password123"
+
+
+async def flood(app, size: int, concurrency: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    statuses: dict[int, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(size):
+        queue.put_nowait(i)
+
+    async def attacker():
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            while not queue.empty():
+                i = queue.get_nowait()
+                r = await c.post("/auth/login", json={"email": f"victim{i % 50}@bench", "password": "wrong"})
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(attacker() for _ in range(concurrency)))
+    return {
+        "requests": size,
+        "verified_401": statuses.get(401, 0),
+        "rejected_429": statuses.get(429, 0),
+        "cpu_s": round(time.process_time() - cpu, 3),
+        "wall_s": round(time.perf_counter() - wall, 3),
+    }
+
+
+async def run(sizes: list[int], concurrency: int) -> list[dict]:
+    from backend.main import app
+    from backend.ratelimit import rate_limiter
+    from backend.security import hash_password
+
+    pw_hash = hash_password(PASSWORD)
+    conn = db.get_conn()
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (email, password_hash, role) VALUES (?, ?, 'student')",
+        [(f"victim{i}@bench", pw_hash) for i in range(50)],
+    )
+    conn.commit()
+    conn.close()
+
+    results = []
+    for enabled in (False, True):
+        rate_limiter.enabled = enabled
+        for size in sizes:
+            await db.run_write(lambda conn: conn.execute("DELETE FROM rate_limits"))
+            results.append({"limiter": enabled, **await flood(app, size, concurrency)})
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--floods", default="100,400")
+    ap.add_argument("--concurrency", type=int, default=32)
+    args = ap.parse_args()
+
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init_db()
+    print(json.dumps(asyncio.run(run([int(s) for s in args.floods.split(",")], args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
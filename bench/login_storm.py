@@ -0,0 +1,108 @@
+"""
+/auth/me latency while a burst of logins is in flight.
+
+    pip install -r bench/requirements.txt
+    python -m bench.login_storm --logins 50 --me-requests 200
+
+Runs the app in-process over ASGI against a scratch db, so any blocking
+call inside an async handler shows up directly as /auth/me latency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import backend.db as db
+
+PASSWORD = "password123"
+
+
+def percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def loop_lag(stop: asyncio.Event, samples: list[float], interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval) * 1000)
+
+
+async def run(logins: int, me_requests: int) -> dict:
+    import httpx
+    from backend.main import app
+    from backend.security import BCRYPT_WORKERS, hash_password
+
+    conn = db.get_conn()
+    pw_hash = hash_password(PASSWORD)
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (email, password_hash, role) VALUES (?, ?, 'student')",
+        [(f"storm{i}@bench", pw_hash) for i in range(logins)] + [("watcher@bench", pw_hash)],
+    )
+    conn.commit()
+    conn.close()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as watcher:
+        r = await watcher.post("/auth/login", json={"email": "watcher@bench", "password": PASSWORD})
+        r.raise_for_status()
+
+        async def one_login(i):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+                r = await c.post("/auth/login", json={"email": f"storm{i}@bench", "password": PASSWORD})
+                r.raise_for_status()
+
+        me_latencies: list[float] = []
+
+        async def poll_me():
+            for _ in range(me_requests):
+                start = time.perf_counter()
+                r = await watcher.get("/auth/me")
+                r.raise_for_status()
+                me_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        lag: list[float] = []
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(loop_lag(stop, lag))
+
+        start = time.perf_counter()
+        await asyncio.gather(poll_me(), *(one_login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_task
+
+    return {
+        "logins": logins,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(logins / elapsed, 1),
+        "logins_per_s_per_core": round(logins / elapsed / min(BCRYPT_WORKERS, os.cpu_count() or 1), 1),
+        "me_p50_ms": round(percentile(me_latencies, 50), 2),
+        "me_p99_ms": round(percentile(me_latencies, 99), 2),
+        "me_max_ms": round(max(me_latencies), 2),
+        "loop_lag_mean_ms": round(statistics.mean(lag), 2) if lag else 0.0,
+        "loop_lag_max_ms": round(max(lag), 2) if lag else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logins", type=int, default=50)
+    ap.add_argument("--me-requests", type=int, default=200)
+    args = ap.parse_args()
+
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    print(json.dumps(asyncio.run(run(args.logins, args.me_requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
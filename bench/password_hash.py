@@ -0,0 +1,66 @@
+"""
+Password verification throughput, i.e. the CPU ceiling on logins.
+
+    python -m bench.password_hash --costs 10,11,12 --argon2-memory 19456,65536 --threads 4
+
+For each bcrypt cost (and argon2id memory cost, when argon2-cffi is
+installed) verifies one hash repeatedly from --threads threads and reports
+logins/s overall and per core actually used.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.security import Argon2Scheme, BcryptScheme, argon2
+
+PASSWORD = "password123"
+
+
+def measure(scheme, seconds: float, threads: int) -> dict:
+    password_hash = scheme.hash(PASSWORD)
+    deadline = time.perf_counter() + seconds
+
+    def worker() -> int:
+        n = 0
+        while time.perf_counter() < deadline:
+            assert scheme.verify(PASSWORD, password_hash)
+            n += 1
+        return n
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(lambda _: worker(), range(threads)))
+    elapsed = time.perf_counter() - start
+    cores = min(threads, os.cpu_count() or 1)
+    return {
+        "scheme": scheme.name,
+        **scheme.params(),
+        "threads": threads,
+        "verify_ms": round(elapsed * threads / total * 1000, 1),
+        "logins_per_s": round(total / elapsed, 1),
+        "logins_per_s_per_core": round(total / elapsed / cores, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--costs", default="10,11,12")
+    ap.add_argument("--argon2-memory", default="19456,65536", help="KiB, comma separated")
+    ap.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    args = ap.parse_args()
+
+    calibrated = BcryptScheme()
+    results = [{"calibrated_cost": calibrated.calibrate(), "target_ms": calibrated.target_ms}]
+    for cost in args.costs.split(","):
+        results.append(measure(BcryptScheme(cost=int(cost)), args.seconds, args.threads))
+    if argon2 is not None:
+        for memory in args.argon2_memory.split(","):
+            results.append(measure(Argon2Scheme(memory_kib=int(memory)), args.seconds, args.threads))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Mixed read/write throughput against a scratch SQLite db.
+
+    python -m bench.sqlite_mixed --seconds 5 --readers 8 --writers 8
+
+"before": rollback journal, every writer opens its own connection and commits.
+"after":  WAL + tuned pragmas, reads from the pool, writes through the writer queue.
+"""
+import argparse
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import backend.db as db
+
+LIST_SQL = """
+    SELECT s.id, s.user_email, s.created_at, r.title as rubric_title
+    FROM submissions s
+    JOIN rubrics r ON r.id = s.rubric_id
+    ORDER BY s.id DESC
+    LIMIT 50
+"""
+
+INSERT_SQL = "INSERT INTO submissions (user_email, rubric_id, submission_text, created_at) VALUES (?, ?, ?, ?)"
+
+
+def setup(path: Path, mode: str, seed_rows: int):
+    db.DB_PATH = path
+    db.STORAGE_MODE = mode
+    db._pool = None
+    db._writer = None
+    db.init_db()
+    conn = db.get_conn()
+    conn.execute("INSERT INTO rubrics (title, criteria_json) VALUES ('Bench', '[]')")
+    now = datetime.utcnow().isoformat()
+    conn.executemany(INSERT_SQL, [(f"s{i % 200}@bench", 1, "x" * 200, now) for i in range(seed_rows)])
+    conn.commit()
+    conn.close()
+
+
+def run(mode: str, seconds: float, readers: int, writers: int, seed_rows: int) -> dict:
+    tmp = Path(tempfile.mkdtemp())
+    setup(tmp / "bench.db", mode, seed_rows)
+
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while not stop.is_set():
+            try:
+                if mode == "wal":
+                    with db.pooled_conn() as conn:
+                        conn.execute(LIST_SQL).fetchall()
+                else:
+                    conn = db.get_conn()
+                    conn.execute(LIST_SQL).fetchall()
+                    conn.close()
+                bump("reads")
+            except sqlite3.OperationalError:
+                bump("locked")
+
+    def writer(n):
+        row = (f"w{n}@bench", 1, "y" * 200, datetime.utcnow().isoformat())
+        while not stop.is_set():
+            try:
+                if mode == "wal":
+                    db.submit_write(lambda conn: conn.execute(INSERT_SQL, row)).result()
+                else:
+                    conn = db.get_conn()
+                    conn.execute(INSERT_SQL, row)
+                    conn.commit()
+                    conn.close()
+                bump("writes")
+            except sqlite3.OperationalError:
+                bump("locked")
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    if mode == "wal":
+        db.get_writer().close()
+        db.get_pool().close()
+
+    return {
+        "mode": mode,
+        "reads_per_s": round(counts["reads"] / elapsed, 1),
+        "writes_per_s": round(counts["writes"] / elapsed, 1),
+        "lock_errors": counts["locked"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--seed-rows", type=int, default=20000)
+    args = ap.parse_args()
+
+    results = [run(mode, args.seconds, args.readers, args.writers, args.seed_rows) for mode in ("rollback", "wal")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Peak server memory while many large uploads arrive at once.
+
+    pip install -r bench/requirements.txt
+    python -m bench.upload_rss --clients 30 --size-mb 15
+
+Starts uvicorn in a subprocess on a scratch db/upload dir, streams the
+uploads from generator bodies (so the client side stays small), and reads
+the server's peak RSS (VmHWM) from /proc.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+
+import httpx
+
+BOUNDARY = "benchboundary7d1f"
+CHUNK = 256 * 1024
+
+SERVER = textwrap.dedent("""
+    import sys
+    from pathlib import Path
+    import backend.db as db
+    tmp = Path(sys.argv[1])
+    db.DB_PATH = tmp / "bench.db"
+    db.init_db()
+    from backend.security import hash_password
+    conn = db.get_conn()
+    conn.execute("INSERT OR IGNORE INTO users (email, password_hash, role) VALUES ('upload@bench', ?, 'student')",
+                 (hash_password("password123"),))
+    conn.commit()
+    conn.close()
+    import backend.main as main
+    main.UPLOAD_DIR = tmp / "uploads"
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+""")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def vm_kb(pid: int, field: str) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith(field + ":"):
+            return int(line.split()[1])
+    return 0
+
+
+def multipart_body(size: int):
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="bench.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    block = b"%PDF" + os.urandom(CHUNK - 4)
+
+    async def gen():
+        yield head
+        sent = 0
+        while sent < size:
+            n = min(CHUNK, size - sent)
+            yield block[:n]
+            sent += n
+        yield tail
+
+    return gen(), len(head) + size + len(tail)
+
+
+async def run(base: str, clients: int, size: int) -> list[float]:
+    async with httpx.AsyncClient(base_url=base, timeout=120) as c:
+        r = await c.post("/auth/login", json={"email": "upload@bench", "password": "password123"})
+        r.raise_for_status()
+
+        async def one():
+            body, length = multipart_body(size)
+            start = time.perf_counter()
+            r = await c.post("/api/uploads", content=body, headers={
+                "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+                "Content-Length": str(length),
+            })
+            r.raise_for_status()
+            return time.perf_counter() - start
+
+        return await asyncio.gather(*(one() for _ in range(clients)))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=30)
+    ap.add_argument("--size-mb", type=float, default=15)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(tmp), str(port)])
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base + "/auth/me")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        idle_kb = vm_kb(proc.pid, "VmRSS")
+        durations = asyncio.run(run(base, args.clients, int(args.size_mb * 1024 * 1024)))
+        peak_kb = vm_kb(proc.pid, "VmHWM")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(json.dumps({
+        "clients": args.clients,
+        "size_mb": args.size_mb,
+        "idle_rss_mb": round(idle_kb / 1024, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_over_idle_mb": round((peak_kb - idle_kb) / 1024, 1),
+        "slowest_upload_s": round(max(durations), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,7 @@ async function loadAnalytics() {
     <li><strong>Total users:</strong> ${a.users_count}</li>
     <li><strong>Total submissions:</strong> ${a.submissions_count}</li>
     <li><strong>Top rubric:</strong> ${a.top_rubric ? escapeHtml(a.top_rubric.title) + " (" + a.top_rubric.count + ")" : "—"}</li>
+    <li><strong>Flagged reviews:</strong> ${a.flagged_count} of ${a.reviewed_count} (${Math.round(a.flagged_rate * 100)}%)</li>
   `;
 }
 
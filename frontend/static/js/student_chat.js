@@ -31,9 +31,17 @@ function appendChat(logEl, who, text) {
   const div = document.createElement("div");
   div.className = "chat-msg";
   const labelClass = who === "You" ? "chat-user" : "chat-bot";
-  div.innerHTML = `<span class="${labelClass}">${escapeHtml(who)}:</span> ${escapeHtml(text).replaceAll("\n", "<br/>")}`;
+  div.innerHTML = `<span class="${labelClass}">${escapeHtml(who)}:</span> <span class="chat-text">${escapeHtml(text).replaceAll("\n", "<br/>")}</span>`;
   logEl.appendChild(div);
   logEl.scrollTop = logEl.scrollHeight;
+  return div;
+}
+
+// Adds streamed text to a message created by appendChat
+function appendChatText(logEl, msgEl, text) {
+  const textEl = msgEl.querySelector(".chat-text");
+  textEl.innerHTML += escapeHtml(text).replaceAll("\n", "<br/>");
+  logEl.scrollTop = logEl.scrollHeight;
 }
 
 
@@ -75,8 +83,9 @@ async function uploadFiles(fileInputEl, statusEl) {
   return data.files || [];
 }
 
-async function sendChat(mode, message, submissionId, fileIds = []) {
-  const payload = { mode, message };
+// Streams the reply as server-sent events, calling onToken for each chunk
+async function sendChat(mode, message, submissionId, fileIds = [], onToken = () => {}) {
+  const payload = { mode, message, stream: true };
 
   if (mode === "feedback") payload.submission_id = submissionId;
 
@@ -89,11 +98,41 @@ async function sendChat(mode, message, submissionId, fileIds = []) {
     body: JSON.stringify(payload)
   });
 
-  const data = await res.json().catch(() => ({}));
   if (!res.ok) {
+    const data = await res.json().catch(() => ({}));
     throw new Error(data.detail || "Chat request failed");
   }
-  return data.reply;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let reply = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach(line => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+
+      if (event === "token") {
+        const token = JSON.parse(data);
+        reply += token;
+        onToken(token);
+      }
+    }
+  }
+  return reply;
 }
 
 // Feedback chat
@@ -119,9 +158,9 @@ feedbackChatSendBtn?.addEventListener("click", async () => {
     const uploaded = await uploadFiles(feedbackChatFiles, feedbackChatFilesMsg);
     const fileIds = uploaded.map(f => f.id);
 
-    // send chat with file IDs
-    const reply = await sendChat("feedback", msg, sid, fileIds);
-    appendChat(feedbackChatLog, "Copilot", reply);
+    // send chat with file IDs, rendering the reply as it streams in
+    const replyEl = appendChat(feedbackChatLog, "Copilot", "");
+    await sendChat("feedback", msg, sid, fileIds, token => appendChatText(feedbackChatLog, replyEl, token));
   } catch (e) {
     feedbackChatMsg.textContent = e.message || "Error";
   } finally {
@@ -146,8 +185,8 @@ generalChatSendBtn?.addEventListener("click", async () => {
     const uploaded = await uploadFiles(generalChatFiles, generalChatFilesMsg);
     const fileIds = uploaded.map(f => f.id);
 
-    const reply = await sendChat("general", msg, null, fileIds);
-    appendChat(generalChatLog, "Copilot", reply);
+    const replyEl = appendChat(generalChatLog, "Copilot", "");
+    await sendChat("general", msg, null, fileIds, token => appendChatText(generalChatLog, replyEl, token));
   } catch (e) {
     generalChatMsg.textContent = e.message || "Error";
   } finally {
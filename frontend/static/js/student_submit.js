@@ -42,38 +42,58 @@ async function loadRubrics() {
   });
 }
 
-async function loadMySubmissions() {
-  mySubmissionsEl.innerHTML = "<li>Loading...</li>";
-  const res = await fetch("/api/submissions/me");
+// Submissions are fetched a page at a time (newest first)
+let mySubmissionsLoaded = 0;
+let mySubmissionsCursor = null;
+
+async function loadMySubmissions(more = false) {
+  if (!more) {
+    mySubmissionsEl.innerHTML = "<li>Loading...</li>";
+    mySubmissionsLoaded = 0;
+    mySubmissionsCursor = null;
+  }
+  const url = more && mySubmissionsCursor ? `/api/submissions/me?cursor=${mySubmissionsCursor}` : "/api/submissions/me";
+  const res = await fetch(url);
   if (!res.ok) {
     mySubmissionsEl.innerHTML = "<li>Failed to load submissions</li>";
     return;
   }
   const data = await res.json();
 
-  if (!data.submissions.length) {
+  if (!more && !data.submissions.length) {
     mySubmissionsEl.innerHTML = "<li>No submissions yet.</li>";
     submissionCountEl.textContent = "(0)";
     return;
 }
 
 
-  mySubmissionsEl.innerHTML = "";
-  submissionCountEl.textContent = `(${data.submissions.length})`;
+  if (!more) mySubmissionsEl.innerHTML = "";
+  mySubmissionsEl.querySelector(".load-more")?.remove();
+  mySubmissionsLoaded += data.submissions.length;
+  mySubmissionsCursor = data.next_cursor;
+  submissionCountEl.textContent = mySubmissionsCursor ? `(${mySubmissionsLoaded}+)` : `(${mySubmissionsLoaded})`;
   data.submissions.forEach(s => {
     const li = document.createElement("li");
     li.innerHTML = `<a href="#" data-id="${s.id}">#${s.id}</a> — ${escapeHtml(s.rubric_title)} <span class="text-muted text-small">(${escapeHtml(s.created_at)})</span>`;
+
+    // Click handler for viewing feedback
+    li.querySelector("a[data-id]").addEventListener("click", async (e) => {
+      e.preventDefault();
+      await loadSubmissionDetails(s.id);
+    });
     mySubmissionsEl.appendChild(li);
   });
 
-  // Click handler for viewing feedback
-  mySubmissionsEl.querySelectorAll("a[data-id]").forEach(a => {
-    a.addEventListener("click", async (e) => {
+  if (mySubmissionsCursor) {
+    const li = document.createElement("li");
+    li.className = "load-more";
+    li.innerHTML = `<a href="#">Load older submissions</a>`;
+    li.querySelector("a").addEventListener("click", async (e) => {
       e.preventDefault();
-      const id = a.getAttribute("data-id");
-      await loadSubmissionDetails(id);
+      await loadMySubmissions(true);
     });
-  });
+    mySubmissionsEl.appendChild(li);
+  }
 }
 
 function renderFeedback(details) {
@@ -159,6 +179,14 @@ async function submitWork() {
     await loadMySubmissions();
     mySubmissionsEl.classList.remove("hidden");
     mySubmissionsToggle.firstChild.textContent = "▼ My submissions ";
+
+    // feedback is generated in the background, wait for the job before showing it
+    feedbackPanel.innerHTML = "<p>Generating feedback...</p>";
+    const job = await waitForFeedbackJob(data.job_id);
+    if (job && job.status === "dead") {
+      feedbackPanel.innerHTML = "<p>Feedback could not be generated. Please try again later.</p>";
+      return;
+    }
     await loadSubmissionDetails(data.submission_id);
   } catch (e) {
     messageEl.textContent = e.message || "Submission failed.";
@@ -168,6 +196,50 @@ async function submitWork() {
 }
 
 
+// Resolves with the finished job (status "done" or "dead"), using server-sent events
+// and falling back to polling if the stream is unavailable
+function waitForFeedbackJob(jobId) {
+  if (!jobId) return Promise.resolve(null);
+
+  return new Promise(resolve => {
+    let finished = false;
+    const finish = job => {
+      if (finished) return;
+      finished = true;
+      resolve(job);
+    };
+
+    const poll = async () => {
+      while (!finished) {
+        const res = await fetch(`/api/jobs/${jobId}`);
+        if (!res.ok) return finish(null);
+        const job = await res.json();
+        if (job.status === "done" || job.status === "dead") return finish(job);
+        await new Promise(r => setTimeout(r, 1000));
+      }
+    };
+
+    if (!window.EventSource) {
+      poll();
+      return;
+    }
+
+    const es = new EventSource(`/api/jobs/${jobId}/events`);
+    es.addEventListener("status", e => {
+      const job = JSON.parse(e.data);
+      if (job.status === "done" || job.status === "dead") {
+        es.close();
+        finish(job);
+      }
+    });
+    es.onerror = () => {
+      es.close();
+      poll();
+    };
+  });
+}
+
+
 async function uploadSubmissionFiles() {
   if (!submissionFiles || !submissionFiles.files || submissionFiles.files.length === 0) return [];
 
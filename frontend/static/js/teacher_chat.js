@@ -22,9 +22,17 @@ function escapeHtml(str) {
 function appendChat(who, text) {
   const div = document.createElement("div");
   div.className = "chat-msg";
-  div.innerHTML = `<span class="${who === "You" ? "chat-user" : "chat-bot"}">${escapeHtml(who)}:</span> ${escapeHtml(text).replaceAll("\n", "<br/>")}`;
+  div.innerHTML = `<span class="${who === "You" ? "chat-user" : "chat-bot"}">${escapeHtml(who)}:</span> <span class="chat-text">${escapeHtml(text).replaceAll("\n", "<br/>")}</span>`;
   teacherChatLog.appendChild(div);
   teacherChatLog.scrollTop = teacherChatLog.scrollHeight;
+  return div;
+}
+
+// Adds streamed text to a message created by appendChat
+function appendChatText(msgEl, text) {
+  const textEl = msgEl.querySelector(".chat-text");
+  textEl.innerHTML += escapeHtml(text).replaceAll("\n", "<br/>");
+  teacherChatLog.scrollTop = teacherChatLog.scrollHeight;
 }
 
 /**
@@ -70,17 +78,54 @@ async function uploadFiles(fileInputEl, statusEl) {
   return data.files || [];
 }
 
-async function sendTeacherChat(message, fileIds = []) {
+/**
+ * Sends a teacher chat message and streams the reply.
+ * Expects backend:
+ *   POST /api/chat with { stream: true } -> text/event-stream of "token" events, then "done"
+ */
+async function sendTeacherChat(message, fileIds = [], onToken = () => {}) {
   const res = await fetch("/api/chat", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     credentials: "same-origin",
-    body: JSON.stringify({ mode: "teacher", message, attatchment_ids: fileIds })
+    body: JSON.stringify({ mode: "teacher", message, attatchment_ids: fileIds, stream: true })
   });
 
-  const data = await res.json().catch(() => ({}));
-  if (!res.ok) throw new Error(data.detail || `Request failed (${res.status})`);
-  return data.reply;
+  if (!res.ok) {
+    const data = await res.json().catch(() => ({}));
+    throw new Error(data.detail || `Request failed (${res.status})`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let reply = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach(line => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+
+      if (event === "token") {
+        const token = JSON.parse(data);
+        reply += token;
+        onToken(token);
+      }
+    }
+  }
+  return reply;
 }
 
 if (!teacherChatLog || !teacherChatInput || !teacherChatSendBtn || !teacherChatMsg) {
@@ -104,9 +149,9 @@ if (!teacherChatLog || !teacherChatInput || !teacherChatSendBtn || !teacherChatM
       const uploaded = await uploadFiles(teacherChatFiles, teacherChatFilesMsg);
       const fileIds = uploaded.map(f => f.id);
 
-      // send chat request with file ids
-      const reply = await sendTeacherChat(msg, fileIds);
-      appendChat("Copilot", reply);
+      // send chat request with file ids, rendering the reply as it streams in
+      const replyEl = appendChat("Copilot", "");
+      await sendTeacherChat(msg, fileIds, token => appendChatText(replyEl, token));
     } catch (err) {
       console.error(err);
       teacherChatMsg.textContent = err.message || "Chat failed";
@@ -8,6 +8,10 @@ const reviewMsg = document.getElementById("reviewMsg");
 // Track which submission is currently open
 let selectedSubmissionId = null;
 
+// Submissions are fetched a page at a time (newest first)
+let loadedSubmissions = [];
+let nextCursor = null;
+
 function escapeHtml(str) {
   return (str || "")
     .toString()
@@ -20,15 +24,27 @@ function escapeHtml(str) {
 
 async function loadAllSubmissions() {
   allSubmissionsEl.innerHTML = "<li>Loading...</li>";
-  const res = await fetch("/api/teacher/submissions");
+  loadedSubmissions = [];
+  nextCursor = null;
+  await loadMoreSubmissions();
+}
+
+async function loadMoreSubmissions() {
+  const url = nextCursor ? `/api/teacher/submissions?cursor=${nextCursor}` : "/api/teacher/submissions";
+  const res = await fetch(url);
   if (!res.ok) {
     allSubmissionsEl.innerHTML = "<li>Failed to load submissions</li>";
     return;
   }
 
   const data = await res.json();
+  loadedSubmissions = loadedSubmissions.concat(data.submissions);
+  nextCursor = data.next_cursor;
+  renderSubmissionList();
+}
 
-  if (!data.submissions.length) {
+function renderSubmissionList() {
+  if (!loadedSubmissions.length) {
     allSubmissionsEl.innerHTML = "<li>No submissions yet.</li>";
     return;
   }
@@ -37,7 +53,7 @@ async function loadAllSubmissions() {
 
 // grouping submissions by student email
 const grouped = {};
-data.submissions.forEach(s => {
+loadedSubmissions.forEach(s => {
   if (!grouped[s.user_email]) grouped[s.user_email] = [];
   grouped[s.user_email].push(s);
 });
@@ -88,6 +104,18 @@ Object.entries(grouped).forEach(([email, submissions]) => {
   allSubmissionsEl.appendChild(groupDiv);
 });
 
+if (nextCursor) {
+  const moreBtn = document.createElement("button");
+  moreBtn.type = "button";
+  moreBtn.className = "mt-12";
+  moreBtn.textContent = "Load older submissions";
+  moreBtn.addEventListener("click", async () => {
+    moreBtn.disabled = true;
+    await loadMoreSubmissions();
+  });
+  allSubmissionsEl.appendChild(moreBtn);
+}
+
 }
 
 function renderSubmission(details) {